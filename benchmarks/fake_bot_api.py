@@ -0,0 +1,194 @@
+"""In-memory stand-in for the Telegram Bot API and its file server.
+
+Implements the methods TG Storage uses (getMe, sendDocument, sendVideo,
+getFile, deleteMessage, deleteMessages) plus Range downloads, with injectable
+per-call latency, per-stream bandwidth and 429 responses. Point the service at
+it with TELEGRAM_API_BASE_URL=http://HOST:PORT/bot and
+TELEGRAM_FILE_BASE_URL=http://HOST:PORT/file/bot.
+
+    python benchmarks/fake_bot_api.py --port 9100 --latency 0.05 --bandwidth 20000000
+"""
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+import argparse
+import asyncio
+import itertools
+import random
+import re
+import secrets
+import time
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+class FakeBotAPI:
+    def __init__(self, latency=0.0, bandwidth=0, rate_limit=0.0, retry_after=1, seed=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.files = {}
+        self.message_ids = itertools.count(1)
+        self.calls = {}
+        self.rate_limited = 0
+        self.bytes_received = 0
+        self.bytes_served = 0
+        self.active_downloads = 0
+        self.peak_downloads = 0
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "rate_limited": self.rate_limited,
+            "files": len(self.files),
+            "bytes_received": self.bytes_received,
+            "bytes_served": self.bytes_served,
+            "peak_downloads": self.peak_downloads,
+        }
+
+    @staticmethod
+    def ok(result):
+        return JSONResponse({"ok": True, "result": result})
+
+    @staticmethod
+    def error(code, description, **parameters):
+        body = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return JSONResponse(body, status_code=code)
+
+    async def params(self, request):
+        content_type = request.headers.get("content-type", "")
+        if content_type.startswith("application/json"):
+            return await request.json()
+        if content_type.startswith(("multipart/", "application/x-www-form-urlencoded")):
+            return await request.form()
+        return dict(request.query_params)
+
+    def store(self, upload):
+        file_id = "F" + secrets.token_hex(12)
+        return file_id, {"file_id": file_id, "file_unique_id": file_id[:16], "file_name": upload.filename}
+
+    async def method(self, request):
+        name = request.path_params["method"]
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if name != "getMe" and self.rate_limit and self.random.random() < self.rate_limit:
+            self.rate_limited += 1
+            return self.error(429, f"Too Many Requests: retry after {self.retry_after}", retry_after=self.retry_after)
+        params = await self.params(request)
+
+        if name == "getMe":
+            token_id = int(request.path_params["token"].split(":")[0] or 0)
+            return self.ok({"id": token_id, "is_bot": True, "first_name": "fake", "username": f"fake_{token_id}_bot"})
+
+        if name in ("sendDocument", "sendVideo"):
+            upload = params.get("document") or params.get("video")
+            if upload is None or isinstance(upload, str):
+                return self.error(400, "Bad Request: there is no document in the request")
+            data = await upload.read()
+            self.bytes_received += len(data)
+            file_id, media = self.store(upload)
+            media["file_size"] = len(data)
+            self.files[file_id] = data
+            message = {
+                "message_id": next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id")), "type": "channel"},
+            }
+            if name == "sendVideo":
+                message["video"] = dict(media, width=1, height=1, duration=1)
+            else:
+                message["document"] = media
+            return self.ok(message)
+
+        if name == "getFile":
+            file_id = params.get("file_id")
+            if file_id not in self.files:
+                return self.error(400, "Bad Request: invalid file_id")
+            return self.ok({
+                "file_id": file_id,
+                "file_unique_id": file_id[:16],
+                "file_size": len(self.files[file_id]),
+                "file_path": f"documents/{file_id}",
+            })
+
+        if name in ("deleteMessage", "deleteMessages"):
+            return self.ok(True)
+
+        return self.error(404, "Not Found: method not found")
+
+    async def download(self, request):
+        file_id = request.path_params["path"].rsplit("/", 1)[-1]
+        data = self.files.get(file_id)
+        if data is None:
+            return self.error(404, "Not Found")
+        size = len(data)
+        start, end, status, headers = 0, size - 1, 200, {"Accept-Ranges": "bytes"}
+        range_header = request.headers.get("range")
+        if range_header:
+            match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+            if not match or match.groups() == ("", ""):
+                return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start >= size or start > end:
+                return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(self.stream(data, start, end), status_code=status, headers=headers)
+
+    async def stream(self, data, start, end):
+        self.active_downloads += 1
+        self.peak_downloads = max(self.peak_downloads, self.active_downloads)
+        began = time.monotonic()
+        sent = 0
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            for position in range(start, end + 1, STREAM_CHUNK_SIZE):
+                chunk = data[position:min(position + STREAM_CHUNK_SIZE, end + 1)]
+                yield chunk
+                sent += len(chunk)
+                self.bytes_served += len(chunk)
+                if self.bandwidth:
+                    # Pace the stream so it never runs ahead of the configured rate
+                    ahead = sent / self.bandwidth - (time.monotonic() - began)
+                    if ahead > 0:
+                        await asyncio.sleep(ahead)
+        finally:
+            self.active_downloads -= 1
+
+    async def get_stats(self, request):
+        return JSONResponse(self.stats())
+
+    def app(self):
+        return Starlette(routes=[
+            Route("/bot{token}/{method}", self.method, methods=["GET", "POST"]),
+            Route("/file/bot{token}/{path:path}", self.download),
+            Route("/_stats", self.get_stats),
+        ])
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every method call and download")
+    parser.add_argument("--bandwidth", type=float, default=0, help="bytes/s per download stream (0 = unlimited)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    fake = FakeBotAPI(args.latency, args.bandwidth, args.rate_limit, args.retry_after, args.seed)
+    uvicorn.run(fake.app(), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""Benchmark the storage API end to end against the fake Bot API.
+
+Starts benchmarks/fake_bot_api.py and the API from this checkout (src/) as
+subprocesses in a scratch directory, seeds the files table to a realistic size
+and measures uploads, downloads, Range seeks, /files listing and /stats over
+real HTTP. Results are printed and can be saved as JSON, stamped with the
+commit they were measured on, to compare two runs:
+
+    python benchmarks/run.py --output before.json
+    git checkout my-branch
+    python benchmarks/run.py --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_KEY = "bench-admin-key"
+CHANNEL_ID = -1000000000001
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+def summarize(samples, scale=1000.0):
+    """p50/p95/max of durations in seconds, reported in milliseconds."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"n": 0}
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * scale, 2)
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "max_ms": round(ordered[-1] * scale, 2), "n": len(ordered)}
+
+async def wait_ready(url, timeout=30.0, headers=None):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url, headers=headers)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+async def seed_files(rows, owners, seed):
+    """Insert ``rows`` synthetic files through the service's own write path."""
+    sys.path.insert(0, os.path.join(ROOT, "src"))
+    from tgstorage import database
+
+    rng = random.Random(seed)
+    mimes = ["application/pdf", "image/jpeg", "video/mp4", "text/plain", "application/zip"]
+    await database.init_db()
+    now = datetime.datetime.now()
+    for start in range(0, rows, 5000):
+        batch = []
+        for i in range(start, min(rows, start + 5000)):
+            expires = None
+            if i % 10 == 0:
+                expires = (now + datetime.timedelta(days=rng.randint(1, 30))).isoformat()
+            batch.append({
+                "file_id": f"seed_{i:08d}",
+                "message_id": i + 1,
+                "file_name": f"document_{rng.randint(0, 10 ** 6)}_{i}.{rng.choice(['pdf', 'jpg', 'mp4', 'txt', 'zip'])}",
+                "file_size": rng.randint(1024, 50 * 1024 * 1024),
+                "mime_type": rng.choice(mimes),
+                "expiration_date": expires,
+                "share_token": f"seedshare{i:08d}",
+                "password": None,
+                "owner_key": ADMIN_KEY if i % owners == 0 else f"owner-{i % owners}",
+            })
+        await database.add_files(batch)
+    await database.close_db()
+
+class Bench:
+    def __init__(self, args, workdir):
+        self.args = args
+        self.workdir = workdir
+        self.processes = []
+        self.rng = random.Random(args.seed)
+        self.fake_url = None
+        self.api_url = None
+
+    def spawn(self, command, env=None):
+        # Server logs go to the scratch directory (see --keep), not into the report
+        log = open(os.path.join(self.workdir, "server.log"), "ab")
+        process = subprocess.Popen(command, cwd=self.workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        log.close()
+        self.processes.append(process)
+        return process
+
+    async def start(self):
+        args = self.args
+        fake_port, api_port = free_port(), free_port()
+        self.fake_url = f"http://127.0.0.1:{fake_port}"
+        self.api_url = f"http://127.0.0.1:{api_port}"
+        self.spawn([
+            sys.executable, os.path.join(ROOT, "benchmarks", "fake_bot_api.py"), "--port", str(fake_port),
+            "--latency", str(args.latency), "--bandwidth", str(args.bandwidth),
+            "--rate-limit", str(args.rate_limit), "--seed", str(args.seed),
+        ])
+        with open(os.path.join(self.workdir, "tokens.txt"), "w") as f:
+            f.writelines(f"{1000 + i}:bench-token-{i}\n" for i in range(args.bots))
+
+        env = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join(filter(None, [os.path.join(ROOT, "src"), os.environ.get("PYTHONPATH")])),
+            DATABASE_URL=os.path.join(self.workdir, "storage.db"),
+            ADMIN_API_KEY=ADMIN_KEY,
+            CHANNEL_ID=str(CHANNEL_ID),
+            CHANNEL_IDS=",".join(str(CHANNEL_ID - i) for i in range(args.channels)),
+            TELEGRAM_API_BASE_URL=f"{self.fake_url}/bot",
+            TELEGRAM_FILE_BASE_URL=f"{self.fake_url}/file/bot",
+            UPLOAD_STAGING_DIR=os.path.join(self.workdir, "upload_staging"),
+            WORKERS=str(args.workers),
+        )
+        # Seed before the API opens the database so the schema and counters match a live install
+        os.environ.update({k: env[k] for k in ("DATABASE_URL", "ADMIN_API_KEY", "CHANNEL_ID")})
+        started = time.perf_counter()
+        await seed_files(args.rows, args.owners, args.seed)
+        self.seed_seconds = round(time.perf_counter() - started, 2)
+
+        self.spawn([
+            sys.executable, "-m", "uvicorn", "tgstorage.api:api", "--host", "127.0.0.1", "--port", str(api_port),
+            "--workers", str(args.workers), "--log-level", "warning",
+        ], env=env)
+        await wait_ready(f"{self.fake_url}/_stats")
+        await wait_ready(f"{self.api_url}/stats", headers={"X-API-Key": ADMIN_KEY}, timeout=60)
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    async def upload(self, client, name, data):
+        response = await client.post("/upload", files={"file": (name, data, "application/octet-stream")})
+        response.raise_for_status()
+        return response.json()["file_id"]
+
+    async def upload_fixture(self, client, name, data, attempts=10):
+        # Setup, not measurement: keep trying through injected 429s
+        for attempt in range(attempts):
+            try:
+                return await self.upload(client, name, data)
+            except httpx.HTTPStatusError:
+                if attempt == attempts - 1:
+                    raise
+                await asyncio.sleep(1)
+
+    async def bench_upload(self, client):
+        args = self.args
+        semaphore = asyncio.Semaphore(args.concurrency)
+        # Distinct bodies, so deduplication does not turn uploads into metadata writes
+        bodies = [self.rng.randbytes(args.upload_size) for _ in range(args.uploads)]
+        latencies = []
+        errors = 0
+
+        async def one(i, body):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await self.upload(client, f"upload_{i}.bin", body)
+                except httpx.HTTPStatusError:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i, body) for i, body in enumerate(bodies)))
+        elapsed = time.perf_counter() - started
+        return dict(
+            summarize(latencies),
+            errors=errors,
+            files_per_s=round(len(latencies) / elapsed, 2),
+            mb_per_s=round(len(latencies) * args.upload_size / elapsed / 1e6, 2),
+        )
+
+    async def timed_get(self, client, url, headers=None):
+        """Returns (time to first byte, total time, bytes) for one GET, or None if it failed."""
+        started = time.perf_counter()
+        ttfb = None
+        size = 0
+        async with client.stream("GET", url, headers=headers) as response:
+            if response.is_error:
+                return None
+            async for chunk in response.aiter_bytes():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                size += len(chunk)
+        return ttfb or 0.0, time.perf_counter() - started, size
+
+    async def bench_download(self, client, file_id):
+        url = f"/dl/{file_id}/large.bin"
+        # The first read resolves the Telegram file paths; later ones hit the path cache
+        results = {}
+        cold = await self.timed_get(client, url)
+        if cold:
+            cold_ttfb, cold_total, size = cold
+            results["cold_ttfb_ms"] = round(cold_ttfb * 1000, 2)
+            results["cold_mb_per_s"] = round(size / cold_total / 1e6, 2)
+        ttfbs, rates = [], []
+        for _ in range(self.args.repeat_downloads):
+            timing = await self.timed_get(client, url)
+            if timing:
+                ttfb, total, size = timing
+                ttfbs.append(ttfb)
+                rates.append(size / total / 1e6)
+        results["ttfb"] = summarize(ttfbs)
+        if rates:
+            results["mb_per_s"] = round(statistics.median(rates), 2)
+        results["errors"] = (cold is None) + self.args.repeat_downloads - len(ttfbs)
+        return results
+
+    async def bench_seek(self, client, file_id):
+        args = self.args
+        ttfbs, totals = [], []
+        for _ in range(args.seeks):
+            start = self.rng.randrange(0, args.download_size - args.seek_size)
+            timing = await self.timed_get(
+                client, f"/dl/{file_id}/large.bin", {"Range": f"bytes={start}-{start + args.seek_size - 1}"}
+            )
+            if timing is None:
+                continue
+            ttfb, total, size = timing
+            if size != args.seek_size:
+                raise RuntimeError(f"Range returned {size} bytes, expected {args.seek_size}")
+            ttfbs.append(ttfb)
+            totals.append(total)
+        return {"ttfb": summarize(ttfbs), "total": summarize(totals), "errors": args.seeks - len(ttfbs)}
+
+    async def repeat(self, client, url, count, params=None):
+        latencies = []
+        response = None
+        for _ in range(count):
+            started = time.perf_counter()
+            response = await client.get(url, params=params)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+        return summarize(latencies), response
+
+    async def bench_listing(self, client):
+        count = self.args.repeat_queries
+        results = {}
+        results["first_page"], response = await self.repeat(client, "/files", count, {"limit": 50})
+        results["deep_offset"], _ = await self.repeat(client, "/files", count, {"limit": 50, "offset": self.args.rows // 2})
+        results["search"], _ = await self.repeat(client, "/files", count, {"limit": 50, "search": "document_12"})
+
+        # Walk pages by cursor, as a client scrolling through the list would
+        latencies = []
+        cursor = response.headers.get("X-Next-Cursor")
+        for _ in range(count):
+            if not cursor:
+                break
+            started = time.perf_counter()
+            page = await client.get("/files", params={"limit": 50, "cursor": cursor})
+            page.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+            cursor = page.headers.get("X-Next-Cursor")
+        if latencies:
+            results["cursor_page"] = summarize(latencies)
+        return results
+
+    async def bench_stats(self, client):
+        summary, _ = await self.repeat(client, "/stats", self.args.repeat_queries)
+        return summary
+
+    async def run(self):
+        args = self.args
+        results = {}
+        timeout = httpx.Timeout(600.0)
+        async with httpx.AsyncClient(base_url=self.api_url, headers={"X-API-Key": ADMIN_KEY}, timeout=timeout) as client:
+            results["upload"] = await self.bench_upload(client)
+            large = await self.upload_fixture(client, "large.bin", self.rng.randbytes(args.download_size))
+            results["download"] = await self.bench_download(client, large)
+            results["range_seek"] = await self.bench_seek(client, large)
+            results["files_listing"] = await self.bench_listing(client)
+            results["stats"] = await self.bench_stats(client)
+        async with httpx.AsyncClient() as client:
+            results["fake_bot_api"] = (await client.get(f"{self.fake_url}/_stats")).json()
+        return results
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def print_report(report, baseline=None):
+    current = flatten(report["results"])
+    previous = flatten(baseline["results"]) if baseline else {}
+    meta = report["meta"]
+    print(f"\ncommit {meta['commit'] or 'unknown'}{' (dirty)' if meta['dirty'] else ''}, {meta['rows']} seeded rows")
+    if baseline:
+        print(f"baseline {baseline['meta']['commit'] or 'unknown'}{' (dirty)' if baseline['meta']['dirty'] else ''}")
+    width = max(len(name) for name in current)
+    for name, value in current.items():
+        line = f"  {name:<{width}}  {value:>12}"
+        old = previous.get(name)
+        if old not in (None, 0):
+            line += f"  {old:>12}  {(value - old) / old * 100:+7.1f}%"
+        print(line)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="TG Storage benchmark suite")
+    parser.add_argument("--rows", type=int, default=100_000, help="files seeded into the table before measuring")
+    parser.add_argument("--owners", type=int, default=50)
+    parser.add_argument("--bots", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--channels", type=int, default=1, help="storage channels uploads are spread over")
+    parser.add_argument("--uploads", type=int, default=40)
+    parser.add_argument("--upload-size", type=int, default=1024 * 1024)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--download-size", type=int, default=48 * 1024 * 1024)
+    parser.add_argument("--repeat-downloads", type=int, default=5)
+    parser.add_argument("--seeks", type=int, default=30)
+    parser.add_argument("--seek-size", type=int, default=256 * 1024)
+    parser.add_argument("--repeat-queries", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake Bot API latency per call, seconds")
+    parser.add_argument("--bandwidth", type=float, default=20e6, help="fake Bot API bytes/s per download stream")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of Bot API calls answered with 429")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--quick", action="store_true", help="small sizes for a fast smoke run")
+    parser.add_argument("--output", help="write the report as JSON to this path")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.rows, args.uploads, args.download_size = min(args.rows, 5000), min(args.uploads, 10), 8 * 1024 * 1024
+        args.repeat_downloads, args.seeks, args.repeat_queries = 2, 10, 10
+    return args
+
+async def main(argv=None):
+    args = parse_args(argv)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    workdir = tempfile.mkdtemp(prefix="tgstorage-bench-")
+    bench = Bench(args, workdir)
+    try:
+        await bench.start()
+        results = await bench.run()
+    finally:
+        bench.stop()
+        if args.keep:
+            print(f"Scratch directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    settings = {k: v for k, v in vars(args).items() if k not in ("output", "compare", "keep")}
+    report = {
+        "meta": dict(
+            git_revision(),
+            date=datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            rows=args.rows,
+            seed_seconds=bench.seed_seconds,
+            settings=settings,
+        ),
+        "results": results,
+    }
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
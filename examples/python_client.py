@@ -34,6 +34,37 @@ async def upload_file(file_path):
             except Exception as e:
                 print(f"✗ Request Error: {e}")
 
+async def upload_files(file_paths):
+    # One request for many files; the server sends them across all bots concurrently
+    async with httpx.AsyncClient(timeout=600) as client:
+        handles = [open(path, 'rb') for path in file_paths]
+        try:
+            files = [('files', (os.path.basename(path), handle)) for path, handle in zip(file_paths, handles)]
+            response = await client.post(f"{API_BASE}/upload/batch", files=files, headers={'X-API-Key': API_KEY})
+        finally:
+            for handle in handles:
+                handle.close()
+        if response.status_code != 200:
+            print(f"✗ Batch Upload Failed: {response.status_code}")
+            print(response.text)
+            return None
+        data = response.json()
+        for result in data['results']:
+            if result['status'] == 'success':
+                print(f"✓ {result['file_id']} -> {result['direct_link']}")
+            else:
+                print(f"✗ {result['file_name']}: {result['detail']}")
+        return data
+
+async def delete_files(file_ids):
+    async with httpx.AsyncClient() as client:
+        response = await client.post(
+            f"{API_BASE}/files/delete", json={"file_ids": file_ids}, headers={'X-API-Key': API_KEY}
+        )
+        data = response.json()
+        print(f"Deleted {len(data.get('deleted', []))} files, {len(data.get('not_found', []))} not found")
+        return data
+
 async def list_files(search=None):
     async with httpx.AsyncClient() as client:
         headers = {'X-API-Key': API_KEY}
@@ -62,10 +93,22 @@ async def main():
     
     # 3. List again to see the new file
     await list_files()
-    
+
+    # 4. Upload several files in one request, then delete them in one request
+    paths = []
+    for i in range(3):
+        path = f"example_batch_{i}.txt"
+        with open(path, "w") as f:
+            f.write(f"Batch file {i}")
+        paths.append(path)
+    batch = await upload_files(paths)
+    if batch:
+        await delete_files([r['file_id'] for r in batch['results'] if r['status'] == 'success'])
+
     # Cleanup
-    if os.path.exists("example_file.txt"):
-        os.remove("example_file.txt")
+    for path in ["example_file.txt"] + paths:
+        if os.path.exists(path):
+            os.remove(path)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,5 +1,5 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Response, Depends, Header, Query
-from fastapi.responses import StreamingResponse, HTMLResponse
+from fastapi.responses import StreamingResponse, HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from importlib import resources
 import base64
@@ -9,20 +9,35 @@ import json
 import os
 import secrets
 import datetime
-import shutil
-import re
 import asyncio
 import logging
 import time
 from typing import List, Optional
 from .config import settings
 from .database import (
-    add_file, get_file_by_id, delete_file_db, 
-    get_file_by_share_token, increment_view_count,
-    list_files, get_stats, verify_key_db, init_db,
-    upsert_user_from_telegram, get_user_by_telegram_id, list_users, set_user_status
+    add_file, add_duplicate_file, add_files, has_stored_content, get_file_by_id, get_files_by_ids, delete_file_db, delete_files_db,
+    get_file_by_share_token, view_counter, get_upload_session, get_upload_job,
+    list_files, encode_cursor, get_stats, verify_key_db, init_db, close_db,
+    upsert_user_from_telegram, get_user_by_telegram_id, get_user_status, list_users, set_user_status,
+    api_key_cache, user_status_cache, file_cache
 )
-from .bot import cluster
+from .cache import TTLCache
+from .bot import cluster, ClusterBusy
+from .channels import placement
+from .disk_cache import disk_cache, iter_file
+from .downloads import plan_segments
+from .fanout import fanout
+from .hashing import piece_digest, combine
+from .ranges import (
+    RangeNotSatisfiable, parse_range, file_etag, file_last_modified, http_date, not_modified, if_range_matches,
+    multipart_length, iter_multipart
+)
+from .sweeper import sweeper
+from .coordination import coordinator, leader, auth_sync
+from .resumable import resumable_uploads, UploadConflict, UploadPending
+from .jobs import upload_jobs, resolve_callback, UnsafeCallback
+from .metrics import registry, timed, count_streamed, MetricsMiddleware
+from starlette.requests import ClientDisconnect
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -35,8 +50,52 @@ api.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Upload-Offset", "ETag", "Content-Range", "Accept-Ranges"],
 )
 
+class UploadSizeLimitMiddleware:
+    """Enforce MAX_FILE_SIZE while an upload body is still arriving.
+
+    Requests that declare a larger Content-Length are refused before any of
+    the body is read, and the running byte count aborts undeclared (chunked)
+    bodies as soon as they pass the limit instead of after the spool is full.
+    """
+
+    # Allowance for multipart boundaries, part headers and the small form fields
+    FORM_OVERHEAD = 64 * 1024
+
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.MAX_FILE_SIZE or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        limit = settings.MAX_FILE_SIZE + self.FORM_OVERHEAD
+        detail = f"File too large. Maximum allowed size is {settings.MAX_FILE_SIZE} bytes."
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse({"detail": detail}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+api.add_middleware(UploadSizeLimitMiddleware, paths=["/upload"])
+api.add_middleware(MetricsMiddleware)
+
 SESSION_COOKIE_NAME = "tg_session"
 SESSION_MAX_AGE_SECONDS = 60 * 60 * 24 * 7
 TELEGRAM_AUTH_MAX_AGE_SECONDS = 60 * 60 * 24
@@ -93,9 +152,26 @@ def create_session_token(payload: dict) -> str:
     signature = hmac.new(settings.ADMIN_API_KEY.encode(), payload_b64.encode(), hashlib.sha256).hexdigest()
     return f"{payload_b64}.{signature}"
 
+# Verified session payloads by token, so repeat requests skip the HMAC and JSON decode
+session_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+_INVALID_SESSION = {}
+
 def verify_session_token(token: str) -> Optional[dict]:
     if not token or "." not in token:
         return None
+    payload = session_cache.get(token)
+    if payload is None:
+        payload = _verify_session_signature(token) or _INVALID_SESSION
+        ttl = settings.AUTH_NEGATIVE_CACHE_TTL if payload is _INVALID_SESSION else None
+        session_cache.set(token, payload, ttl)
+    if payload is _INVALID_SESSION:
+        return None
+    exp = payload.get("exp")
+    if exp and int(time.time()) > int(exp):
+        return None
+    return payload
+
+def _verify_session_signature(token: str) -> Optional[dict]:
     payload_b64, signature = token.rsplit(".", 1)
     expected_signature = hmac.new(settings.ADMIN_API_KEY.encode(), payload_b64.encode(), hashlib.sha256).hexdigest()
     if not hmac.compare_digest(signature, expected_signature):
@@ -106,12 +182,12 @@ def verify_session_token(token: str) -> Optional[dict]:
         payload = json.loads(payload_bytes.decode())
     except (ValueError, json.JSONDecodeError):
         return None
-    exp = payload.get("exp")
-    if exp and int(time.time()) > int(exp):
+    if not isinstance(payload, dict):
         return None
     return payload
 
 # Flexible Authentication
+@timed("auth")
 async def verify_api_key(
     x_api_key: Optional[str] = Header(None), 
     key: Optional[str] = Query(None),
@@ -131,12 +207,12 @@ async def verify_api_key(
         logger.error("No API key provided")
         raise HTTPException(status_code=403, detail="API Key required")
         
-    if await verify_key_db(provided_key):
-        return provided_key
-        
     if provided_key == settings.ADMIN_API_KEY.strip():
         return provided_key
 
+    if await verify_key_db(provided_key):
+        return provided_key
+
     logger.error(f"Auth failed. Provided: {provided_key}")
     raise HTTPException(status_code=403, detail="Invalid API Key")
 
@@ -153,8 +229,7 @@ async def ensure_approved_user(auth: str, action: str) -> None:
         return
     telegram_id = extract_telegram_id(auth)
     if telegram_id:
-        user = await get_user_by_telegram_id(telegram_id)
-        if not user or user["status"] != "approved":
+        if await get_user_status(telegram_id) != "approved":
             raise HTTPException(status_code=403, detail=f"User not approved for {action}")
 
 async def verify_upload_access(auth: str = Depends(verify_api_key)) -> str:
@@ -242,169 +317,553 @@ async def get_dashboard():
             return handle.read()
 
 async def start_bot():
-    await init_db()
     await cluster.start_all()
+    # Once per deployment, in whichever worker holds the lease
+    leader.start("expiry-sweeper", sweeper.run_forever)
+    upload_jobs.start()
 
 @api.on_event("startup")
 async def startup():
+    # The schema has to exist before the first request; probing the bots can
+    # take a while and happens in the background
+    await init_db()
+    view_counter.start()
+    auth_sync.start()
     asyncio.create_task(start_bot())
 
+@api.on_event("shutdown")
+async def shutdown():
+    await leader.stop()
+    await auth_sync.stop()
+    await upload_jobs.stop()
+    await cluster.stop_all()
+    await view_counter.stop()
+    await coordinator.close()
+    await close_db()
+
+def read_body(handle):
+    # Uploads up to CHUNK_SIZE are read once, for both their hash and the send
+    handle.seek(0)
+    data = handle.read()
+    return data, piece_digest(data)
+
+def upload_response(file_id, filename, share_token):
+    return {
+        "status": "success",
+        "file_id": file_id,
+        "direct_link": f"{settings.BASE_URL}/dl/{file_id}/{filename}",
+        "share_link": f"{settings.BASE_URL}/share/{share_token}"
+    }
+
+async def upload_size(file):
+    file_size = file.size
+    if file_size is None:
+        file_size = await asyncio.to_thread(lambda: file.file.seek(0, os.SEEK_END))
+    if settings.MAX_FILE_SIZE and file_size > settings.MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum allowed size is {settings.MAX_FILE_SIZE} bytes.")
+    return file_size
+
+def new_file_row(file, file_size, content_hash, expiration_days, password, auth):
+    return {
+        "file_name": file.filename,
+        "file_size": file_size,
+        "mime_type": file.content_type or "application/octet-stream",
+        "expiration_date": (datetime.datetime.now() + datetime.timedelta(days=expiration_days)).isoformat() if expiration_days else None,
+        "share_token": secrets.token_urlsafe(16),
+        "password": password,
+        "owner_key": auth,
+        "content_hash": content_hash,
+    }
+
+def busy_error(e):
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+# Fields of a file row that a duplicate takes from the upload rather than from the stored copy
+DUPLICATE_FIELDS = ("content_hash", "file_name", "mime_type", "expiration_date", "share_token", "password", "owner_key")
+
+async def link_duplicate(row, filename):
+    """With dedup on, store ``row`` as a link to content already stored with
+    its hash. Returns the upload response, or None if the content is new."""
+    if not settings.DEDUP_UPLOADS:
+        return None
+    file_id = f"ref_{secrets.token_urlsafe(16)}"
+    if not await add_duplicate_file(file_id, **{k: row[k] for k in DUPLICATE_FIELDS}):
+        return None
+    logger.info(f"{filename} is already stored, linked as {file_id}")
+    return upload_response(file_id, filename, row["share_token"])
+
+def part_messages(channel_id, parts):
+    return {channel_id: [part["message_id"] for part in parts]}
+
 @api.post("/upload")
 async def upload(
     file: UploadFile = File(...), 
     expiration_days: int = Form(None),
     password: str = Form(None),
+    run_async: bool = Form(False, alias="async"),
+    callback_url: str = Form(None),
     auth: str = Depends(verify_upload_access)
 ):
-    bot = await cluster.get_healthy_bot()
-    if not bot:
-        raise HTTPException(status_code=503, detail="No healthy bots available")
-
-    temp_path = f"temp_{secrets.token_hex(4)}_{file.filename}"
+    if callback_url:
+        try:
+            await resolve_callback(callback_url)
+        except UnsafeCallback as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
-        def save_file():
-            with open(temp_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            return os.path.getsize(temp_path)
+        file_size = await upload_size(file)
+        body = content_hash = None
+        if run_async:
+            # Answered once the body is staged, which also hashes it; a worker sends it to Telegram
+            job_id, content_hash = await upload_jobs.stage(file.file)
+            row = new_file_row(file, file_size, content_hash, expiration_days, password, auth)
+            try:
+                linked = await link_duplicate(row, file.filename)
+            except BaseException:
+                await upload_jobs.discard(job_id)
+                raise
+            if linked:
+                await upload_jobs.discard(job_id)
+                return linked
+            await upload_jobs.enqueue(job_id, dict(row, callback_url=callback_url))
+            status_url = f"{settings.BASE_URL}/upload/jobs/{job_id}"
+            return JSONResponse(status_code=202, headers={"Location": status_url}, content={
+                "status": "queued",
+                "job_id": job_id,
+                "status_url": status_url,
+                "share_link": f"{settings.BASE_URL}/share/{row['share_token']}",
+            })
+
+        if file_size <= settings.CHUNK_SIZE:
+            body, content_hash = await asyncio.to_thread(read_body, file.file)
+        row = new_file_row(file, file_size, content_hash, expiration_days, password, auth)
+        if content_hash:
+            # Same bytes are already in the channel: link to them, skip the send
+            linked = await link_duplicate(row, file.filename)
+            if linked:
+                return linked
+
+        channel_id = placement.pick(auth)
+        file_id, message_id, parts = await cluster.send_file(
+            channel_id, file.file, file_size, file.filename, file.content_type, body
+        )
+        if parts:
+            # Larger files are hashed part by part as they are sent, so a
+            # duplicate only shows now: keep the stored copy and drop this one
+            row["content_hash"] = combine(part["sha256"] for part in parts)
+            linked = await link_duplicate(row, file.filename)
+            if linked:
+                await cluster.delete_stored_messages(part_messages(channel_id, parts))
+                return linked
+        await add_file(file_id, message_id, parts=parts, channel_id=channel_id, **row)
+        return upload_response(file_id, file.filename, row["share_token"])
+    except HTTPException:
+        raise
+    except ClusterBusy as e:
+        raise busy_error(e)
+    except Exception as e:
+        logger.error(f"Upload failure: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        file_size = await asyncio.to_thread(save_file)
-        
-        # Check file size limit (50 MB = 52428800 bytes)
-        MAX_FILE_SIZE = 52428800
-        if file_size > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=413, 
-                detail=f"File too large. Maximum allowed size is 50 MB. Telegram Bot API limits file uploads to 50 MB per file."
-            )
-        logger.info(f"Uploading {file.filename} via {bot._custom_name}")
-        
-        is_video = file.content_type and "video" in file.content_type.lower()
-        
-        with open(temp_path, 'rb') as doc_file:
-            if is_video:
-                message = await asyncio.wait_for(
-                    bot.send_video(chat_id=settings.CHANNEL_ID, video=doc_file, filename=file.filename, supports_streaming=True),
-                    timeout=600
+@api.post("/upload/batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    expiration_days: int = Form(None),
+    password: str = Form(None),
+    auth: str = Depends(verify_upload_access)
+):
+    """Upload many files in one request. Sends are spread over the cluster
+    concurrently and all rows are written in one transaction; the response
+    lists a result per file, in request order."""
+    if len(files) > settings.BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Too many files. At most {settings.BATCH_MAX_FILES} per batch.")
+    results = [None] * len(files)
+    rows = [None] * len(files)
+
+    async def prepare(index, file):
+        try:
+            file_size = await upload_size(file)
+            rows[index] = new_file_row(file, file_size, None, expiration_days, password, auth)
+        except HTTPException as e:
+            results[index] = {"status": "error", "file_name": file.filename, "detail": e.detail}
+
+    await asyncio.gather(*(prepare(index, file) for index, file in enumerate(files)))
+    pending = [index for index, row in enumerate(rows) if row is not None]
+
+    # With dedup, files whose content is already stored, or comes earlier in
+    # this batch, become links; by hash, the batch file that claimed it
+    first_of, copies, failed_hashes, redundant = {}, [], set(), {}
+    semaphore = asyncio.Semaphore(settings.BATCH_UPLOAD_CONCURRENCY or max(1, len(cluster.bots)))
+
+    async def known(index):
+        content_hash = rows[index]["content_hash"]
+        if content_hash in first_of:
+            return True
+        first_of[content_hash] = index
+        return await has_stored_content(content_hash)
+
+    async def store(index):
+        file, row = files[index], rows[index]
+        async with semaphore:
+            try:
+                body = None
+                if row["file_size"] <= settings.CHUNK_SIZE:
+                    body, row["content_hash"] = await asyncio.to_thread(read_body, file.file)
+                    if settings.DEDUP_UPLOADS and await known(index):
+                        copies.append(index)
+                        return
+                channel_id = placement.pick(auth)
+                file_id, message_id, parts = await cluster.send_file(
+                    channel_id, file.file, row["file_size"], file.filename, file.content_type, body
                 )
+            except Exception as e:
+                logger.error(f"Batch upload of {file.filename} failed: {e}")
+                results[index] = {"status": "error", "file_name": file.filename, "detail": getattr(e, "detail", str(e))}
+                if isinstance(e, ClusterBusy):
+                    results[index]["retry_after"] = e.retry_after
+                if row["content_hash"] is not None:
+                    failed_hashes.add(row["content_hash"])
+                return
+            row.update(file_id=file_id, message_id=message_id, parts=parts, channel_id=channel_id)
+        if parts:
+            # Hashed part by part as it was sent: a duplicate only shows now
+            row["content_hash"] = combine(part["sha256"] for part in parts)
+            if settings.DEDUP_UPLOADS and await known(index):
+                copies.append(index)
+                for chat_id, message_ids in part_messages(channel_id, parts).items():
+                    redundant.setdefault(chat_id, []).extend(message_ids)
+
+    try:
+        await asyncio.gather(*(store(index) for index in pending))
+        for index in copies:
+            if rows[index]["content_hash"] in failed_hashes:
+                results[index] = {"status": "error", "file_name": files[index].filename, "detail": "Upload of identical file in this batch failed"}
             else:
-                message = await asyncio.wait_for(
-                    bot.send_document(chat_id=settings.CHANNEL_ID, document=doc_file, filename=file.filename),
-                    timeout=300
-                )
-        
-        media = message.video or message.document
-        file_id = media.file_id
-        share_token = secrets.token_urlsafe(16)
-        exp_date = (datetime.datetime.now() + datetime.timedelta(days=expiration_days)).isoformat() if expiration_days else None
-        
-        await add_file(
-            file_id,
-            message.message_id,
-            file.filename,
-            file_size,
-            file.content_type or "application/octet-stream",
-            exp_date,
-            share_token,
-            password,
-            auth,
-        )
-        
-        return {
-            "status": "success", 
-            "file_id": file_id, 
-            "direct_link": f"{settings.BASE_URL}/dl/{file_id}/{file.filename}", 
-            "share_link": f"{settings.BASE_URL}/share/{share_token}"
-        }
+                rows[index]["file_id"] = f"ref_{secrets.token_urlsafe(16)}"
+        copies = [index for index in copies if results[index] is None]
+        sent = [index for index in pending if results[index] is None and index not in set(copies)]
+
+        # Originals go in first, so copies in the same transaction can link to them
+        linked = await add_files([rows[index] for index in sent], [rows[index] for index in copies])
+        for index, added in zip(copies, linked):
+            if not added:
+                results[index] = {"status": "error", "file_name": files[index].filename, "detail": "Stored copy was deleted during the upload"}
+        for index in sent + copies:
+            if results[index] is None:
+                results[index] = upload_response(rows[index]["file_id"], files[index].filename, rows[index]["share_token"])
     except Exception as e:
-        logger.error(f"Upload failure: {e}")
+        logger.error(f"Batch upload failure: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if redundant:
+        await cluster.delete_stored_messages(redundant)
+
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = {"status": "error", "file_name": files[index].filename, "detail": "File was not uploaded"}
+    succeeded = sum(1 for result in results if result["status"] == "success")
+    return {"status": "success" if succeeded == len(files) else "partial", "uploaded": succeeded, "results": results}
+
+@api.get("/upload/jobs/{job_id}")
+async def upload_job_status(job_id: str, auth: str = Depends(verify_upload_access)):
+    job = await get_upload_job(job_id)
+    if not job or (job['owner_key'] != auth and not is_admin_auth(auth)):
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return upload_jobs.describe(job)
+
+async def owned_upload_session(upload_id, auth):
+    session = await get_upload_session(upload_id)
+    if not session or (session['owner_key'] != auth and not is_admin_auth(auth)):
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+def upload_conflict_response(e):
+    return JSONResponse(
+        status_code=409, content={"detail": str(e), "offset": e.offset}, headers={"Upload-Offset": str(e.offset)}
+    )
+
+@api.post("/uploads")
+async def create_resumable_upload(request: Request, auth: str = Depends(verify_upload_access)):
+    payload = await request.json()
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Invalid upload payload")
+    file_name = payload.get("file_name")
+    file_size = payload.get("file_size")
+    expiration_days = payload.get("expiration_days")
+    if not isinstance(file_name, str) or not file_name or not isinstance(file_size, int) or file_size <= 0:
+        raise HTTPException(status_code=400, detail="file_name and a positive file_size are required")
+    if expiration_days is not None and not isinstance(expiration_days, int):
+        raise HTTPException(status_code=400, detail="expiration_days must be an integer")
+    if settings.MAX_FILE_SIZE and file_size > settings.MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum allowed size is {settings.MAX_FILE_SIZE} bytes.")
+    session = await resumable_uploads.create(
+        auth,
+        file_name,
+        file_size,
+        payload.get("mime_type") or "application/octet-stream",
+        (datetime.datetime.now() + datetime.timedelta(days=expiration_days)).isoformat() if expiration_days else None,
+        payload.get("password"),
+    )
+    status = await resumable_uploads.status(session)
+    status["upload_url"] = f"{settings.BASE_URL}/uploads/{session['upload_id']}"
+    return status
+
+@api.get("/uploads/{upload_id}")
+async def get_resumable_upload(upload_id: str, auth: str = Depends(verify_upload_access)):
+    session = await owned_upload_session(upload_id, auth)
+    status = await resumable_uploads.status(session)
+    return JSONResponse(content=status, headers={"Upload-Offset": str(status["offset"])})
+
+@api.put("/uploads/{upload_id}")
+async def put_resumable_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(...),
+    auth: str = Depends(verify_upload_access)
+):
+    """Append the request body at ``Upload-Offset``, which must equal the
+    session's current offset. A body cut short by a dropped connection still
+    counts up to the last byte received."""
+    await owned_upload_session(upload_id, auth)
+
+    async def body():
+        try:
+            async for chunk in request.stream():
+                yield chunk
+        except ClientDisconnect:
+            return
+
+    try:
+        offset = await resumable_uploads.write(upload_id, upload_offset, body())
+    except UploadConflict as e:
+        return upload_conflict_response(e)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return JSONResponse(content={"upload_id": upload_id, "offset": offset}, headers={"Upload-Offset": str(offset)})
+
+@api.post("/uploads/{upload_id}/complete")
+async def complete_resumable_upload(upload_id: str, auth: str = Depends(verify_upload_access)):
+    await owned_upload_session(upload_id, auth)
+    try:
+        row = await resumable_uploads.complete(upload_id, secrets.token_urlsafe(16))
+    except UploadConflict as e:
+        return upload_conflict_response(e)
+    except UploadPending as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "5"})
+    except ClusterBusy as e:
+        raise busy_error(e)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    except Exception as e:
+        logger.error(f"Completing upload {upload_id} failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        def cleanup():
-            if os.path.exists(temp_path):
-                try: os.remove(temp_path)
-                except: pass
-        await asyncio.to_thread(cleanup)
-
-async def stream_file_response(file_data, filename, bot, request: Request):
-    await increment_view_count(file_data['file_id'])
+    return upload_response(row["file_id"], row["file_name"], row["share_token"])
+
+@api.delete("/uploads/{upload_id}")
+async def abort_resumable_upload(upload_id: str, auth: str = Depends(verify_upload_access)):
+    await owned_upload_session(upload_id, auth)
+    await resumable_uploads.abort(upload_id)
+    return {"status": "success", "message": "Upload aborted"}
+
+def cache_control(file_data):
+    if file_data['password']:
+        # The password travels in the query string; keep shared caches out of it
+        return "private, no-cache"
+    max_age = settings.DOWNLOAD_CACHE_MAX_AGE
+    if file_data['expiration_date']:
+        try:
+            remaining = datetime.datetime.fromisoformat(file_data['expiration_date']) - datetime.datetime.now()
+            max_age = max(0, min(max_age, int(remaining.total_seconds())))
+        except ValueError:
+            max_age = 0
+    return f"public, max-age={max_age}"
+
+async def stream_file_response(file_data, filename, request: Request):
+    """Serve a stored file for GET or HEAD. Validators, HEAD and range errors
+    are answered from the database row alone; only a body that has to be sent
+    reaches Telegram (or the disk cache) and counts as a view."""
     file_size = file_data['file_size']
     mime = file_data['mime_type']
-    
+    file_id = file_data['file_id']
+    storage_id = file_data['storage_id']
+    etag = file_etag(file_data)
+    last_modified = file_last_modified(file_data)
+
+    headers = {"Accept-Ranges": "bytes", "ETag": etag, "Cache-Control": cache_control(file_data)}
+    if last_modified:
+        headers["Last-Modified"] = http_date(last_modified)
+    if not_modified(request.headers, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    ranges = None
     range_header = request.headers.get("Range")
-    start_byte = 0
-    end_byte = file_size - 1
-    status_code = 200
-    
-    if range_header:
-        match = re.match(r"bytes=(\d+)-(\d+)?", range_header)
-        if match:
-            start_byte = int(match.group(1))
-            if match.group(2):
-                end_byte = int(match.group(2))
-            status_code = 206
-
-    content_length = end_byte - start_byte + 1
-
-    async def stream_file(url, start, end):
-        import httpx
-        proxy_url = None
-        proxy_host = getattr(settings, "PROXY_HOST", None)
-        proxy_port = getattr(settings, "PROXY_PORT", None)
-        proxy_user = getattr(settings, "PROXY_USER", None)
-        proxy_pass = getattr(settings, "PROXY_PASS", None)
-        if proxy_host and proxy_port:
-            if proxy_user and proxy_pass:
-                proxy_url = f"http://{proxy_user}:{proxy_pass}@{proxy_host}:{proxy_port}"
-            else:
-                proxy_url = f"http://{proxy_host}:{proxy_port}"
-
-        headers = {"Range": f"bytes={start}-{end}"}
-        async with httpx.AsyncClient(proxy=proxy_url) as client:
-            async with client.stream("GET", url, headers=headers) as r:
-                async for chunk in r.aiter_bytes():
-                    yield chunk
+    if_range = request.headers.get("If-Range")
+    if range_header and (if_range is None or if_range_matches(if_range, etag, last_modified)):
+        try:
+            ranges = parse_range(range_header, file_size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers=dict(headers, **{"Content-Range": f"bytes */{file_size}"}))
+
+    disposition = "inline" if any(x in mime for x in ["image", "text", "pdf", "video", "audio"]) else "attachment"
+    headers["Content-Disposition"] = f"{disposition}; filename=\"{filename}\""
+    boundary = None
+    if ranges is None:
+        status_code = 200
+        start_byte, end_byte = 0, file_size - 1
+        headers["Content-Type"] = mime
+        headers["Content-Length"] = str(file_size)
+    elif len(ranges) == 1:
+        status_code = 206
+        start_byte, end_byte = ranges[0]
+        headers["Content-Type"] = mime
+        headers["Content-Length"] = str(end_byte - start_byte + 1)
+        headers["Content-Range"] = f"bytes {start_byte}-{end_byte}/{file_size}"
+    else:
+        status_code = 206
+        start_byte, end_byte = ranges[0]
+        boundary = secrets.token_hex(16)
+        headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+        headers["Content-Length"] = str(multipart_length(ranges, boundary, mime, file_size))
+
+    if request.method == "HEAD" or file_size == 0:
+        return Response(status_code=status_code, headers=headers)
+
+    # A player seeking into the file is still the same view
+    if ranges is None or ranges[0][0] == 0:
+        view_counter.record(file_id)
+
+    cached = await disk_cache.open(storage_id, file_size)
+    if cached:
+        if boundary:
+            async def read_cached():
+                try:
+                    async for chunk in iter_multipart(
+                        ranges, boundary, mime, file_size, lambda start, end: iter_file(cached, start, end, close=False)
+                    ):
+                        yield chunk
+                finally:
+                    cached.close()
+            body = read_cached()
+        else:
+            body = iter_file(cached, start_byte, end_byte)
+        return StreamingResponse(count_streamed(body, "disk_cache"), status_code=status_code, headers=headers)
 
+    bot = await cluster.get_healthy_bot()
+    if not bot: raise HTTPException(status_code=503, detail="Bots unavailable")
+    segments = await plan_segments(file_data, start_byte, end_byte)
+    if not segments:
+        # A chunked file whose part rows are gone (interrupted delete or migration)
+        logger.error(f"No stored parts cover bytes {start_byte}-{end_byte} of {file_id} (storage {storage_id})")
+        raise HTTPException(status_code=500, detail="Stored content for this file is missing")
     try:
-        tg_file = await bot.get_file(file_data['file_id'])
-        disposition = "inline" if any(x in mime for x in ["image", "text", "pdf", "video", "audio"]) else "attachment"
-        headers = {
-            "Accept-Ranges": "bytes", 
-            "Content-Length": str(content_length), 
-            "Content-Type": mime, 
-            "Content-Disposition": f"{disposition}; filename=\"{filename}\""
-        }
-        if status_code == 206:
-            headers["Content-Range"] = f"bytes {start_byte}-{end_byte}/{file_size}"
-
-        return StreamingResponse(stream_file(tg_file.file_path, start_byte, end_byte), status_code=status_code, headers=headers)
+        # Resolved up front so an unreachable file fails before the response starts
+        await cluster.get_file_path(segments[0][0], bot)
+        # Concurrent readers of this file share upstream fetches
+        if boundary:
+            body = iter_multipart(ranges, boundary, mime, file_size, lambda start, end: fanout.stream(file_data, start, end, bot))
+        else:
+            body = fanout.stream(file_data, start_byte, end_byte, bot)
+            if start_byte == 0 and end_byte == file_size - 1:
+                # The whole file is on its way anyway: keep a copy in the disk cache
+                body = disk_cache.tee(storage_id, file_size, body)
+        return StreamingResponse(count_streamed(body, "telegram"), status_code=status_code, headers=headers)
     except Exception as e:
         logger.error(f"Streaming error: {e}")
         raise HTTPException(status_code=500, detail="Error streaming from Telegram")
 
 @api.get("/share/{token}")
+@api.head("/share/{token}")
 async def get_share_page(token: str, request: Request):
     file_data = await get_file_by_share_token(token)
     if not file_data:
         raise HTTPException(status_code=404, detail="Link expired or invalid")
-    bot = await cluster.get_healthy_bot()
-    if not bot: raise HTTPException(status_code=503, detail="Bots unavailable")
-    return await stream_file_response(file_data, file_data['file_name'], bot, request)
+    return await stream_file_response(file_data, file_data['file_name'], request)
 
 @api.get("/debug/db")
 async def debug_db(auth: str = Depends(verify_api_key)):
     files = await list_files(100, 0, auth_key=auth)
     return {"count": len(files), "files": [dict(f) for f in files]}
 
+def cache_stats():
+    return {
+        "files": file_cache.stats(),
+        "file_paths": cluster.file_paths.stats(),
+        "disk": disk_cache.stats(),
+        "api_keys": api_key_cache.stats(),
+        "user_status": user_status_cache.stats(),
+        "sessions": session_cache.stats(),
+    }
+
+def fanout_samples(name):
+    return [({}, fanout.stats()[name])]
+
+@registry.collector
+def collect_state():
+    caches = cache_stats()
+    bots = cluster.health_snapshot()
+    return [
+        ("tgstorage_cache_hits_total", "counter", "Cache lookups answered from the cache.",
+            [({"cache": name}, stats["hits"]) for name, stats in caches.items()]),
+        ("tgstorage_cache_misses_total", "counter", "Cache lookups that had to load the value.",
+            [({"cache": name}, stats["misses"]) for name, stats in caches.items()]),
+        ("tgstorage_cache_entries", "gauge", "Entries currently held per cache.",
+            [({"cache": name}, stats.get("size", stats.get("entries", 0))) for name, stats in caches.items()]),
+        ("tgstorage_bot_healthy", "gauge", "1 if the bot passed its last health probe.",
+            [({"bot": name}, int(bot["healthy"])) for name, bot in bots.items()]),
+        ("tgstorage_bot_inflight", "gauge", "Bot API requests currently running per bot.",
+            [({"bot": name}, bot["inflight"]) for name, bot in bots.items()]),
+        ("tgstorage_bot_latency_seconds", "gauge", "Smoothed getFile/probe latency per bot.",
+            [({"bot": name}, bot["latency_ms"] / 1000) for name, bot in bots.items() if bot["latency_ms"] is not None]),
+        ("tgstorage_bot_retry_after_seconds", "gauge", "Remaining 429 window per bot.",
+            [({"bot": name}, bot["retry_after"]) for name, bot in bots.items()]),
+        ("tgstorage_fanout_upstreams_total", "counter", "Telegram fetches started for client downloads.",
+            fanout_samples("upstreams")),
+        ("tgstorage_fanout_joins_total", "counter", "Client downloads that joined an in-flight fetch.",
+            fanout_samples("joins")),
+        ("tgstorage_fanout_fallbacks_total", "counter", "Readers that fell behind a shared fetch.",
+            fanout_samples("fallbacks")),
+        ("tgstorage_send_queue_waiting", "gauge", "Sends waiting for a bot to admit them.",
+            [({}, cluster.limiter.waiting)]),
+        ("tgstorage_send_rejected_total", "counter", "Sends refused with 503 by admission control.",
+            [({}, cluster.limiter.rejected)]),
+        ("tgstorage_send_retried_total", "counter", "Sends retried on another bot after a 429 or connection failure.",
+            [({}, cluster.limiter.retried)]),
+    ]
+
+@api.get("/metrics")
+async def get_metrics(auth: str = Depends(verify_admin)):
+    # Per worker: with WORKERS > 1 each scrape is answered by whichever worker accepts it
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @api.get("/stats")
-async def get_system_stats(auth: str = Depends(verify_api_key)):
-    return await get_stats()
+async def get_system_stats(include_pending: bool = False, auth: str = Depends(verify_api_key)):
+    stats = await get_stats(include_pending=include_pending, owner_key=auth, breakdown=is_admin_auth(auth))
+    stats["caches"] = cache_stats()
+    stats["bots"] = cluster.health_snapshot()
+    stats["send_limiter"] = cluster.limiter.stats()
+    stats["channels"] = placement.stats()
+    stats["upload_jobs"] = await upload_jobs.stats()
+    stats["download_fanout"] = fanout.stats()
+    stats["expiry_sweeper"] = sweeper.stats()
+    stats["coordination"] = leader.stats()
+    return stats
 
 @api.get("/files")
-async def list_all_files(limit: int = 50, offset: int = 0, search: str = None, auth: str = Depends(verify_api_key)):
-    logger.info(f"Listing files: limit={limit}, offset={offset}, search={search}")
+async def list_all_files(
+    response: Response,
+    limit: int = 50,
+    offset: int = 0,
+    search: str = None,
+    cursor: Optional[str] = None,
+    auth: str = Depends(verify_api_key)
+):
+    logger.info(f"Listing files: limit={limit}, offset={offset}, search={search}, cursor={cursor}")
     await ensure_approved_user(auth, "listing files")
-    files = await list_files(limit, offset, search, auth_key=auth)
+    try:
+        files = await list_files(limit, offset, search, auth_key=auth, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     result = [dict(f) for f in files]
+    if files and len(files) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(files[-1])
     logger.info(f"Found {len(result)} files")
     return result
 
@@ -433,19 +892,49 @@ async def block_admin_user(telegram_id: str, auth: str = Depends(verify_admin)):
 
 @api.get("/f/{file_id}/{filename}")
 @api.get("/dl/{file_id}/{filename}")
+@api.head("/f/{file_id}/{filename}")
+@api.head("/dl/{file_id}/{filename}")
 async def download_file(file_id: str, filename: str, request: Request, password: str = None):
     file_data = await get_file_by_id(file_id)
     if not file_data: raise HTTPException(status_code=404, detail="File not found")
     if file_data['password'] and file_data['password'] != password: raise HTTPException(status_code=403, detail="Password required")
-    bot = await cluster.get_healthy_bot()
-    if not bot: raise HTTPException(status_code=503, detail="Bots unavailable")
-    return await stream_file_response(file_data, filename, bot, request)
+    return await stream_file_response(file_data, filename, request)
 
 @api.delete("/file/{file_id}")
 async def delete_file_endpoint(file_id: str, auth: str = Depends(verify_api_key)):
     file_data = await get_file_by_id(file_id)
-    if not file_data: raise HTTPException(status_code=404, detail="File not found")
-    try: await cluster.delete_messages(settings.CHANNEL_ID, file_data['message_id'])
+    # Other users' files are reported as missing rather than forbidden
+    if not file_data or (file_data['owner_key'] != auth and not is_admin_auth(auth)):
+        raise HTTPException(status_code=404, detail="File not found")
+    storage_ids, messages = await delete_file_db(file_id)
+    for storage_id in storage_ids:
+        await disk_cache.invalidate(storage_id)
+    try: await cluster.delete_stored_messages(messages)
     except Exception as e: logger.error(f"Error deleting Telegram message: {e}")
-    await delete_file_db(file_id)
     return {"status": "success", "message": "File deleted"}
+
+@api.post("/files/delete")
+async def delete_files_endpoint(request: Request, auth: str = Depends(verify_api_key)):
+    payload = await request.json()
+    file_ids = payload.get("file_ids") if isinstance(payload, dict) else None
+    if not isinstance(file_ids, list) or not all(isinstance(file_id, str) for file_id in file_ids):
+        raise HTTPException(status_code=400, detail="Expected {\"file_ids\": [...]}")
+    if len(file_ids) > settings.BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Too many files. At most {settings.BATCH_MAX_FILES} per batch.")
+    found = [
+        row['file_id'] for row in await get_files_by_ids(list(dict.fromkeys(file_ids)))
+        if row['owner_key'] == auth or is_admin_auth(auth)
+    ]
+    storage_ids, messages = await delete_files_db(found)
+    for storage_id in storage_ids:
+        await disk_cache.invalidate(storage_id)
+    failed = 0
+    try: failed = await cluster.delete_stored_messages(messages)
+    except Exception as e: logger.error(f"Error deleting Telegram messages: {e}")
+    found_ids = set(found)
+    return {
+        "status": "success",
+        "deleted": found,
+        "not_found": [file_id for file_id in dict.fromkeys(file_ids) if file_id not in found_ids],
+        "message_failures": failed,
+    }
@@ -1,53 +1,419 @@
 from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
 from telegram.request import HTTPXRequest
+from contextlib import asynccontextmanager
+from importlib.util import find_spec
 from .config import settings
+from .cache import TTLCache
+from .coordination import coordinator
+from .hashing import piece_digest
+from .metrics import STAGE_SECONDS, BOT_REQUESTS, BOT_FAILURES, BOT_RATE_LIMITS, BOT_BYTES, timed
 import os
 import hashlib
 import logging
 import asyncio
+import httpx
+import math
+import secrets
+import time
 
 logger = logging.getLogger(__name__)
 
+LATENCY_EWMA_ALPHA = 0.3
+# deleteMessages accepts at most 100 message ids per call
+DELETE_BATCH_SIZE = 100
+# Adaptive send rates: a 429 halves a bucket's rate (down to RATE_FLOOR of the
+# configured rate) and every successful send wins back RATE_RECOVERY of it
+RATE_BACKOFF = 0.5
+RATE_FLOOR = 0.1
+RATE_RECOVERY = 0.05
+
+def retry_after_seconds(exc):
+    # PTB reports retry_after as int seconds or as a timedelta depending on version
+    value = exc.retry_after
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+class ClusterBusy(Exception):
+    """No bot could take a send in time; ``retry_after`` is a hint in seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """``rate`` sends per second with bursts of up to ``burst``."""
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now):
+        self._refill(now)
+        # ``updated`` lies in the future while a 429 window is still open
+        return max(0.0, self.updated - now) + max(0.0, (1 - self.tokens) / self.rate)
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def throttle(self, until):
+        self.rate = max(self.max_rate * RATE_FLOOR, self.rate * RATE_BACKOFF)
+        self.tokens = 1.0
+        self.updated = max(self.updated, until)
+
+    def recover(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_RECOVERY)
+
+class SendLimiter:
+    """Admission control for sends. Every bot has a token bucket for all of its
+    sends and one per destination chat. Callers queue per chat in FIFO order;
+    the head of a queue takes the least-loaded bot that has tokens, or sleeps
+    until the first one will. Callers past SEND_QUEUE_SIZE, or still queued
+    after SEND_QUEUE_TIMEOUT, get ClusterBusy instead of a send that would 429."""
+
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self._buckets = {}
+        self._queues = {}
+        self._chat_waiting = {}
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.retried = 0
+
+    def buckets(self, bot, chat_id):
+        # Rates are per deployment; every worker enforces its share of them
+        workers = max(1, settings.WORKERS)
+        name = bot._custom_name
+        if name not in self._buckets:
+            self._buckets[name] = TokenBucket(settings.BOT_SEND_RATE / workers, settings.BOT_SEND_RATE)
+        buckets = [self._buckets[name]]
+        if settings.UPLOAD_DELAY > 0:
+            key = (name, chat_id)
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(1 / settings.UPLOAD_DELAY / workers, settings.SEND_BURST)
+            buckets.append(self._buckets[key])
+        return buckets
+
+    def wait_time(self, bot, chat_id, now):
+        return max(bot._health.retry_until - now, *(bucket.wait_time(now) for bucket in self.buckets(bot, chat_id)))
+
+    def retry_hint(self, chat_id):
+        now = time.monotonic()
+        healthy = [bot for bot in self.cluster.bots if bot._health.healthy]
+        if not healthy:
+            return math.ceil(settings.HEALTH_CHECK_INTERVAL)
+        soonest = min(self.wait_time(bot, chat_id, now) for bot in healthy)
+        backlog = self.waiting * max(settings.UPLOAD_DELAY, 1 / settings.BOT_SEND_RATE) / len(healthy)
+        return max(1, math.ceil(soonest + backlog))
+
+    def backlog(self, chat_id, now):
+        """``(sends queued, seconds until a bot may send)`` for one chat."""
+        waits = [self.wait_time(bot, chat_id, now) for bot in self.cluster.bots if bot._health.healthy]
+        return self._chat_waiting.get(chat_id, 0), max(0.0, min(waits, default=0.0))
+
+    async def acquire(self, chat_id):
+        if not self.cluster.bots:
+            self.cluster._initialize_bots()
+        if self.waiting >= settings.SEND_QUEUE_SIZE:
+            self.rejected += 1
+            raise ClusterBusy("Send queue is full", self.retry_hint(chat_id))
+        self.waiting += 1
+        self._chat_waiting[chat_id] = self._chat_waiting.get(chat_id, 0) + 1
+        try:
+            return await asyncio.wait_for(self._admit(chat_id), timeout=settings.SEND_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ClusterBusy("Timed out waiting for a bot to send with", self.retry_hint(chat_id))
+        finally:
+            self.waiting -= 1
+            self._chat_waiting[chat_id] -= 1
+            if not self._chat_waiting[chat_id]:
+                del self._chat_waiting[chat_id]
+
+    async def _admit(self, chat_id):
+        async with self._queues.setdefault(chat_id, asyncio.Lock()):
+            while True:
+                now = time.monotonic()
+                count = len(self.cluster.bots)
+                start = self.cluster.current_idx % max(1, count)
+                best, best_key = None, None
+                for offset in range(count):
+                    bot = self.cluster.bots[(start + offset) % count]
+                    if not bot._health.healthy:
+                        continue
+                    key = (self.wait_time(bot, chat_id, now), bot._health.score())
+                    if best is None or key < best_key:
+                        best, best_key = bot, key
+                if best is None:
+                    self.rejected += 1
+                    raise ClusterBusy("No healthy bots available", math.ceil(settings.HEALTH_CHECK_INTERVAL))
+                wait = best_key[0]
+                if wait <= 0:
+                    for bucket in self.buckets(best, chat_id):
+                        bucket.take(now)
+                    self.cluster.current_idx = (self.cluster.current_idx + 1) % count
+                    self.admitted += 1
+                    return best
+                # Re-evaluated at least every second: windows and health change meanwhile
+                await asyncio.sleep(min(wait, 1.0))
+
+    def throttle(self, bot, seconds):
+        until = time.monotonic() + seconds
+        for key, bucket in self._buckets.items():
+            if key == bot._custom_name or (isinstance(key, tuple) and key[0] == bot._custom_name):
+                bucket.throttle(until)
+
+    def recover(self, bot, chat_id):
+        for bucket in self.buckets(bot, chat_id):
+            bucket.recover()
+
+    def stats(self):
+        return {
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "retried": self.retried,
+            "rates": {
+                (key if isinstance(key, str) else f"{key[0]}:{key[1]}"): round(bucket.rate, 3)
+                for key, bucket in self._buckets.items()
+            },
+        }
+
+class BotHealth:
+    """Health and load of one bot, fed by the background monitor and by the
+    outcome of real requests made through ``BotCluster.track``."""
+
+    def __init__(self):
+        self.healthy = True
+        self.latency = None
+        self.inflight = 0
+        self.consecutive_errors = 0
+        self.total_requests = 0
+        self.total_errors = 0
+        self.uploads = 0
+        self.retry_until = 0.0
+        self.last_check = None
+
+    def available(self, now):
+        return self.healthy and self.retry_until <= now
+
+    def score(self):
+        # Lower is better: fewest requests in flight, then the faster EWMA latency
+        return (self.inflight, self.latency if self.latency is not None else float("inf"))
+
+    def record_latency(self, seconds):
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_EWMA_ALPHA * (seconds - self.latency)
+
+    def record_success(self):
+        self.total_requests += 1
+        self.consecutive_errors = 0
+        self.healthy = True
+
+    def record_error(self, exc):
+        self.total_requests += 1
+        if isinstance(exc, RetryAfter):
+            self.retry_until = max(self.retry_until, time.monotonic() + retry_after_seconds(exc))
+            return
+        if isinstance(exc, BadRequest):
+            # The request was wrong, not the bot (e.g. message already deleted)
+            return
+        self.total_errors += 1
+        self.consecutive_errors += 1
+        if self.consecutive_errors >= settings.BOT_ERROR_THRESHOLD:
+            self.healthy = False
+
+    def snapshot(self, now):
+        return {
+            "healthy": self.healthy,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "inflight": self.inflight,
+            "requests": self.total_requests,
+            "errors": self.total_errors,
+            "uploads": self.uploads,
+            "retry_after": max(0.0, round(self.retry_until - now, 1)),
+        }
+
 class BotCluster:
     def __init__(self):
         self.bots = []
         self.current_idx = 0
+        self.file_paths = TTLCache(settings.FILE_PATH_CACHE_SIZE, settings.FILE_PATH_CACHE_TTL)
+        self._monitor_task = None
+        self._sync_task = None
+        self._http_client = None
+        self._segment_client = None
+        self.limiter = SendLimiter(self)
         self._initialize_bots()
 
     def _initialize_bots(self):
         self.bots = []
-        proxy_url = None
-        proxy_host = getattr(settings, "PROXY_HOST", None)
-        proxy_port = getattr(settings, "PROXY_PORT", None)
-        proxy_user = getattr(settings, "PROXY_USER", None)
-        proxy_pass = getattr(settings, "PROXY_PASS", None)
-
-        if proxy_host and proxy_port:
-            if proxy_user and proxy_pass:
-                proxy_url = f"http://{proxy_user}:{proxy_pass}@{proxy_host}:{proxy_port}"
-            else:
-                proxy_url = f"http://{proxy_host}:{proxy_port}"
-        
+        proxy_url = settings.proxy_url
         request = HTTPXRequest(proxy_url=proxy_url) if proxy_url else None
 
         for token in settings.bot_token_list:
             token_hash = hashlib.md5(token.encode()).hexdigest()[:8]
-            bot = Bot(token=token, request=request)
+            bot = Bot(
+                token=token,
+                request=request,
+                base_url=settings.TELEGRAM_API_BASE_URL,
+                base_file_url=settings.TELEGRAM_FILE_BASE_URL,
+            )
             bot._custom_name = f"bot_{token_hash}"
+            bot._health = BotHealth()
             self.bots.append(bot)
 
     async def start_all(self):
         if not self.bots:
             self._initialize_bots()
-        for bot in self.bots:
-            try:
-                me = await asyncio.wait_for(bot.get_me(), timeout=10)
+        self.get_http_client()
+        await self.check_all(log_ready=True)
+        if self._monitor_task is None or self._monitor_task.done():
+            self._monitor_task = asyncio.create_task(self._monitor())
+        if coordinator.shared and (self._sync_task is None or self._sync_task.done()):
+            self._sync_task = asyncio.create_task(self._sync_rate_limits())
+
+    async def stop_all(self):
+        for task in (self._monitor_task, self._sync_task):
+            if task:
+                task.cancel()
+                try: await task
+                except asyncio.CancelledError: pass
+        self._monitor_task = None
+        self._sync_task = None
+        for client in (self._http_client, self._segment_client):
+            if client is not None:
+                await client.aclose()
+        self._http_client = None
+        self._segment_client = None
+
+    def get_http_client(self):
+        """App-scoped client for downloads from Telegram's file servers, so
+        keep-alive connections (and HTTP/2 when h2 is installed) are reused
+        across requests instead of paying a TLS handshake per download."""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = self._new_http_client(settings.HTTP2 and find_spec("h2") is not None)
+        return self._http_client
+
+    def get_segment_client(self):
+        """HTTP/1.1 client for parallel segmented downloads: each concurrent
+        segment gets its own TCP connection instead of sharing one HTTP/2
+        connection, which is what lifts a download past one stream's throughput."""
+        if self._segment_client is None or self._segment_client.is_closed:
+            self._segment_client = self._new_http_client(False)
+        return self._segment_client
+
+    def _new_http_client(self, http2):
+        return httpx.AsyncClient(
+            http2=http2,
+            proxy=settings.proxy_url,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(settings.HTTP_READ_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+        )
+
+    async def _probe(self, bot, log_ready=False):
+        health = bot._health
+        started = time.monotonic()
+        try:
+            me = await asyncio.wait_for(bot.get_me(), timeout=settings.HEALTH_CHECK_TIMEOUT)
+        except RetryAfter as e:
+            # Alive but flood-limited: only the retry window applies
+            await self._record_error(bot, e)
+        except Exception as e:
+            health.record_error(e)
+            health.healthy = False
+            logger.error(f"Error verifying {bot._custom_name}: {e}")
+        else:
+            health.record_latency(time.monotonic() - started)
+            health.record_success()
+            if log_ready:
                 logger.info(f"Bot {bot._custom_name} (@{me.username}) is ready.")
+        health.last_check = time.time()
+
+    async def check_all(self, log_ready=False):
+        await asyncio.gather(*(self._probe(bot, log_ready) for bot in self.bots))
+
+    async def _monitor(self):
+        # Health is probed here, off the request path; get_healthy_bot only reads the result
+        while True:
+            await asyncio.sleep(settings.HEALTH_CHECK_INTERVAL)
+            try:
+                await self.check_all()
             except Exception as e:
-                logger.error(f"Error verifying {bot._custom_name}: {e}")
+                logger.error(f"Bot health monitor error: {e}")
 
-    async def stop_all(self):
-        pass
+    async def _record_error(self, bot, exc):
+        bot._health.record_error(exc)
+        if isinstance(exc, RetryAfter):
+            self.limiter.throttle(bot, retry_after_seconds(exc))
+        if isinstance(exc, RetryAfter) and coordinator.shared:
+            # Flood limits are per bot token, so every worker has to back off
+            try:
+                await coordinator.publish_retry_after(bot._custom_name, time.time() + retry_after_seconds(exc))
+            except Exception as e:
+                logger.error(f"Could not share retry window of {bot._custom_name}: {e}")
+
+    async def _sync_rate_limits(self):
+        # Adopt 429 windows other workers ran into, converted to our monotonic clock
+        while True:
+            await asyncio.sleep(settings.RATE_LIMIT_SYNC_INTERVAL)
+            try:
+                windows = await coordinator.fetch_retry_after()
+            except Exception as e:
+                logger.error(f"Rate limit sync error: {e}")
+                continue
+            wall, now = time.time(), time.monotonic()
+            for bot in self.bots:
+                until = windows.get(bot._custom_name)
+                if until and until > wall:
+                    bot._health.retry_until = max(bot._health.retry_until, now + until - wall)
+
+    @asynccontextmanager
+    async def track(self, bot, measure_latency=False, upload=False, sent_bytes=0):
+        """Count a request against ``bot`` while it runs and feed its outcome
+        (latency, errors, 429 retry windows) back into the scheduler."""
+        health = bot._health
+        health.inflight += 1
+        BOT_REQUESTS.inc(bot=bot._custom_name)
+        started = time.monotonic()
+        try:
+            yield bot
+        except Exception as e:
+            if isinstance(e, RetryAfter):
+                BOT_RATE_LIMITS.inc(bot=bot._custom_name)
+            BOT_FAILURES.inc(bot=bot._custom_name)
+            await self._record_error(bot, e)
+            raise
+        else:
+            elapsed = time.monotonic() - started
+            if measure_latency:
+                health.record_latency(elapsed)
+            if upload:
+                health.uploads += 1
+                STAGE_SECONDS.observe(elapsed, stage="upload_send")
+                BOT_BYTES.inc(sent_bytes, bot=bot._custom_name, direction="up")
+            health.record_success()
+        finally:
+            health.inflight -= 1
+
+    def health_snapshot(self):
+        now = time.monotonic()
+        return {bot._custom_name: bot._health.snapshot(now) for bot in self.bots}
 
     def get_bot(self):
         if not self.bots:
@@ -58,51 +424,208 @@ class BotCluster:
         self.current_idx = (self.current_idx + 1) % len(self.bots)
         return bot
 
-    async def delete_messages(self, chat_id, message_ids):
-        bot = self.get_bot()
-        if not bot:
-            logger.error("No bots available for deletion")
-            return
+    async def delete_messages(self, chat_id, message_ids, concurrency=None):
+        """Delete messages in batches of up to 100 (one deleteMessages call each),
+        spreading the batches over the cluster. A batch that hits a 429 moves on
+        to another bot while the limited one sits out its retry_after window.
+        Returns the number of messages that could not be deleted."""
         if not isinstance(message_ids, list):
             message_ids = [message_ids]
-        for msg_id in message_ids:
-            try:
-                await bot.delete_message(chat_id=chat_id, message_id=msg_id)
-            except Exception as e:
-                logger.error(f"Error deleting message {msg_id}: {e}")
+        batches = [message_ids[i:i + DELETE_BATCH_SIZE] for i in range(0, len(message_ids), DELETE_BATCH_SIZE)]
+        semaphore = asyncio.Semaphore(concurrency or max(1, len(self.bots)))
+
+        async def delete_batch(batch):
+            async with semaphore:
+                for _ in range(settings.DELETE_MAX_ATTEMPTS):
+                    bot = await self.wait_for_bot()
+                    if not bot:
+                        logger.error("No bots available for deletion")
+                        return len(batch)
+                    try:
+                        async with self.track(bot):
+                            if len(batch) == 1:
+                                await bot.delete_message(chat_id=chat_id, message_id=batch[0])
+                            else:
+                                await bot.delete_messages(chat_id=chat_id, message_ids=batch)
+                        return 0
+                    except RetryAfter:
+                        continue
+                    except BadRequest as e:
+                        # Already gone or too old to delete: retrying will not help
+                        logger.warning(f"Could not delete messages {batch[0]}..{batch[-1]}: {e}")
+                        return 0
+                    except Exception as e:
+                        logger.error(f"Error deleting messages {batch[0]}..{batch[-1]} via {bot._custom_name}: {e}")
+                return len(batch)
+
+        failures = await asyncio.gather(*(delete_batch(batch) for batch in batches))
+        return sum(failures)
+
+    async def delete_stored_messages(self, messages, concurrency=None):
+        """delete_messages for ``{chat_id: [message_id, ...]}``, one chat after
+        another. Returns the number of messages that could not be deleted."""
+        failed = 0
+        for chat_id, message_ids in messages.items():
+            failed += await self.delete_messages(chat_id, message_ids, concurrency=concurrency)
+        return failed
 
+    async def wait_for_bot(self, timeout=60):
+        """Like get_healthy_bot, but when every healthy bot is inside a 429
+        window, sleep until the first window closes (up to ``timeout``)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            bot = await self.get_healthy_bot()
+            if bot:
+                return bot
+            now = time.monotonic()
+            windows = [b._health.retry_until for b in self.bots if b._health.healthy and b._health.retry_until > now]
+            if not windows or now >= deadline:
+                return None
+            await asyncio.sleep(min(min(windows), deadline) - now)
+
+    @timed("get_healthy_bot")
     async def get_healthy_bot(self):
         if not self.bots:
             self._initialize_bots()
-            
-        for _ in range(len(self.bots)):
-            bot = self.get_bot()
-            if not bot: continue
-            try:
-                await asyncio.wait_for(bot.get_me(), timeout=5)
-                return bot
-            except:
-                logger.warning(f"Bot {bot._custom_name} failed health check, trying another...")
+        if not self.bots:
+            return None
+        # Answered from monitor state only: the least-loaded bot that is healthy
+        # and outside a 429 window, rotating the start to spread ties
+        now = time.monotonic()
+        count = len(self.bots)
+        start = self.current_idx % count
+        self.current_idx = (self.current_idx + 1) % count
+        best = None
+        for offset in range(count):
+            bot = self.bots[(start + offset) % count]
+            if not bot._health.available(now):
                 continue
-        return None
+            if best is None or bot._health.score() < best._health.score():
+                best = bot
+        return best
+
+    async def get_file_path(self, file_id, bot=None):
+        """Resolve a Telegram file_id to its download URL, cached until the link
+        is close to expiring. Concurrent lookups for one file share a get_file call."""
+        async def load():
+            resolver = bot or await self.get_healthy_bot()
+            if not resolver: raise Exception("No healthy bots available")
+            with STAGE_SECONDS.time(stage="get_file"):
+                async with self.track(resolver, measure_latency=True):
+                    tg_file = await resolver.get_file(file_id)
+            return tg_file.file_path
+        return await self.file_paths.get_or_load(file_id, load)
+
+    async def _send(self, chat_id, method, data, **kwargs):
+        """Send one file through the limiter. A 429 or a failed connection is
+        retried on another bot (the limited one sits out its window); when the
+        attempts run out the caller gets ClusterBusy rather than the 429."""
+        for attempt in range(1, settings.SEND_MAX_ATTEMPTS + 1):
+            bot = await self.limiter.acquire(chat_id)
+            try:
+                async with self.track(bot, upload=True, sent_bytes=len(data)):
+                    message = await getattr(bot, method)(chat_id=chat_id, **kwargs)
+            except RetryAfter as e:
+                if attempt == settings.SEND_MAX_ATTEMPTS:
+                    raise ClusterBusy("Telegram flood limits hit on every attempt", self.limiter.retry_hint(chat_id)) from e
+                logger.warning(f"{bot._custom_name} is flood-limited for {retry_after_seconds(e)}s, retrying on another bot")
+            except (NetworkError, Forbidden) as e:
+                # Bad requests fail on any bot, and a timed-out send may still have
+                # been delivered; connection failures and a bot losing channel access are retried
+                if isinstance(e, (BadRequest, TimedOut)) or attempt == settings.SEND_MAX_ATTEMPTS:
+                    raise
+                logger.warning(f"Send via {bot._custom_name} failed ({e}), retrying on another bot")
+            else:
+                self.limiter.recover(bot, chat_id)
+                return message
+            self.limiter.retried += 1
 
     async def send_video(self, chat_id, video, filename, supports_streaming=True):
-        bot = await self.get_healthy_bot()
-        if not bot: raise Exception("No healthy bots available")
-        return await bot.send_video(
-            chat_id=chat_id, 
-            video=video, 
-            caption=filename, 
+        return await self._send(
+            chat_id, "send_video", video,
+            video=video,
+            filename=filename,
+            caption=filename,
             supports_streaming=supports_streaming
         )
 
     async def send_document(self, chat_id, document, filename):
-        bot = await self.get_healthy_bot()
-        if not bot: raise Exception("No healthy bots available")
-        return await bot.send_document(
-            chat_id=chat_id, 
-            document=document, 
-            filename=filename
-        )
+        return await self._send(chat_id, "send_document", document, document=document, filename=filename)
+
+    async def send_file(self, chat_id, source, file_size, filename, mime_type, body=None):
+        """Store a file from the seekable ``source`` in ``chat_id`` and return
+        ``(file_id, message_id, parts)``. Files above CHUNK_SIZE go out as
+        parallel parts; ``body`` spares re-reading a small file already in memory."""
+        if file_size > settings.CHUNK_SIZE:
+            # Too big for a single message: split it and send the parts in parallel
+            logger.info(f"Uploading {filename} in {-(-file_size // settings.CHUNK_SIZE)} parts")
+            parts = await self.send_parts(chat_id, source, file_size, filename, settings.CHUNK_SIZE)
+            return f"mp_{secrets.token_urlsafe(16)}", parts[0]["message_id"], parts
+
+        logger.info(f"Uploading {filename}")
+        if body is None:
+            def _read():
+                source.seek(0)
+                return source.read()
+            body = await asyncio.to_thread(_read)
+
+        if mime_type and "video" in mime_type.lower():
+            message = await asyncio.wait_for(self.send_video(chat_id, body, filename), timeout=600)
+        else:
+            message = await asyncio.wait_for(self.send_document(chat_id, body, filename), timeout=300)
+
+        media = message.video or message.document
+        return media.file_id, message.message_id, None
+
+    async def send_parts(self, chat_id, source, file_size, filename, part_size):
+        """Split a seekable file object into ``part_size`` pieces and send them
+        concurrently, each part through the next healthy bot in the cluster.
+
+        Returns the ordered part descriptors, each with the ``sha256`` of its
+        bytes hashed as they are read. If any part fails, the parts that
+        already reached Telegram are deleted again and the error is re-raised.
+        """
+        semaphore = asyncio.Semaphore(max(1, len(self.bots)))
+        read_lock = asyncio.Lock()
+
+        async def read_part(offset, length):
+            def _read():
+                source.seek(offset)
+                return source.read(length)
+            async with read_lock:
+                data = await asyncio.to_thread(_read)
+            return data, await asyncio.to_thread(piece_digest, data)
+
+        async def send_part(index, offset):
+            length = min(part_size, file_size - offset)
+            async with semaphore:
+                data, digest = await read_part(offset, length)
+                message = await asyncio.wait_for(
+                    self.send_document(chat_id, data, f"{filename}.part{index:04d}"),
+                    timeout=300
+                )
+            return {
+                "part_index": index,
+                "file_id": message.document.file_id,
+                "message_id": message.message_id,
+                "offset": offset,
+                "length": length,
+                "sha256": digest,
+            }
+
+        tasks = [
+            asyncio.create_task(send_part(index, offset))
+            for index, offset in enumerate(range(0, file_size, part_size))
+        ]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            sent = [r["message_id"] for r in results if isinstance(r, dict)]
+            if sent:
+                await self.delete_messages(chat_id, sent)
+            raise
 
 cluster = BotCluster()
\ No newline at end of file
@@ -0,0 +1,55 @@
+from .bot import cluster
+from .config import settings
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("round_robin", "least_busy", "owner_hash")
+
+class ChannelPlacement:
+    """Chooses the storage channel of each new upload. Telegram's flood limits
+    apply per chat, so spreading uploads over several channels multiplies the
+    send rate the cluster can sustain. Where an upload went is recorded on its
+    row; changing the channel list or policy only affects new uploads."""
+
+    def __init__(self, channel_ids, policy):
+        if policy not in POLICIES:
+            logger.warning(f"Unknown CHANNEL_PLACEMENT {policy!r}, using round_robin")
+            policy = "round_robin"
+        self.channel_ids = channel_ids
+        self.policy = policy
+        self.placed = {channel_id: 0 for channel_id in channel_ids}
+        self._next = 0
+
+    def pick(self, owner_key=None):
+        if len(self.channel_ids) == 1:
+            channel_id = self.channel_ids[0]
+        elif self.policy == "owner_hash" and owner_key:
+            digest = hashlib.sha256(owner_key.encode()).digest()
+            channel_id = self.channel_ids[int.from_bytes(digest[:8], "big") % len(self.channel_ids)]
+        elif self.policy == "least_busy":
+            # Fewest sends queued, then the soonest free bot; ties rotate
+            count = len(self.channel_ids)
+            order = [self.channel_ids[(self._next + offset) % count] for offset in range(count)]
+            now = time.monotonic()
+            channel_id = min(order, key=lambda channel_id: cluster.limiter.backlog(channel_id, now))
+            self._next = (self.channel_ids.index(channel_id) + 1) % count
+        else:
+            channel_id = self.channel_ids[self._next % len(self.channel_ids)]
+            self._next = (self._next + 1) % len(self.channel_ids)
+        self.placed[channel_id] += 1
+        return channel_id
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "uploads": {str(channel_id): count for channel_id, count in self.placed.items()},
+        }
+
+def stored_channel(row):
+    """Channel holding a row's messages; rows from before sharding have none recorded."""
+    return row['channel_id'] or settings.CHANNEL_ID
+
+placement = ChannelPlacement(settings.channel_id_list, settings.CHANNEL_PLACEMENT)
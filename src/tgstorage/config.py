@@ -7,15 +7,53 @@ class Settings(BaseSettings):
     API_ID: int = 0
     API_HASH: str = ""
     CHANNEL_ID: int = 0
+
+    # Storage channels: uploads are spread over CHANNEL_IDS (comma-separated,
+    # CHANNEL_ID when empty) by CHANNEL_PLACEMENT: "round_robin", "least_busy"
+    # (fewest sends queued) or "owner_hash" (each API key always uses one channel)
+    CHANNEL_IDS: str = ""
+    CHANNEL_PLACEMENT: str = "round_robin"
     
     # Security
     ADMIN_API_KEY: str = "DEFAULT_INSECURE_KEY"
     TELEGRAM_LOGIN_BOT_TOKEN: str = ""
     TELEGRAM_LOGIN_BOT_USERNAME: str = ""
+
+    # In-process cache for API key, session and user status checks
+    AUTH_CACHE_TTL: float = 60.0
+    AUTH_NEGATIVE_CACHE_TTL: float = 10.0
+    AUTH_CACHE_SIZE: int = 10000
+    # With several workers, how often each checks whether another one changed
+    # an API key or user status and its auth caches have to be dropped
+    AUTH_SYNC_INTERVAL: float = 2.0
+
+    # In-process cache of file rows for downloads and share links. A deletion
+    # made by another worker is noticed within FILE_CACHE_TTL seconds
+    FILE_CACHE_SIZE: int = 10000
+    FILE_CACHE_TTL: float = 60.0
     
     # Server
     DATABASE_URL: str = "storage.db"
     BASE_URL: str = "http://localhost"
+    PORT: int = 8082
+
+    # Worker processes and how they coordinate leader-only jobs and 429 windows:
+    # "local" (one process) or "sqlite" (workers sharing DATABASE_URL). Workers
+    # must run on one host. Defaults to sqlite when WORKERS > 1.
+    WORKERS: int = 1
+    COORDINATION_BACKEND: Optional[str] = None
+    LEADER_LEASE_TTL: float = 30.0
+    RATE_LIMIT_SYNC_INTERVAL: float = 1.0
+
+    # SQLite connection pool (one WAL writer + DB_READERS readers)
+    DB_READERS: int = 4
+    DB_MMAP_SIZE: int = 256 * 1024 * 1024
+    DB_BUSY_TIMEOUT_MS: int = 5000
+    DB_STATEMENT_CACHE_SIZE: int = 256
+
+    # Batched view counting
+    VIEW_FLUSH_INTERVAL: float = 5.0
+    VIEW_FLUSH_THRESHOLD: int = 500
     
     # Proxy (Optional)
     PROXY_HOST: Optional[str] = None
@@ -23,7 +61,91 @@ class Settings(BaseSettings):
     PROXY_USER: Optional[str] = None
     PROXY_PASS: Optional[str] = None
     
+    # Send admission: each bot sends at most BOT_SEND_RATE messages/s overall and
+    # one message per UPLOAD_DELAY seconds to a chat (bursts of SEND_BURST), both
+    # lowered after a 429. Sends queue per chat, at most SEND_QUEUE_SIZE waiting
+    # for up to SEND_QUEUE_TIMEOUT seconds, before the API answers 503 with Retry-After.
     UPLOAD_DELAY: float = 0.5
+    BOT_SEND_RATE: float = 30.0
+    SEND_BURST: int = 3
+    SEND_QUEUE_SIZE: int = 1000
+    SEND_QUEUE_TIMEOUT: float = 30.0
+    SEND_MAX_ATTEMPTS: int = 3
+
+    # Bot API endpoints, for a self-hosted Bot API server or the benchmark stand-in
+    TELEGRAM_API_BASE_URL: str = "https://api.telegram.org/bot"
+    TELEGRAM_FILE_BASE_URL: str = "https://api.telegram.org/file/bot"
+
+    # Shared HTTP client used to stream files from Telegram's file servers
+    HTTP2: bool = True
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    HTTP_CONNECT_TIMEOUT: float = 10.0
+    HTTP_READ_TIMEOUT: float = 60.0
+
+    # Parallel segmented downloads: ranges of at least DOWNLOAD_PARALLEL_MIN_SIZE
+    # are fetched as DOWNLOAD_SEGMENT_SIZE pieces, DOWNLOAD_PARALLELISM at a time,
+    # buffering at most DOWNLOAD_READAHEAD pieces ahead of the client
+    DOWNLOAD_PARALLELISM: int = 4
+    DOWNLOAD_SEGMENT_SIZE: int = 4 * 1024 * 1024
+    DOWNLOAD_READAHEAD: int = 8
+    DOWNLOAD_PARALLEL_MIN_SIZE: int = 8 * 1024 * 1024
+
+    # Concurrent downloads of one file share a single Telegram stream through a
+    # buffer of this many bytes; readers that fall further behind get their own (0 = off)
+    FANOUT_BUFFER_SIZE: int = 8 * 1024 * 1024
+
+    # Background bot health monitor
+    HEALTH_CHECK_INTERVAL: float = 30.0
+    HEALTH_CHECK_TIMEOUT: float = 5.0
+    BOT_ERROR_THRESHOLD: int = 3
+    DELETE_MAX_ATTEMPTS: int = 3
+
+    # Expiry sweeper
+    SWEEP_INTERVAL: float = 3600.0
+    SWEEP_BATCH_SIZE: int = 500
+    SWEEP_CONCURRENCY: int = 0  # concurrent delete batches, 0 = one per bot
+
+    # Chunked storage: files larger than CHUNK_SIZE are split into parts that
+    # are sent concurrently by different bots. Bot API getFile only serves
+    # files up to 20 MB, so parts must not exceed that to stay downloadable.
+    CHUNK_SIZE: int = 20 * 1024 * 1024
+    # Largest accepted upload in bytes, enforced while the body streams in (0 = no limit)
+    MAX_FILE_SIZE: int = 0
+    # Resumable uploads (POST /uploads): bytes not yet sent to Telegram are
+    # staged here, and sessions idle for UPLOAD_SESSION_TTL seconds are aborted
+    UPLOAD_STAGING_DIR: str = "upload_staging"
+    UPLOAD_SESSION_TTL: float = 24 * 3600.0
+    # Async uploads (POST /upload with async=true): bodies are staged under
+    # UPLOAD_STAGING_DIR and sent by UPLOAD_JOB_WORKERS per process (0 = one per
+    # bot), tried up to UPLOAD_JOB_MAX_ATTEMPTS times; finished jobs stay
+    # visible to status polls for UPLOAD_JOB_TTL seconds
+    UPLOAD_JOB_WORKERS: int = 0
+    UPLOAD_JOB_MAX_ATTEMPTS: int = 5
+    UPLOAD_JOB_TTL: float = 7 * 24 * 3600.0
+    # Job callbacks are only POSTed to public addresses; hosts listed here
+    # (comma-separated) may also resolve to private or loopback ones
+    CALLBACK_ALLOWED_HOSTS: str = ""
+    # Batch endpoints: files per request, and concurrent sends (0 = one per bot)
+    BATCH_MAX_FILES: int = 1000
+    BATCH_UPLOAD_CONCURRENCY: int = 0
+    # Store identical uploads (same content hash, see hashing.py) once and link new rows to the existing copy
+    DEDUP_UPLOADS: bool = True
+
+    # Resolved Telegram download paths (file_id -> file_path). Telegram keeps
+    # download links valid for about an hour, so the TTL stays below that.
+    FILE_PATH_CACHE_TTL: int = 50 * 60
+    FILE_PATH_CACHE_SIZE: int = 10000
+
+    # Cache-Control max-age for downloads of files without a password, capped
+    # at the time left until the file expires
+    DOWNLOAD_CACHE_MAX_AGE: int = 24 * 3600
+
+    # Optional local disk cache of hot file bodies (disabled unless DISK_CACHE_DIR is set)
+    DISK_CACHE_DIR: Optional[str] = None
+    DISK_CACHE_MAX_BYTES: int = 10 * 1024 * 1024 * 1024
+    DISK_CACHE_MAX_FILE_SIZE: int = 1024 * 1024 * 1024
     
     # Look for .env in current working directory
     model_config = SettingsConfigDict(env_file=os.path.join(os.getcwd(), ".env"), extra="ignore")
@@ -37,4 +159,27 @@ class Settings(BaseSettings):
                 return [t.strip() for t in f.readlines() if t.strip()]
         return []
 
+    @property
+    def channel_id_list(self) -> List[int]:
+        channels = [int(c) for c in self.CHANNEL_IDS.replace(" ", "").split(",") if c]
+        return list(dict.fromkeys(channels)) or [self.CHANNEL_ID]
+
+    @property
+    def callback_allowed_hosts(self) -> List[str]:
+        return [h.lower() for h in self.CALLBACK_ALLOWED_HOSTS.replace(" ", "").split(",") if h]
+
+    @property
+    def coordination_backend(self) -> str:
+        if self.COORDINATION_BACKEND:
+            return self.COORDINATION_BACKEND.lower()
+        return "sqlite" if self.WORKERS > 1 else "local"
+
+    @property
+    def proxy_url(self) -> Optional[str]:
+        if not (self.PROXY_HOST and self.PROXY_PORT):
+            return None
+        if self.PROXY_USER and self.PROXY_PASS:
+            return f"http://{self.PROXY_USER}:{self.PROXY_PASS}@{self.PROXY_HOST}:{self.PROXY_PORT}"
+        return f"http://{self.PROXY_HOST}:{self.PROXY_PORT}"
+
 settings = Settings()
@@ -0,0 +1,163 @@
+from .config import settings
+from . import database
+import asyncio
+import logging
+import os
+import secrets
+import socket
+
+logger = logging.getLogger(__name__)
+
+# Identifies this worker process as a lease holder
+instance_id = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+
+class LocalCoordinator:
+    """Single process: every lease is ours and nothing is shared."""
+
+    shared = False
+
+    async def acquire_lease(self, name, holder, ttl):
+        return True
+
+    async def release_lease(self, name, holder):
+        pass
+
+    async def publish_retry_after(self, bot_name, retry_until):
+        pass
+
+    async def fetch_retry_after(self):
+        return {}
+
+    async def close(self):
+        pass
+
+class SQLiteCoordinator(LocalCoordinator):
+    """Workers on one host sharing the metadata database file."""
+
+    shared = True
+
+    async def acquire_lease(self, name, holder, ttl):
+        return await database.acquire_lease(name, holder, ttl)
+
+    async def release_lease(self, name, holder):
+        await database.release_lease(name, holder)
+
+    async def publish_retry_after(self, bot_name, retry_until):
+        await database.set_bot_retry_until(bot_name, retry_until)
+
+    async def fetch_retry_after(self):
+        return await database.get_bot_retry_windows()
+
+def create_coordinator():
+    backend = settings.coordination_backend
+    if backend == "local":
+        return LocalCoordinator()
+    if backend == "sqlite":
+        return SQLiteCoordinator()
+    raise ValueError(f"Unknown COORDINATION_BACKEND: {backend}")
+
+class LeaderElection:
+    """Runs jobs that must exist once per deployment (e.g. the expiry sweeper)
+    only in the worker holding their lease. Every worker campaigns; the holder
+    renews every ttl/3, and if it stops renewing the lease lapses to another."""
+
+    def __init__(self, coordinator, ttl):
+        self.coordinator = coordinator
+        self.ttl = ttl
+        self.leading = {}
+        self._campaigns = {}
+
+    def start(self, name, factory):
+        task = self._campaigns.get(name)
+        if task is None or task.done():
+            self._campaigns[name] = asyncio.create_task(self._campaign(name, factory))
+
+    async def _campaign(self, name, factory):
+        job = None
+        try:
+            while True:
+                try:
+                    held = await self.coordinator.acquire_lease(name, instance_id, self.ttl)
+                except Exception as e:
+                    # Without a renewal the lease may already belong to someone else
+                    logger.error(f"Could not renew lease {name}: {e}")
+                    held = False
+                if held:
+                    if job is not None and job.done():
+                        if not job.cancelled() and job.exception():
+                            logger.error(f"Leader job {name} failed, restarting: {job.exception()}")
+                        job = None
+                    if job is None:
+                        if not self.leading.get(name):
+                            logger.info(f"{instance_id} is now leader for {name}")
+                        job = asyncio.create_task(factory())
+                elif job is not None:
+                    logger.info(f"{instance_id} lost the lease for {name}")
+                    job.cancel()
+                    job = None
+                self.leading[name] = held
+                await asyncio.sleep(self.ttl / 3)
+        finally:
+            self.leading[name] = False
+            if job is not None:
+                job.cancel()
+
+    async def stop(self):
+        campaigns, self._campaigns = self._campaigns, {}
+        for task in campaigns.values():
+            task.cancel()
+        for name, task in campaigns.items():
+            try: await task
+            except asyncio.CancelledError: pass
+            try:
+                await self.coordinator.release_lease(name, instance_id)
+            except Exception as e:
+                logger.error(f"Could not release lease {name}: {e}")
+
+    def stats(self):
+        return {
+            "instance": instance_id,
+            "backend": settings.coordination_backend,
+            "leader_for": sorted(name for name, held in self.leading.items() if held),
+        }
+
+class AuthCacheSync:
+    """Keeps the per-worker auth caches honest across workers: a change to an
+    API key or a user's status bumps a generation counter in the shared
+    database, and a worker that sees it move clears its caches, so a revoked
+    key or blocked user loses access everywhere within ``interval`` seconds."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.clears = 0
+        self._task = None
+
+    def start(self):
+        if coordinator.shared and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        generation = None
+        while True:
+            try:
+                current = await database.get_cache_generation("auth")
+            except Exception as e:
+                logger.error(f"Auth cache sync error: {e}")
+            else:
+                if generation is not None and current != generation:
+                    database.api_key_cache.clear()
+                    database.user_status_cache.clear()
+                    self.clears += 1
+                generation = current
+            await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try: await self._task
+            except asyncio.CancelledError: pass
+            self._task = None
+
+coordinator = create_coordinator()
+leader = LeaderElection(coordinator, settings.LEADER_LEASE_TTL)
+auth_sync = AuthCacheSync(settings.AUTH_SYNC_INTERVAL)
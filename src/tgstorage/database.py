@@ -1,9 +1,106 @@
 import aiosqlite
 from .config import settings
+from .cache import TTLCache
+from .metrics import STAGE_SECONDS
+from contextlib import asynccontextmanager
+import asyncio
+import base64
 import datetime
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class ConnectionPool:
+    """Long-lived SQLite connections: one writer plus a fixed set of readers.
+
+    WAL mode lets the readers run concurrently with the single writer, and
+    each connection keeps sqlite3's prepared statement cache warm instead of
+    paying a thread start and file open per query.
+    """
+
+    def __init__(self, path, readers):
+        self.path = path
+        self.size = max(1, readers)
+        self._writer = None
+        self._readers = None
+        self._all = []
+        self._write_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+
+    async def _connect(self, read_only=False):
+        db = await aiosqlite.connect(self.path, cached_statements=settings.DB_STATEMENT_CACHE_SIZE)
+        db.row_factory = aiosqlite.Row
+        await db.execute("PRAGMA journal_mode=WAL")
+        await db.execute("PRAGMA synchronous=NORMAL")
+        await db.execute(f"PRAGMA mmap_size={int(settings.DB_MMAP_SIZE)}")
+        await db.execute(f"PRAGMA busy_timeout={int(settings.DB_BUSY_TIMEOUT_MS)}")
+        await db.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            await db.execute("PRAGMA query_only=1")
+        self._all.append(db)
+        return db
+
+    async def open(self):
+        if self._writer is not None:
+            return
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+            # Writer first so WAL mode is set before any reader attaches
+            writer = await self._connect()
+            readers = asyncio.Queue()
+            for _ in range(self.size):
+                readers.put_nowait(await self._connect(read_only=True))
+            self._readers = readers
+            self._writer = writer
+            logger.info(f"Opened SQLite pool on {self.path} (1 writer, {self.size} readers)")
+
+    async def close(self):
+        async with self._open_lock:
+            async with self._write_lock:
+                connections, self._all = self._all, []
+                self._writer = None
+                self._readers = None
+                for db in connections:
+                    try: await db.close()
+                    except Exception as e: logger.error(f"Error closing SQLite connection: {e}")
+
+    @asynccontextmanager
+    async def reader(self):
+        await self.open()
+        with STAGE_SECONDS.time(stage="db_read"):
+            readers = self._readers
+            db = await readers.get()
+            try:
+                yield db
+            finally:
+                readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def writer(self):
+        # Writes are serialized on one connection; the block is one transaction
+        await self.open()
+        with STAGE_SECONDS.time(stage="db_write"):
+            async with self._write_lock:
+                db = self._writer
+                try:
+                    yield db
+                    await db.commit()
+                except BaseException:
+                    await db.rollback()
+                    raise
+
+pool = ConnectionPool(settings.DATABASE_URL, settings.DB_READERS)
+
+async def close_db():
+    await pool.close()
 
 async def init_db():
-    async with aiosqlite.connect(settings.DATABASE_URL) as db:
+    async with pool.writer() as db:
+        # Take the write lock up front so workers sharing the file migrate one at a time
+        await db.execute("BEGIN IMMEDIATE")
         await db.execute("""
             CREATE TABLE IF NOT EXISTS files (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -24,6 +121,32 @@ async def init_db():
             columns = [row[1] for row in await cursor.fetchall()]
         if "owner_key" not in columns:
             await db.execute("ALTER TABLE files ADD COLUMN owner_key TEXT")
+        if "part_count" not in columns:
+            await db.execute("ALTER TABLE files ADD COLUMN part_count INTEGER DEFAULT 0")
+        # Deduplication: rows with the same content share one stored copy, the
+        # Telegram file (or chunked parts) of the row whose file_id is storage_id
+        if "content_hash" not in columns:
+            await db.execute("ALTER TABLE files ADD COLUMN content_hash TEXT")
+        if "storage_id" not in columns:
+            await db.execute("ALTER TABLE files ADD COLUMN storage_id TEXT")
+            await db.execute("UPDATE files SET storage_id = file_id")
+        # Storage channel of the row's messages; older rows all went to CHANNEL_ID
+        if "channel_id" not in columns:
+            await db.execute("ALTER TABLE files ADD COLUMN channel_id INTEGER")
+            await db.execute("UPDATE files SET channel_id = ?", (settings.CHANNEL_ID,))
+        # Ordered Telegram messages backing a chunked file (files.part_count > 0)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS file_parts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                parent_file_id TEXT,
+                part_index INTEGER,
+                file_id TEXT,
+                message_id INTEGER,
+                start_offset INTEGER,
+                length INTEGER,
+                UNIQUE(parent_file_id, part_index)
+            )
+        """)
         await db.execute("""
             CREATE TABLE IF NOT EXISTS api_keys (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -44,17 +167,366 @@ async def init_db():
                 approved_at TIMESTAMP
             )
         """)
+        # Resumable uploads: session state, and the parts already sent to Telegram
+        # (message_id NULL while a worker is sending the part)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS upload_sessions (
+                upload_id TEXT PRIMARY KEY,
+                owner_key TEXT,
+                file_name TEXT,
+                file_size INTEGER,
+                mime_type TEXT,
+                expiration_date TIMESTAMP,
+                password TEXT,
+                part_size INTEGER,
+                received INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at REAL
+            )
+        """)
+        async with db.execute("PRAGMA table_info(upload_sessions)") as cursor:
+            if "channel_id" not in [row[1] for row in await cursor.fetchall()]:
+                await db.execute("ALTER TABLE upload_sessions ADD COLUMN channel_id INTEGER")
+                await db.execute("UPDATE upload_sessions SET channel_id = ?", (settings.CHANNEL_ID,))
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS upload_session_parts (
+                upload_id TEXT,
+                part_index INTEGER,
+                file_id TEXT,
+                message_id INTEGER,
+                claimed_at REAL,
+                sha256 TEXT,
+                PRIMARY KEY (upload_id, part_index)
+            )
+        """)
+        # Digest of each sent part, combined into the file's content hash on completion
+        async with db.execute("PRAGMA table_info(upload_session_parts)") as cursor:
+            if "sha256" not in [row[1] for row in await cursor.fetchall()]:
+                await db.execute("ALTER TABLE upload_session_parts ADD COLUMN sha256 TEXT")
+        # Async upload jobs (queued, running, done, failed). The body is staged on
+        # ``node``'s disk, so only workers on that host claim the job
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS upload_jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                node TEXT,
+                owner_key TEXT,
+                file_name TEXT,
+                file_size INTEGER,
+                mime_type TEXT,
+                content_hash TEXT,
+                expiration_date TIMESTAMP,
+                password TEXT,
+                share_token TEXT,
+                callback_url TEXT,
+                attempts INTEGER DEFAULT 0,
+                run_after REAL DEFAULT 0,
+                claimed_at REAL,
+                file_id TEXT,
+                error TEXT,
+                created_at REAL,
+                updated_at REAL,
+                sent TEXT
+            )
+        """)
+        # What a job already put on Telegram (JSON), so a retry only writes the row
+        async with db.execute("PRAGMA table_info(upload_jobs)") as cursor:
+            if "sent" not in [row[1] for row in await cursor.fetchall()]:
+                await db.execute("ALTER TABLE upload_jobs ADD COLUMN sent TEXT")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_upload_jobs_queue ON upload_jobs(node, status, run_after)")
+        # Cross-worker coordination: leader leases and the 429 window of each bot
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS bot_rate_limits (
+                bot TEXT PRIMARY KEY,
+                retry_until REAL NOT NULL
+            )
+        """)
+        # Bumped by trigger on every change to api_keys or a user's status; each
+        # worker polls it and drops its auth caches when it moves
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS cache_generations (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+        bump = "INSERT INTO cache_generations (name, value) VALUES ('auth', 1) ON CONFLICT(name) DO UPDATE SET value = value + 1;"
+        for name, event in (
+            ("api_keys_insert", "INSERT ON api_keys"),
+            ("api_keys_update", "UPDATE ON api_keys"),
+            ("api_keys_delete", "DELETE ON api_keys"),
+            ("users_insert", "INSERT ON users"),
+            ("users_status", "UPDATE OF status ON users"),
+            ("users_delete", "DELETE ON users"),
+        ):
+            await db.execute(f"CREATE TRIGGER IF NOT EXISTS auth_generation_{name} AFTER {event} BEGIN {bump} END")
+        # Listing indexes: newest-first pages globally and per owner
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_files_upload_date ON files(upload_date, id)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_files_owner_upload_date ON files(owner_key, upload_date, id)")
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_files_expiration ON files(expiration_date) WHERE expiration_date IS NOT NULL"
+        )
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files(content_hash) WHERE content_hash IS NOT NULL"
+        )
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_files_storage_id ON files(storage_id)")
+        await _init_search_index(db)
+        await _init_stats_counters(db)
+        await _init_job_counters(db)
         # Insert default key if it doesn't exist
         await db.execute(
             "INSERT OR IGNORE INTO api_keys (key, owner) VALUES (?, ?)",
             (settings.ADMIN_API_KEY, "admin")
         )
-        await db.commit()
+
+# Set by init_db when the trigram full-text index over file names is available
+fts_enabled = False
+
+async def _init_search_index(db):
+    global fts_enabled
+    async with db.execute("SELECT 1 FROM sqlite_master WHERE name = 'files_fts'") as cursor:
+        exists = await cursor.fetchone() is not None
+    if not exists:
+        try:
+            await db.execute(
+                "CREATE VIRTUAL TABLE files_fts USING fts5(file_name, content='files', content_rowid='id', tokenize='trigram')"
+            )
+        except aiosqlite.OperationalError as e:
+            # FTS5 or the trigram tokenizer (SQLite 3.34+) is missing: keep LIKE search
+            logger.warning(f"Full-text search unavailable, falling back to LIKE: {e}")
+            fts_enabled = False
+            return
+        await db.execute("INSERT INTO files_fts(files_fts) VALUES ('rebuild')")
+    # Statements run one by one: executescript would commit init_db's transaction
+    for statement in (
+        """CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+            INSERT INTO files_fts(rowid, file_name) VALUES (new.id, new.file_name);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+            INSERT INTO files_fts(files_fts, rowid, file_name) VALUES ('delete', old.id, old.file_name);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS files_fts_update AFTER UPDATE OF file_name ON files BEGIN
+            INSERT INTO files_fts(files_fts, rowid, file_name) VALUES ('delete', old.id, old.file_name);
+            INSERT INTO files_fts(rowid, file_name) VALUES (new.id, new.file_name);
+        END""",
+    ):
+        await db.execute(statement)
+    fts_enabled = True
+
+# Counter scopes kept per files row; {row} is NEW or OLD inside the triggers
+STATS_SCOPES = (
+    "'global'",
+    "'owner:' || COALESCE({row}.owner_key, '')",
+    "'mime:' || COALESCE({row}.mime_type, '')",
+)
+
+def _counter_upserts(row, sign, files=True, sizes=True, views=None):
+    views = views or f"COALESCE({row}.view_count, 0)"
+    statements = []
+    for scope in STATS_SCOPES:
+        statements.append(
+            f"INSERT INTO stats_counters (scope, files, bytes, views) VALUES ("
+            f"{scope.format(row=row)}, {sign}{1 if files else 0}, "
+            f"{sign}{f'COALESCE({row}.file_size, 0)' if sizes else 0}, {sign}{views}) "
+            "ON CONFLICT(scope) DO UPDATE SET files = files + excluded.files, "
+            "bytes = bytes + excluded.bytes, views = views + excluded.views;"
+        )
+    return "\n".join(statements)
+
+def _job_counter_upsert(row, sign):
+    return (
+        f"INSERT INTO job_counters (status, count) VALUES ({row}.status, {sign}1) "
+        "ON CONFLICT(status) DO UPDATE SET count = count + excluded.count;"
+    )
+
+async def _init_stats_counters(db):
+    # Aggregates for /stats, maintained by triggers in the same transaction as
+    # every insert, delete and view flush so reading them is O(1)
+    async with db.execute("SELECT 1 FROM sqlite_master WHERE name = 'stats_counters'") as cursor:
+        exists = await cursor.fetchone() is not None
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            scope TEXT PRIMARY KEY,
+            files INTEGER NOT NULL DEFAULT 0,
+            bytes INTEGER NOT NULL DEFAULT 0,
+            views INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    same_row = "OLD.file_size IS NEW.file_size AND OLD.owner_key IS NEW.owner_key AND OLD.mime_type IS NEW.mime_type"
+    for statement in (
+        f"""CREATE TRIGGER IF NOT EXISTS stats_files_insert AFTER INSERT ON files BEGIN
+            {_counter_upserts("NEW", "")}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS stats_files_delete AFTER DELETE ON files BEGIN
+            {_counter_upserts("OLD", "-")}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS stats_files_views AFTER UPDATE OF view_count ON files
+        WHEN {same_row} BEGIN
+            {_counter_upserts("NEW", "", files=False, sizes=False, views="(COALESCE(NEW.view_count, 0) - COALESCE(OLD.view_count, 0))")}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS stats_files_update AFTER UPDATE OF file_size, view_count, owner_key, mime_type ON files
+        WHEN NOT ({same_row}) BEGIN
+            {_counter_upserts("OLD", "-")}
+            {_counter_upserts("NEW", "")}
+        END""",
+    ):
+        await db.execute(statement)
+    if not exists:
+        await _rebuild_stats(db)
+
+async def _init_job_counters(db):
+    # Upload jobs per status, kept by triggers in the same way as stats_counters
+    async with db.execute("SELECT 1 FROM sqlite_master WHERE name = 'job_counters'") as cursor:
+        exists = await cursor.fetchone() is not None
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS job_counters (
+            status TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    if not exists:
+        # Job counts used to share stats_counters as 'jobs:<status>' scopes
+        for event in ("insert", "delete", "update"):
+            await db.execute(f"DROP TRIGGER IF EXISTS stats_upload_jobs_{event}")
+        await db.execute("DELETE FROM stats_counters WHERE scope >= 'jobs:' AND scope < 'jobs;'")
+    for statement in (
+        f"""CREATE TRIGGER IF NOT EXISTS job_counters_insert AFTER INSERT ON upload_jobs BEGIN
+            {_job_counter_upsert("NEW", "")}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS job_counters_delete AFTER DELETE ON upload_jobs BEGIN
+            {_job_counter_upsert("OLD", "-")}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS job_counters_update AFTER UPDATE OF status ON upload_jobs
+        WHEN OLD.status IS NOT NEW.status BEGIN
+            {_job_counter_upsert("OLD", "-")}
+            {_job_counter_upsert("NEW", "")}
+        END""",
+    ):
+        await db.execute(statement)
+    if not exists:
+        await _rebuild_job_counters(db)
+
+STATS_AGGREGATE_QUERY = """
+    SELECT 'global', COUNT(*), COALESCE(SUM(file_size), 0), COALESCE(SUM(view_count), 0) FROM files
+    UNION ALL
+    SELECT 'owner:' || COALESCE(owner_key, ''), COUNT(*), COALESCE(SUM(file_size), 0), COALESCE(SUM(view_count), 0)
+    FROM files GROUP BY 1
+    UNION ALL
+    SELECT 'mime:' || COALESCE(mime_type, ''), COUNT(*), COALESCE(SUM(file_size), 0), COALESCE(SUM(view_count), 0)
+    FROM files GROUP BY 1
+"""
+
+JOB_AGGREGATE_QUERY = "SELECT status, COUNT(*) FROM upload_jobs GROUP BY status"
+
+async def _rebuild_stats(db):
+    await db.execute("DELETE FROM stats_counters")
+    await db.execute(f"INSERT INTO stats_counters (scope, files, bytes, views) {STATS_AGGREGATE_QUERY}")
+
+async def _rebuild_job_counters(db):
+    await db.execute("DELETE FROM job_counters")
+    await db.execute(f"INSERT INTO job_counters (status, count) {JOB_AGGREGATE_QUERY}")
+
+def _drift(actual, stored, empty):
+    drift = {}
+    for key in set(actual) | set(stored):
+        expected = actual.get(key, empty)
+        current = stored.get(key, empty)
+        if expected != current:
+            drift[key] = {"stored": current, "actual": expected}
+    return drift
+
+async def verify_stats(rebuild=False):
+    """Compare the maintained counters with a full scan of ``files`` and
+    ``upload_jobs``. Returns the drifted scopes as ``{scope: {"stored": ...,
+    "actual": ...}}``, job counts under ``jobs:<status>``, and, with
+    ``rebuild``, recomputes every counter from scratch."""
+    async with pool.writer() as db:
+        async with db.execute(STATS_AGGREGATE_QUERY) as cursor:
+            actual = {row[0]: (row[1], row[2], row[3]) for row in await cursor.fetchall()}
+        async with db.execute("SELECT scope, files, bytes, views FROM stats_counters") as cursor:
+            stored = {row[0]: (row[1], row[2], row[3]) for row in await cursor.fetchall()}
+        drift = _drift(actual, stored, (0, 0, 0))
+        async with db.execute(JOB_AGGREGATE_QUERY) as cursor:
+            actual = {row[0]: row[1] for row in await cursor.fetchall()}
+        async with db.execute("SELECT status, count FROM job_counters") as cursor:
+            stored = {row[0]: row[1] for row in await cursor.fetchall()}
+        job_drift = _drift(actual, stored, 0)
+        if rebuild and drift:
+            await _rebuild_stats(db)
+        if rebuild and job_drift:
+            await _rebuild_job_counters(db)
+        drift.update((f"jobs:{status}", values) for status, values in job_drift.items())
+        return drift
+
+def encode_cursor(row):
+    # Opaque keyset position: the (upload_date, id) of the last row on a page
+    raw = json.dumps([row['upload_date'], row['id']], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def decode_cursor(cursor):
+    try:
+        upload_date, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(upload_date), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+# Auth lookups hit on every authenticated request; both positive and negative
+# answers are cached and invalidated by the writes below that change them
+api_key_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+user_status_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
 
 async def verify_key_db(key):
-    async with aiosqlite.connect(settings.DATABASE_URL) as db:
+    valid = api_key_cache.get(key)
+    if valid is not None:
+        return valid
+    async with pool.reader() as db:
         async with db.execute("SELECT 1 FROM api_keys WHERE key = ?", (key,)) as cursor:
-            return await cursor.fetchone() is not None
+            valid = await cursor.fetchone() is not None
+    api_key_cache.set(key, valid, None if valid else settings.AUTH_NEGATIVE_CACHE_TTL)
+    return valid
+
+async def create_api_key(key, owner):
+    async with pool.writer() as db:
+        await db.execute("INSERT INTO api_keys (key, owner) VALUES (?, ?)", (key, owner))
+    api_key_cache.invalidate(key)
+
+FILE_COLUMNS = (
+    "file_id", "message_id", "file_name", "file_size", "mime_type", "expiration_date",
+    "share_token", "password", "owner_key", "part_count", "content_hash", "storage_id", "channel_id",
+)
+
+async def _insert_file(db, row):
+    parts = row.get("parts") or []
+    values = dict(row, part_count=len(parts), storage_id=row["file_id"])
+    await db.execute(
+        f"INSERT INTO files ({', '.join(FILE_COLUMNS)}) VALUES ({', '.join('?' * len(FILE_COLUMNS))})",
+        [values.get(column) for column in FILE_COLUMNS],
+    )
+    if parts:
+        await db.executemany(
+            "INSERT INTO file_parts (parent_file_id, part_index, file_id, message_id, start_offset, length) VALUES (?, ?, ?, ?, ?, ?)",
+            [(row["file_id"], p["part_index"], p["file_id"], p["message_id"], p["offset"], p["length"]) for p in parts],
+        )
+
+async def _insert_duplicate(db, row):
+    # Copies the storage reference of a row with the same content; looked up in
+    # the insert's own transaction so a concurrent delete cannot remove it in between
+    cursor = await db.execute(
+        """
+        INSERT INTO files (file_id, message_id, file_name, file_size, mime_type, expiration_date, share_token, password, owner_key, part_count, content_hash, storage_id, channel_id)
+        SELECT ?, message_id, ?, file_size, ?, ?, ?, ?, ?, part_count, content_hash, storage_id, channel_id
+        FROM files WHERE content_hash = ? LIMIT 1
+        """,
+        (row["file_id"], row["file_name"], row["mime_type"], row.get("expiration_date"), row.get("share_token"),
+         row.get("password"), row.get("owner_key"), row["content_hash"]),
+    )
+    return cursor.rowcount == 1
 
 async def add_file(
     file_id,
@@ -66,34 +538,200 @@ async def add_file(
     share_token=None,
     password=None,
     owner_key=None,
+    parts=None,
+    content_hash=None,
+    channel_id=None,
 ):
-    async with aiosqlite.connect(settings.DATABASE_URL) as db:
-        await db.execute(
-            "INSERT INTO files (file_id, message_id, file_name, file_size, mime_type, expiration_date, share_token, password, owner_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (file_id, message_id, file_name, file_size, mime_type, expiration_date, share_token, password, owner_key),
-        )
-        await db.commit()
+    async with pool.writer() as db:
+        await _insert_file(db, {
+            "file_id": file_id,
+            "message_id": message_id,
+            "file_name": file_name,
+            "file_size": file_size,
+            "mime_type": mime_type,
+            "expiration_date": expiration_date,
+            "share_token": share_token,
+            "password": password,
+            "owner_key": owner_key,
+            "parts": parts,
+            "content_hash": content_hash,
+            "channel_id": channel_id,
+        })
+
+async def add_duplicate_file(
+    file_id,
+    content_hash,
+    file_name,
+    mime_type,
+    expiration_date=None,
+    share_token=None,
+    password=None,
+    owner_key=None,
+):
+    """Add a row for already stored content, pointing at the same Telegram
+    messages as an existing row with ``content_hash``. Returns False when no
+    such row exists, in which case the content has to be uploaded."""
+    async with pool.writer() as db:
+        return await _insert_duplicate(db, {
+            "file_id": file_id,
+            "content_hash": content_hash,
+            "file_name": file_name,
+            "mime_type": mime_type,
+            "expiration_date": expiration_date,
+            "share_token": share_token,
+            "password": password,
+            "owner_key": owner_key,
+        })
+
+async def has_stored_content(content_hash):
+    async with pool.reader() as db:
+        async with db.execute("SELECT 1 FROM files WHERE content_hash = ? LIMIT 1", (content_hash,)) as cursor:
+            return await cursor.fetchone() is not None
+
+async def add_files(rows, duplicates=()):
+    """Insert many files in one transaction: ``rows`` are new uploads (the
+    keyword arguments of add_file as dicts), then ``duplicates`` link to stored
+    content as in add_duplicate_file. Returns, per duplicate, whether it was added."""
+    async with pool.writer() as db:
+        for row in rows:
+            await _insert_file(db, row)
+        return [await _insert_duplicate(db, row) for row in duplicates]
+
+
+# Hot file rows, under ("id", file_id) and ("share", share_token). Rows are
+# immutable apart from view_count, which the download path does not read
+file_cache = TTLCache(settings.FILE_CACHE_SIZE, settings.FILE_CACHE_TTL)
+# Bumped on every invalidation, so a lookup that raced a delete does not cache the old row
+_file_cache_generation = 0
+
+def _expires_at(row):
+    if not row['expiration_date']:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(str(row['expiration_date'])).timestamp()
+    except ValueError:
+        return None
+
+async def _get_cached_file(key, query, value):
+    """Cached single-row lookup. Expiration is enforced here rather than left to
+    the sweeper, so an expired file is gone the moment it expires."""
+    entry = file_cache.get(key)
+    if entry is None:
+        generation = _file_cache_generation
+        async with pool.reader() as db:
+            async with db.execute(query, (value,)) as cursor:
+                row = await cursor.fetchone()
+        # Misses are not cached: an async upload's share link must work as soon as its row exists
+        if row is None:
+            return None
+        entry = (row, _expires_at(row))
+        if generation == _file_cache_generation:
+            file_cache.set(("id", row['file_id']), entry)
+            if row['share_token']:
+                file_cache.set(("share", row['share_token']), entry)
+    row, expires_at = entry
+    if expires_at is not None and expires_at <= time.time():
+        return None
+    return row
+
+def invalidate_files(rows, storage_ids=()):
+    global _file_cache_generation
+    _file_cache_generation += 1
+    for file_id, share_token in rows:
+        file_cache.invalidate(("id", file_id))
+        if share_token:
+            file_cache.invalidate(("share", share_token))
+    for storage_id in storage_ids:
+        file_cache.invalidate(("parts", storage_id))
+
+async def get_file_parts(file_id):
+    # Parts never change while any row still references them
+    key = ("parts", file_id)
+    parts = file_cache.get(key)
+    if parts is None:
+        generation = _file_cache_generation
+        async with pool.reader() as db:
+            async with db.execute(
+                "SELECT * FROM file_parts WHERE parent_file_id = ? ORDER BY part_index", (file_id,)
+            ) as cursor:
+                parts = tuple(await cursor.fetchall())
+        if parts and generation == _file_cache_generation:
+            file_cache.set(key, parts)
+    return parts
 
 async def get_file_by_id(file_id):
-    async with aiosqlite.connect(settings.DATABASE_URL) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM files WHERE file_id = ?", (file_id,)) as cursor:
-            return await cursor.fetchone()
+    return await _get_cached_file(("id", file_id), "SELECT * FROM files WHERE file_id = ?", file_id)
+
+async def get_files_by_ids(file_ids):
+    if not file_ids:
+        return []
+    placeholders = ",".join("?" * len(file_ids))
+    async with pool.reader() as db:
+        async with db.execute(f"SELECT * FROM files WHERE file_id IN ({placeholders})", list(file_ids)) as cursor:
+            return await cursor.fetchall()
 
 async def get_file_by_share_token(token):
-    async with aiosqlite.connect(settings.DATABASE_URL) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM files WHERE share_token = ?", (token,)) as cursor:
-            return await cursor.fetchone()
+    return await _get_cached_file(("share", token), "SELECT * FROM files WHERE share_token = ?", token)
 
-async def increment_view_count(file_id):
-    async with aiosqlite.connect(settings.DATABASE_URL) as db:
-        await db.execute("UPDATE files SET view_count = view_count + 1 WHERE file_id = ?", (file_id,))
-        await db.commit()
+class ViewCounter:
+    """Write-behind view counting: increments are collected in memory and
+    applied in one transaction every VIEW_FLUSH_INTERVAL seconds, or sooner
+    once VIEW_FLUSH_THRESHOLD views are pending, instead of one write per hit."""
 
-async def list_files(limit=20, offset=0, search=None, auth_key=None):
-    async with aiosqlite.connect(settings.DATABASE_URL) as db:
-        db.row_factory = aiosqlite.Row
+    def __init__(self):
+        self.pending = {}
+        self._count = 0
+        self._task = None
+        self._flush_lock = asyncio.Lock()
+        self._threshold_flush = None
+
+    def record(self, file_id, count=1):
+        self.pending[file_id] = self.pending.get(file_id, 0) + count
+        self._count += count
+        if self._count >= settings.VIEW_FLUSH_THRESHOLD and (self._threshold_flush is None or self._threshold_flush.done()):
+            self._threshold_flush = asyncio.create_task(self.flush())
+
+    def pending_total(self):
+        return self._count
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            batch, self.pending, self._count = self.pending, {}, 0
+            try:
+                async with pool.writer() as db:
+                    await db.executemany(
+                        "UPDATE files SET view_count = view_count + ? WHERE file_id = ?",
+                        [(count, file_id) for file_id, count in batch.items()],
+                    )
+            except Exception as e:
+                logger.error(f"Failed to flush {len(batch)} view counts: {e}")
+                for file_id, count in batch.items():
+                    self.pending[file_id] = self.pending.get(file_id, 0) + count
+                    self._count += count
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.VIEW_FLUSH_INTERVAL)
+            await self.flush()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try: await self._task
+            except asyncio.CancelledError: pass
+            self._task = None
+        await self.flush()
+
+view_counter = ViewCounter()
+
+async def list_files(limit=20, offset=0, search=None, auth_key=None, cursor=None):
+    async with pool.reader() as db:
         query = "SELECT * FROM files"
         params = []
         where_clauses = []
@@ -102,39 +740,319 @@ async def list_files(limit=20, offset=0, search=None, auth_key=None):
             where_clauses.append("owner_key = ?")
             params.append(auth_key)
         if search:
-            where_clauses.append("file_name LIKE ?")
-            params.append(f"%{search}%")
+            if fts_enabled and len(search) >= 3:
+                where_clauses.append("id IN (SELECT rowid FROM files_fts WHERE files_fts MATCH ?)")
+                params.append('"' + search.replace('"', '""') + '"')
+            else:
+                # Trigrams need at least three characters; shorter terms scan
+                where_clauses.append("file_name LIKE ?")
+                params.append(f"%{search}%")
+        if cursor:
+            # Keyset pagination: seek past the previous page instead of OFFSET
+            where_clauses.append("(upload_date, id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+            offset = 0
         if where_clauses:
             query += " WHERE " + " AND ".join(where_clauses)
-        query += " ORDER BY upload_date DESC LIMIT ? OFFSET ?"
+        query += " ORDER BY upload_date DESC, id DESC LIMIT ? OFFSET ?"
         params.extend([limit, offset])
-        async with db.execute(query, params) as cursor:
-            return await cursor.fetchall()
+        async with db.execute(query, params) as rows:
+            return await rows.fetchall()
 
-async def get_stats():
-    async with aiosqlite.connect(settings.DATABASE_URL) as db:
-        async with db.execute("SELECT COUNT(*), SUM(file_size), SUM(view_count) FROM files") as cursor:
+def _counter_dict(row):
+    return {"files": row['files'], "size_bytes": row['bytes'], "views": row['views']}
+
+async def _counters_with_prefix(db, prefix):
+    # Range scan over the scope primary key, e.g. every 'owner:' row
+    async with db.execute(
+        "SELECT * FROM stats_counters WHERE scope >= ? AND scope < ? AND files != 0 ORDER BY bytes DESC",
+        (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)),
+    ) as cursor:
+        return {row['scope'][len(prefix):]: _counter_dict(row) for row in await cursor.fetchall()}
+
+async def get_stats(include_pending=False, owner_key=None, breakdown=False):
+    async with pool.reader() as db:
+        async with db.execute("SELECT * FROM stats_counters WHERE scope = 'global'") as cursor:
             row = await cursor.fetchone()
-            return {
-                "total_files": row[0] or 0,
-                "total_size_bytes": row[1] or 0,
-                "total_views": row[2] or 0
-            }
+        stats = {
+            "total_files": row['files'] if row else 0,
+            "total_size_bytes": row['bytes'] if row else 0,
+            "total_views": row['views'] if row else 0
+        }
+        if owner_key:
+            async with db.execute("SELECT * FROM stats_counters WHERE scope = ?", (f"owner:{owner_key}",)) as cursor:
+                row = await cursor.fetchone()
+            stats["usage"] = _counter_dict(row) if row else {"files": 0, "size_bytes": 0, "views": 0}
+        if breakdown:
+            stats["owners"] = await _counters_with_prefix(db, "owner:")
+            stats["mime_types"] = await _counters_with_prefix(db, "mime:")
+    if include_pending:
+        stats["pending_views"] = view_counter.pending_total()
+        stats["total_views"] += stats["pending_views"]
+    return stats
 
 async def delete_file_db(file_id):
-    async with aiosqlite.connect(settings.DATABASE_URL) as db:
-        await db.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
-        await db.commit()
+    return await delete_files_db([file_id])
 
-async def get_expired_files():
-    async with aiosqlite.connect(settings.DATABASE_URL) as db:
-        db.row_factory = aiosqlite.Row
+async def delete_files_db(file_ids):
+    """Delete file rows. Stored content is reference counted: returns the
+    ``storage_ids`` no longer referenced by any row, and their message ids as
+    ``{channel_id: [message_id, ...]}``, which the caller removes from the disk
+    cache and from Telegram."""
+    if not file_ids:
+        return [], {}
+    placeholders = ",".join("?" * len(file_ids))
+    async with pool.writer() as db:
+        async with db.execute(
+            f"SELECT storage_id, message_id, part_count, channel_id, file_id, share_token FROM files WHERE file_id IN ({placeholders})", file_ids
+        ) as cursor:
+            rows = await cursor.fetchall()
+        stored = {row[0]: (row[1], row[2], row[3] or settings.CHANNEL_ID) for row in rows}
+        await db.execute(f"DELETE FROM files WHERE file_id IN ({placeholders})", file_ids)
+        orphaned, messages = await _orphaned_messages(db, stored) if stored else ([], {})
+    # After the commit, so a concurrent lookup cannot cache the deleted row again
+    invalidate_files(((row[4], row[5]) for row in rows), orphaned)
+    return orphaned, messages
+
+async def _orphaned_messages(db, stored):
+    """Of the deleted rows' ``stored`` content, what no remaining row references,
+    and its messages by channel; drops the file_parts of orphaned chunked files."""
+    placeholders = ",".join("?" * len(stored))
+    async with db.execute(
+        f"SELECT DISTINCT storage_id FROM files WHERE storage_id IN ({placeholders})", list(stored)
+    ) as cursor:
+        referenced = {row[0] for row in await cursor.fetchall()}
+    orphaned = [storage_id for storage_id in stored if storage_id not in referenced]
+    messages = {}
+    for storage_id in orphaned:
+        message_id, part_count, channel_id = stored[storage_id]
+        if not part_count:
+            messages.setdefault(channel_id, []).append(message_id)
+    chunked = [storage_id for storage_id in orphaned if stored[storage_id][1]]
+    if chunked:
+        placeholders = ",".join("?" * len(chunked))
+        async with db.execute(
+            f"SELECT parent_file_id, message_id FROM file_parts WHERE parent_file_id IN ({placeholders})", chunked
+        ) as cursor:
+            for parent_file_id, message_id in await cursor.fetchall():
+                messages.setdefault(stored[parent_file_id][2], []).append(message_id)
+        await db.execute(f"DELETE FROM file_parts WHERE parent_file_id IN ({placeholders})", chunked)
+    return orphaned, messages
+
+async def get_expired_files(limit=None):
+    async with pool.reader() as db:
         now = datetime.datetime.now().isoformat()
-        async with db.execute("SELECT * FROM files WHERE expiration_date IS NOT NULL AND expiration_date < ?", (now,)) as cursor:
+        query = "SELECT * FROM files WHERE expiration_date IS NOT NULL AND expiration_date < ? ORDER BY expiration_date"
+        params = [now]
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        async with db.execute(query, params) as cursor:
             return await cursor.fetchall()
 
+async def create_upload_session(upload_id, owner_key, file_name, file_size, mime_type, expiration_date, password, part_size, channel_id):
+    async with pool.writer() as db:
+        await db.execute(
+            "INSERT INTO upload_sessions (upload_id, owner_key, file_name, file_size, mime_type, expiration_date, password, part_size, channel_id, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (upload_id, owner_key, file_name, file_size, mime_type, expiration_date, password, part_size, channel_id, time.time()),
+        )
+
+async def get_upload_session(upload_id):
+    async with pool.reader() as db:
+        async with db.execute("SELECT * FROM upload_sessions WHERE upload_id = ?", (upload_id,)) as cursor:
+            return await cursor.fetchone()
+
+async def set_upload_received(upload_id, expected, received):
+    # Compare-and-set, so two requests racing on one session cannot both advance it
+    async with pool.writer() as db:
+        cursor = await db.execute(
+            "UPDATE upload_sessions SET received = ?, updated_at = ? WHERE upload_id = ? AND received = ?",
+            (received, time.time(), upload_id, expected),
+        )
+        return cursor.rowcount == 1
+
+async def claim_upload_part(upload_id, part_index, stale_before):
+    """Claim a part for sending. Fails while it is sent, or being sent by a
+    claim newer than ``stale_before``."""
+    async with pool.writer() as db:
+        cursor = await db.execute(
+            """
+            INSERT INTO upload_session_parts (upload_id, part_index, claimed_at) VALUES (?, ?, ?)
+            ON CONFLICT(upload_id, part_index) DO UPDATE SET claimed_at = excluded.claimed_at
+            WHERE upload_session_parts.message_id IS NULL AND upload_session_parts.claimed_at < ?
+            """,
+            (upload_id, part_index, time.time(), stale_before),
+        )
+        return cursor.rowcount == 1
+
+async def complete_upload_part(upload_id, part_index, file_id, message_id, sha256):
+    async with pool.writer() as db:
+        await db.execute(
+            "UPDATE upload_session_parts SET file_id = ?, message_id = ?, sha256 = ? WHERE upload_id = ? AND part_index = ?",
+            (file_id, message_id, sha256, upload_id, part_index),
+        )
+
+async def release_upload_part(upload_id, part_index):
+    async with pool.writer() as db:
+        await db.execute(
+            "DELETE FROM upload_session_parts WHERE upload_id = ? AND part_index = ? AND message_id IS NULL",
+            (upload_id, part_index),
+        )
+
+async def get_upload_session_parts(upload_id):
+    async with pool.reader() as db:
+        async with db.execute(
+            "SELECT * FROM upload_session_parts WHERE upload_id = ? ORDER BY part_index", (upload_id,)
+        ) as cursor:
+            return await cursor.fetchall()
+
+async def finish_upload_session(upload_id, row, duplicate=None):
+    """Replace the session with its file ``row``, atomically. ``duplicate`` is
+    tried first, as a link to stored content with the same hash (see
+    add_duplicate_file); returns whether it was used instead of ``row``."""
+    async with pool.writer() as db:
+        linked = duplicate is not None and await _insert_duplicate(db, duplicate)
+        if not linked:
+            await _insert_file(db, row)
+        await db.execute("DELETE FROM upload_session_parts WHERE upload_id = ?", (upload_id,))
+        await db.execute("DELETE FROM upload_sessions WHERE upload_id = ?", (upload_id,))
+    return linked
+
+async def delete_upload_session(upload_id):
+    async with pool.writer() as db:
+        await db.execute("DELETE FROM upload_session_parts WHERE upload_id = ?", (upload_id,))
+        await db.execute("DELETE FROM upload_sessions WHERE upload_id = ?", (upload_id,))
+
+async def get_stale_upload_sessions(updated_before):
+    async with pool.reader() as db:
+        async with db.execute("SELECT * FROM upload_sessions WHERE updated_at < ?", (updated_before,)) as cursor:
+            return await cursor.fetchall()
+
+UPLOAD_JOB_COLUMNS = (
+    "job_id", "node", "owner_key", "file_name", "file_size", "mime_type", "content_hash",
+    "expiration_date", "password", "share_token", "callback_url",
+)
+
+async def create_upload_job(job):
+    now = time.time()
+    async with pool.writer() as db:
+        await db.execute(
+            f"INSERT INTO upload_jobs ({', '.join(UPLOAD_JOB_COLUMNS)}, status, created_at, updated_at) VALUES ({', '.join('?' * len(UPLOAD_JOB_COLUMNS))}, 'queued', ?, ?)",
+            [job.get(column) for column in UPLOAD_JOB_COLUMNS] + [now, now],
+        )
+
+async def get_upload_job(job_id):
+    async with pool.reader() as db:
+        async with db.execute("SELECT * FROM upload_jobs WHERE job_id = ?", (job_id,)) as cursor:
+            return await cursor.fetchone()
+
+async def claim_upload_job(node, stale_before):
+    """Claim the next due job staged on ``node``: a queued one, or a running one
+    whose worker stopped renewing its claim before ``stale_before``."""
+    now = time.time()
+    async with pool.writer() as db:
+        async with db.execute(
+            """
+            UPDATE upload_jobs SET status = 'running', attempts = attempts + 1, claimed_at = ?, updated_at = ?
+            WHERE job_id = (
+                SELECT job_id FROM upload_jobs
+                WHERE node = ? AND ((status = 'queued' AND run_after <= ?) OR (status = 'running' AND claimed_at < ?))
+                ORDER BY run_after LIMIT 1
+            )
+            RETURNING *
+            """,
+            (now, now, node, now, stale_before),
+        ) as cursor:
+            return await cursor.fetchone()
+
+async def renew_upload_job(job_id):
+    async with pool.writer() as db:
+        await db.execute(
+            "UPDATE upload_jobs SET claimed_at = ? WHERE job_id = ? AND status = 'running'", (time.time(), job_id)
+        )
+
+async def record_upload_job_send(job_id, sent):
+    async with pool.writer() as db:
+        await db.execute("UPDATE upload_jobs SET sent = ? WHERE job_id = ?", (json.dumps(sent), job_id))
+
+async def retry_upload_job(job_id, run_after, error, attempts):
+    async with pool.writer() as db:
+        await db.execute(
+            "UPDATE upload_jobs SET status = 'queued', run_after = ?, error = ?, attempts = ?, updated_at = ? WHERE job_id = ?",
+            (run_after, error, attempts, time.time(), job_id),
+        )
+
+async def fail_upload_job(job_id, error):
+    async with pool.writer() as db:
+        await db.execute(
+            "UPDATE upload_jobs SET status = 'failed', error = ?, updated_at = ? WHERE job_id = ?",
+            (error, time.time(), job_id),
+        )
+
+async def finish_upload_job(job_id, row):
+    # The file row and the job's outcome are written together
+    async with pool.writer() as db:
+        await _insert_file(db, row)
+        await db.execute(
+            "UPDATE upload_jobs SET status = 'done', file_id = ?, error = NULL, updated_at = ? WHERE job_id = ?",
+            (row["file_id"], time.time(), job_id),
+        )
+
+async def count_upload_jobs():
+    # Kept in job_counters by the upload_jobs triggers
+    async with pool.reader() as db:
+        async with db.execute("SELECT status, count FROM job_counters WHERE count != 0") as cursor:
+            return {row[0]: row[1] for row in await cursor.fetchall()}
+
+async def delete_finished_upload_jobs(updated_before):
+    async with pool.writer() as db:
+        cursor = await db.execute(
+            "DELETE FROM upload_jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (updated_before,)
+        )
+        return cursor.rowcount
+
+async def acquire_lease(name, holder, ttl):
+    """Take or renew the lease ``name`` for ``holder`` unless another holder's
+    lease is still running. Returns True while ``holder`` owns it."""
+    now = time.time()
+    async with pool.writer() as db:
+        await db.execute(
+            """
+            INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+            WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+            """,
+            (name, holder, now + ttl, now),
+        )
+        async with db.execute("SELECT holder FROM leases WHERE name = ?", (name,)) as cursor:
+            row = await cursor.fetchone()
+    return row is not None and row[0] == holder
+
+async def release_lease(name, holder):
+    async with pool.writer() as db:
+        await db.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+async def set_bot_retry_until(bot, retry_until):
+    async with pool.writer() as db:
+        await db.execute(
+            "INSERT INTO bot_rate_limits (bot, retry_until) VALUES (?, ?) "
+            "ON CONFLICT(bot) DO UPDATE SET retry_until = MAX(retry_until, excluded.retry_until)",
+            (bot, retry_until),
+        )
+
+async def get_cache_generation(name):
+    async with pool.reader() as db:
+        async with db.execute("SELECT value FROM cache_generations WHERE name = ?", (name,)) as cursor:
+            row = await cursor.fetchone()
+    return row[0] if row else 0
+
+async def get_bot_retry_windows():
+    async with pool.reader() as db:
+        async with db.execute("SELECT bot, retry_until FROM bot_rate_limits WHERE retry_until > ?", (time.time(),)) as cursor:
+            return {row[0]: row[1] for row in await cursor.fetchall()}
+
 async def upsert_user_from_telegram(telegram_id, username=None, first_name=None, last_name=None):
-    async with aiosqlite.connect(settings.DATABASE_URL) as db:
+    async with pool.writer() as db:
         await db.execute(
             """
             INSERT INTO users (telegram_id, username, first_name, last_name)
@@ -146,26 +1064,34 @@ async def upsert_user_from_telegram(telegram_id, username=None, first_name=None,
             """,
             (str(telegram_id), username, first_name, last_name),
         )
-        await db.commit()
+    user_status_cache.invalidate(str(telegram_id))
 
 async def set_user_status(telegram_id, status):
-    async with aiosqlite.connect(settings.DATABASE_URL) as db:
+    async with pool.writer() as db:
         approved_at = datetime.datetime.now().isoformat() if status == "approved" else None
         await db.execute(
             "UPDATE users SET status = ?, approved_at = ? WHERE telegram_id = ?",
             (status, approved_at, str(telegram_id)),
         )
-        await db.commit()
+    user_status_cache.invalidate(str(telegram_id))
 
 async def get_user_by_telegram_id(telegram_id):
-    async with aiosqlite.connect(settings.DATABASE_URL) as db:
-        db.row_factory = aiosqlite.Row
+    async with pool.reader() as db:
         async with db.execute("SELECT * FROM users WHERE telegram_id = ?", (str(telegram_id),)) as cursor:
             return await cursor.fetchone()
 
+async def get_user_status(telegram_id):
+    # Cached approval status ('' for unknown users) for per-request access checks
+    telegram_id = str(telegram_id)
+    status = user_status_cache.get(telegram_id)
+    if status is None:
+        user = await get_user_by_telegram_id(telegram_id)
+        status = user["status"] if user else ""
+        user_status_cache.set(telegram_id, status, settings.AUTH_CACHE_TTL if user else settings.AUTH_NEGATIVE_CACHE_TTL)
+    return status
+
 async def list_users(status=None):
-    async with aiosqlite.connect(settings.DATABASE_URL) as db:
-        db.row_factory = aiosqlite.Row
+    async with pool.reader() as db:
         query = "SELECT * FROM users"
         params = []
         if status:
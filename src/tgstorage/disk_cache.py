@@ -0,0 +1,230 @@
+from collections import OrderedDict
+from .config import settings
+import asyncio
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 256 * 1024
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+def _discard(path):
+    try: os.remove(path)
+    except OSError: pass
+
+def _scan(directory):
+    # Existing entries as (atime, name, size), dropping unfinished fills
+    os.makedirs(directory, exist_ok=True)
+    found = []
+    for entry in os.scandir(directory):
+        if not entry.is_file():
+            continue
+        if entry.name.endswith(".part"):
+            _discard(entry.path)
+            continue
+        stat = entry.stat()
+        found.append((stat.st_atime, entry.name, stat.st_size))
+    return sorted(found)
+
+def _cached_size(path):
+    try: return os.path.getsize(path)
+    except OSError: return None
+
+def _open_cached(path):
+    try: return open(path, "rb")
+    except OSError: return None
+
+def _create(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return open(path, "wb")
+
+def _close_quietly(handle):
+    try: handle.close()
+    except OSError: pass
+
+def _discard_all(paths):
+    for path in paths:
+        _discard(path)
+
+class DiskCache:
+    """Read-through cache of file bodies on local disk, bounded by total bytes
+    with LRU eviction. Entries are filled from the bytes a whole-file download
+    already fetched from Telegram and only become visible once complete, so
+    readers never see partial files."""
+
+    def __init__(self, directory, max_bytes, max_file_size):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._total = 0
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._fills = {}
+
+    @property
+    def enabled(self):
+        return bool(self.directory) and self.max_bytes > 0
+
+    def _path(self, file_id):
+        return os.path.join(self.directory, hashlib.sha256(file_id.encode()).hexdigest())
+
+    async def _load(self):
+        # Rebuild the index from disk once, oldest access first
+        async with self._load_lock:
+            if self._loaded:
+                return
+            for _, name, size in await asyncio.to_thread(_scan, self.directory):
+                self._entries[name] = size
+                self._total += size
+            self._loaded = True
+        await self._evict()
+
+    async def _evict(self):
+        victims = []
+        while self._total > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._total -= size
+            victims.append(os.path.join(self.directory, name))
+        if victims:
+            await asyncio.to_thread(_discard_all, victims)
+
+    async def open(self, file_id, size):
+        """Open the cached body of ``file_id`` for reading, or return None on a miss."""
+        if not self.enabled:
+            return None
+        if not self._loaded:
+            await self._load()
+        path = self._path(file_id)
+        name = os.path.basename(path)
+        if name not in self._entries:
+            # Another worker sharing the directory may have filled it already
+            if await asyncio.to_thread(_cached_size, path) != size:
+                self.misses += 1
+                return None
+            self._entries[name] = size
+            self._total += size
+            await self._evict()
+        handle = await asyncio.to_thread(_open_cached, path)
+        if handle is None:
+            self._total -= self._entries.pop(name, 0)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(name)
+        self.hits += 1
+        return handle
+
+    def tee(self, file_id, size, body):
+        """Wrap ``body``, an async iterator over the whole of ``file_id``, so the
+        bytes sent to the client are also written to the cache. The entry is
+        kept only if the client was sent all of it; a body that is not cached
+        (too big, already cached or being filled) is returned as is."""
+        if not self.enabled or size <= 0 or size > min(self.max_file_size, self.max_bytes):
+            return body
+        if os.path.basename(self._path(file_id)) in self._entries or file_id in self._fills:
+            return body
+        fill = object()
+        self._fills[file_id] = fill
+        return self._tee(file_id, size, body, fill)
+
+    async def _tee(self, file_id, size, body, fill):
+        path = self._path(file_id)
+        temp_path = f"{path}.{os.getpid()}.part"
+        handle = None
+        received = 0
+        complete = False
+        try:
+            try:
+                if not self._loaded:
+                    await self._load()
+                handle = await asyncio.to_thread(_create, temp_path)
+            except OSError as e:
+                logger.warning(f"Disk cache fill failed for {file_id}: {e}")
+            buffer = bytearray()
+            async for chunk in body:
+                received += len(chunk)
+                if handle is not None:
+                    buffer += chunk
+                    if len(buffer) >= WRITE_BUFFER_SIZE:
+                        handle = await self._write(file_id, handle, buffer)
+                yield chunk
+            if handle is not None and buffer:
+                handle = await self._write(file_id, handle, buffer)
+            if handle is not None:
+                await asyncio.to_thread(_close_quietly, handle)
+                handle = None
+                # Skipped if invalidate() dropped the fill while the client was served
+                if received == size and self._fills.get(file_id) is fill:
+                    try:
+                        await asyncio.to_thread(os.replace, temp_path, path)
+                        complete = True
+                    except OSError as e:
+                        logger.warning(f"Disk cache fill failed for {file_id}: {e}")
+        finally:
+            if self._fills.get(file_id) is fill:
+                del self._fills[file_id]
+            if handle is not None:
+                await asyncio.to_thread(_close_quietly, handle)
+            if complete:
+                name = os.path.basename(path)
+                self._total -= self._entries.pop(name, 0)
+                self._entries[name] = size
+                self._total += size
+                await self._evict()
+            else:
+                await asyncio.to_thread(_discard, temp_path)
+
+    @staticmethod
+    async def _write(file_id, handle, buffer):
+        # A disk error gives up the cache entry, never the client's download
+        data = bytes(buffer)
+        buffer.clear()
+        try:
+            await asyncio.to_thread(handle.write, data)
+            return handle
+        except OSError as e:
+            logger.warning(f"Disk cache fill failed for {file_id}: {e}")
+            await asyncio.to_thread(_close_quietly, handle)
+            return None
+
+    async def invalidate(self, file_id):
+        if not self.enabled:
+            return
+        self._fills.pop(file_id, None)
+        path = self._path(file_id)
+        self._total -= self._entries.pop(os.path.basename(path), 0)
+        await asyncio.to_thread(_discard, path)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._total,
+            "filling": len(self._fills),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+async def iter_file(handle, start_byte, end_byte, close=True):
+    def read_at(position, size):
+        handle.seek(position)
+        return handle.read(size)
+    try:
+        position = start_byte
+        while position <= end_byte:
+            data = await asyncio.to_thread(read_at, position, min(READ_CHUNK_SIZE, end_byte - position + 1))
+            if not data:
+                break
+            position += len(data)
+            yield data
+    finally:
+        if close:
+            handle.close()
+
+disk_cache = DiskCache(settings.DISK_CACHE_DIR, settings.DISK_CACHE_MAX_BYTES, settings.DISK_CACHE_MAX_FILE_SIZE)
@@ -0,0 +1,141 @@
+from collections import deque
+from .bot import cluster
+from .config import settings
+from .database import get_file_parts
+from .metrics import STAGE_SECONDS, BOT_BYTES
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+async def plan_segments(file_data, start_byte, end_byte):
+    """Map a byte range of a stored file onto the Telegram files backing it:
+    the file itself for regular uploads, or the overlapping parts of a chunked
+    upload. Returns ``(telegram_file_id, start, end)`` tuples in order."""
+    if not file_data['part_count']:
+        return [(file_data['storage_id'], start_byte, end_byte)]
+    segments = []
+    for part in await get_file_parts(file_data['storage_id']):
+        part_start = part['start_offset']
+        part_end = part_start + part['length'] - 1
+        if part_end < start_byte or part_start > end_byte:
+            continue
+        segments.append((part['file_id'], max(start_byte, part_start) - part_start, min(end_byte, part_end) - part_start))
+    return segments
+
+async def _read_body(response, bot, started):
+    """Yield a Telegram response body, recording time to first byte and bytes fetched."""
+    name = bot._custom_name if bot else "unknown"
+    first = True
+    async for chunk in response.aiter_bytes():
+        if first:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="telegram_ttfb")
+            first = False
+        BOT_BYTES.inc(len(chunk), bot=name, direction="down")
+        yield chunk
+
+def split_segments(segments, size):
+    """Cut segments into pieces of at most ``size`` bytes, keeping their order."""
+    pieces = []
+    for tg_file_id, start, end in segments:
+        for piece_start in range(start, end + 1, size):
+            pieces.append((tg_file_id, piece_start, min(end, piece_start + size - 1)))
+    return pieces
+
+async def iter_segments(segments, bot, first_url=None):
+    total = sum(end - start + 1 for _, start, end in segments)
+    if settings.DOWNLOAD_PARALLELISM > 1 and total >= settings.DOWNLOAD_PARALLEL_MIN_SIZE:
+        chunks = _iter_parallel(split_segments(segments, settings.DOWNLOAD_SEGMENT_SIZE), bot, first_url)
+    else:
+        chunks = _iter_sequential(segments, bot, first_url)
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await chunks.aclose()
+
+async def _iter_sequential(segments, bot, first_url=None):
+    client = cluster.get_http_client()
+    for index, (tg_file_id, start, end) in enumerate(segments):
+        url = first_url if index == 0 and first_url else await cluster.get_file_path(tg_file_id, bot)
+        headers = {"Range": f"bytes={start}-{end}"}
+        for attempt in range(2):
+            started = time.perf_counter()
+            async with client.stream("GET", url, headers=headers) as r:
+                if attempt == 0 and r.status_code in (401, 403, 404):
+                    # Cached link went stale before its TTL; resolve it again once
+                    cluster.file_paths.invalidate(tg_file_id)
+                    url = await cluster.get_file_path(tg_file_id, bot)
+                    continue
+                # An error page must never reach the client as file content
+                r.raise_for_status()
+                async for chunk in _read_body(r, bot, started):
+                    yield chunk
+            break
+
+async def _fetch_piece(client, piece, bot, url, queue):
+    tg_file_id, start, end = piece
+    headers = {"Range": f"bytes={start}-{end}"}
+    for attempt in range(2):
+        url = url or await cluster.get_file_path(tg_file_id, bot)
+        started = time.perf_counter()
+        async with client.stream("GET", url, headers=headers) as r:
+            if attempt == 0 and r.status_code in (401, 403, 404):
+                cluster.file_paths.invalidate(tg_file_id)
+                url = None
+                continue
+            r.raise_for_status()
+            async for chunk in _read_body(r, bot, started):
+                queue.put_nowait(chunk)
+        return
+
+async def _iter_parallel(pieces, bot, first_url=None):
+    # Pieces are fetched concurrently but yielded in order. The head piece is
+    # streamed as it arrives; later ones buffer in their queues, and no more
+    # than DOWNLOAD_READAHEAD pieces are in flight or buffered at once.
+    client = cluster.get_segment_client()
+    semaphore = asyncio.Semaphore(settings.DOWNLOAD_PARALLELISM)
+    readahead = max(settings.DOWNLOAD_READAHEAD, settings.DOWNLOAD_PARALLELISM)
+    upcoming = iter(enumerate(pieces))
+    window = deque()
+
+    async def fetch(index, piece, queue):
+        try:
+            async with semaphore:
+                await _fetch_piece(client, piece, bot, first_url if index == 0 else None, queue)
+        except Exception as e:
+            queue.put_nowait(e)
+        else:
+            queue.put_nowait(None)
+
+    def fill():
+        while len(window) < readahead:
+            item = next(upcoming, None)
+            if item is None:
+                return
+            queue = asyncio.Queue()
+            window.append((asyncio.create_task(fetch(*item, queue)), queue))
+
+    try:
+        fill()
+        while window:
+            _, queue = window[0]
+            while (item := await queue.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+            window.popleft()
+            fill()
+    finally:
+        for task, _ in window:
+            task.cancel()
+
+async def iter_range(file_data, start_byte, end_byte, bot):
+    segments = await plan_segments(file_data, start_byte, end_byte)
+    chunks = iter_segments(segments, bot)
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await chunks.aclose()
@@ -0,0 +1,185 @@
+from collections import deque
+from .config import settings
+from .downloads import iter_range
+import asyncio
+
+class FellBehind(Exception):
+    """The reader's next byte was already dropped from the shared buffer."""
+
+class Reader:
+    __slots__ = ("offset", "end")
+
+    def __init__(self, offset, end):
+        self.offset = offset
+        self.end = end
+
+class SharedFetch:
+    """One upstream fetch of bytes ``start..end`` of a stored file, read by any
+    number of clients at their own pace. Chunks are kept in a ring buffer of at
+    most ``capacity`` bytes: what every reader has passed is dropped, the fetch
+    pauses once it is half a buffer ahead of the fastest reader, and a reader
+    whose next byte had to be evicted gets FellBehind."""
+
+    def __init__(self, file_data, start, end, bot, capacity):
+        self.file_data = file_data
+        self.start = start
+        self.end = end
+        self.bot = bot
+        self.capacity = capacity
+        self.chunks = deque()
+        self.buffer_start = start
+        self.position = start
+        self.buffered = 0
+        self.readers = set()
+        self.done = False
+        self.error = None
+        self._data = asyncio.Event()
+        self._progress = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    def _notify_data(self):
+        self._data.set()
+        self._data = asyncio.Event()
+
+    def _notify_progress(self):
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+    async def _run(self):
+        chunks = iter_range(self.file_data, self.start, self.end, self.bot)
+        try:
+            async for chunk in chunks:
+                self.chunks.append((self.position, chunk))
+                self.position += len(chunk)
+                self.buffered += len(chunk)
+                self._trim()
+                self._notify_data()
+                while self.readers and self.position - max(r.offset for r in self.readers) >= self.capacity // 2:
+                    await self._progress.wait()
+                # Abandoned: stop here rather than by cancelling the task, which could
+                # interrupt httpx closing a response and leave its connection checked out
+                if not self.readers:
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify_data()
+            await chunks.aclose()
+
+    def _trim(self):
+        floor = min((r.offset for r in self.readers), default=self.position)
+        while self.chunks:
+            offset, chunk = self.chunks[0]
+            if offset + len(chunk) > floor and self.buffered <= self.capacity:
+                break
+            self.chunks.popleft()
+            self.buffered -= len(chunk)
+            self.buffer_start = offset + len(chunk)
+
+    def _slice(self, offset, end):
+        for chunk_offset, chunk in self.chunks:
+            if chunk_offset <= offset < chunk_offset + len(chunk):
+                return chunk[offset - chunk_offset:min(len(chunk), end - chunk_offset + 1)]
+        return None
+
+    def covers(self, offset, lookahead):
+        if self.error or (self.done and offset >= self.position):
+            return False
+        return self.buffer_start <= offset <= min(self.end, self.position + lookahead)
+
+    def attach(self, offset, end):
+        reader = Reader(offset, end)
+        self.readers.add(reader)
+        return reader
+
+    def detach(self, reader):
+        self.readers.discard(reader)
+        # The fastest reader may have been this one, or the last one
+        self._notify_progress()
+
+    async def read(self, reader):
+        """Yield the reader's bytes until its range or this fetch ends."""
+        while reader.offset <= reader.end:
+            if reader.offset < self.buffer_start:
+                raise FellBehind()
+            chunk = self._slice(reader.offset, reader.end)
+            if chunk:
+                reader.offset += len(chunk)
+                self._trim()
+                self._notify_progress()
+                yield chunk
+                continue
+            if self.error:
+                raise self.error
+            if self.done:
+                if reader.offset <= self.end:
+                    raise EOFError(f"Upstream ended at byte {self.position} of {self.start}-{self.end}")
+                return
+            await self._data.wait()
+
+class FanOut:
+    """Coalesces concurrent downloads: a reader of a stored file joins an
+    in-flight fetch whose buffer holds (or will soon reach) the byte it needs
+    instead of opening its own stream to Telegram. A reader that falls behind
+    a fetch continues from a new one that later laggards can join in turn."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._fetches = {}
+        self.upstreams = 0
+        self.joins = 0
+        self.fallbacks = 0
+
+    def _find(self, key, offset):
+        for fetch in self._fetches.get(key, ()):
+            if fetch.covers(offset, self.capacity // 2):
+                return fetch
+        return None
+
+    def _forget(self, key, fetch):
+        fetches = self._fetches.get(key)
+        if fetches and fetch in fetches:
+            fetches.remove(fetch)
+            if not fetches:
+                del self._fetches[key]
+
+    async def stream(self, file_data, start, end, bot):
+        if not self.capacity:
+            async for chunk in iter_range(file_data, start, end, bot):
+                yield chunk
+            return
+        key = file_data['storage_id']
+        offset = start
+        while offset <= end:
+            fetch = self._find(key, offset)
+            if fetch is None:
+                fetch = SharedFetch(file_data, offset, end, bot, self.capacity)
+                self._fetches.setdefault(key, []).append(fetch)
+                self.upstreams += 1
+            else:
+                self.joins += 1
+            reader = fetch.attach(offset, end)
+            try:
+                async for chunk in fetch.read(reader):
+                    yield chunk
+            except FellBehind:
+                self.fallbacks += 1
+            finally:
+                offset = reader.offset
+                fetch.detach(reader)
+                if not fetch.readers:
+                    self._forget(key, fetch)
+
+    def stats(self):
+        fetches = [fetch for group in self._fetches.values() for fetch in group]
+        return {
+            "upstreams": self.upstreams,
+            "joins": self.joins,
+            "fallbacks": self.fallbacks,
+            "active": len(fetches),
+            "readers": sum(len(fetch.readers) for fetch in fetches),
+            "buffered_bytes": sum(fetch.buffered for fetch in fetches),
+        }
+
+fanout = FanOut(settings.FANOUT_BUFFER_SIZE)
@@ -2,8 +2,7 @@ import secrets
 import asyncio
 import argparse
 import aiosqlite
-from .database import init_db
-from .config import settings
+from .database import init_db, close_db, create_api_key
 
 async def create_key(owner: str, custom_key: str = None):
     # Ensure DB is initialized
@@ -11,18 +10,15 @@ async def create_key(owner: str, custom_key: str = None):
     
     new_key = custom_key or f"TGSTORAGE-{secrets.token_urlsafe(32)}"
     
-    async with aiosqlite.connect(settings.DATABASE_URL) as db:
-        try:
-            await db.execute(
-                "INSERT INTO api_keys (key, owner) VALUES (?, ?)",
-                (new_key, owner)
-            )
-            await db.commit()
-            print(f"✅ API Key created successfully for: {owner}")
-            print(f"🔑 Key: {new_key}")
-            print("⚠️ Save this key safely! It will not be shown again.")
-        except aiosqlite.IntegrityError:
-            print(f"❌ Error: The key or owner '{owner}' already exists.")
+    try:
+        await create_api_key(new_key, owner)
+        print(f"✅ API Key created successfully for: {owner}")
+        print(f"🔑 Key: {new_key}")
+        print("⚠️ Save this key safely! It will not be shown again.")
+    except aiosqlite.IntegrityError:
+        print(f"❌ Error: The key or owner '{owner}' already exists.")
+    finally:
+        await close_db()
 
 def cli_main():
     parser = argparse.ArgumentParser(description="Generate API Keys for TG Storage Cluster")
@@ -0,0 +1,45 @@
+from .config import settings
+import hashlib
+
+# Content hashes identify stored bytes for dedup and ETags. A file is hashed in
+# CHUNK_SIZE pieces, the same pieces it is sent to Telegram in: up to one piece
+# the hash is the plain SHA-256 of the content, above that it is the SHA-256 of
+# the pieces' digests in order. Each piece is hashed by whatever reads it to
+# send it, in any order and on any worker, so no upload path reads its bytes twice.
+
+def piece_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+def combine(digests):
+    """Content hash from the hex digests of a file's pieces, in order."""
+    digests = list(digests)
+    if len(digests) == 1:
+        return digests[0]
+    return hashlib.sha256(b"".join(bytes.fromhex(digest) for digest in digests)).hexdigest()
+
+class ContentHasher:
+    """The content hash of a stream of any-sized blocks."""
+
+    def __init__(self, piece_size=None):
+        self.piece_size = piece_size or settings.CHUNK_SIZE
+        self._digests = []
+        self._piece = hashlib.sha256()
+        self._filled = 0
+
+    def update(self, data):
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.piece_size - self._filled)
+            self._piece.update(view[:take])
+            self._filled += take
+            view = view[take:]
+            if self._filled == self.piece_size:
+                self._digests.append(self._piece.hexdigest())
+                self._piece = hashlib.sha256()
+                self._filled = 0
+
+    def hexdigest(self):
+        digests = list(self._digests)
+        if self._filled or not digests:
+            digests.append(self._piece.hexdigest())
+        return combine(digests)
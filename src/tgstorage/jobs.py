@@ -0,0 +1,307 @@
+from .bot import cluster, ClusterBusy
+from .channels import placement
+from .config import settings
+from .database import (
+    create_upload_job, get_upload_job, claim_upload_job, renew_upload_job, record_upload_job_send, retry_upload_job,
+    fail_upload_job, finish_upload_job, count_upload_jobs, delete_finished_upload_jobs
+)
+from .hashing import ContentHasher
+import asyncio
+import httpx
+import ipaddress
+import json
+import logging
+import os
+import secrets
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+# A running job's claim is renewed this often; one not renewed for CLAIM_TIMEOUT
+# seconds belonged to a worker that died and is taken over
+CLAIM_RENEW_INTERVAL = 30
+CLAIM_TIMEOUT = 120
+# Idle workers also look for retries that came due and jobs queued by other processes
+POLL_INTERVAL = 2.0
+RETRY_BASE_DELAY = 5.0
+CALLBACK_ATTEMPTS = 3
+RECORD_ATTEMPTS = 3
+CALLBACK_TIMEOUT = 10.0
+
+class UnsafeCallback(ValueError):
+    """A callback URL that is not http(s) or points at a non-public address."""
+
+async def resolve_callback(url):
+    """Check ``url`` and resolve its host, returning ``(url, address)``. Raises
+    UnsafeCallback unless every address the host resolves to is public or the
+    host is in CALLBACK_ALLOWED_HOSTS, so API keys cannot reach internal
+    services or cloud metadata endpoints through the server."""
+    try:
+        target = httpx.URL(url)
+    except (httpx.InvalidURL, TypeError):
+        raise UnsafeCallback("callback_url is not a valid URL")
+    if target.scheme not in ("http", "https") or not target.host:
+        raise UnsafeCallback("callback_url must be an http(s) URL")
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(target.host, target.port, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise UnsafeCallback(f"callback_url host {target.host} does not resolve")
+    addresses = [ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos]
+    if target.host.lower() not in settings.callback_allowed_hosts:
+        for address in addresses:
+            if not address.is_global:
+                raise UnsafeCallback(f"callback_url host {target.host} resolves to a non-public address")
+    return target, addresses[0]
+
+def _discard(path):
+    try: os.remove(path)
+    except OSError: pass
+
+def _stage(source, path):
+    # Copies the body and hashes it in the same pass
+    hasher = ContentHasher()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    source.seek(0)
+    with open(path, "wb") as f:
+        while block := source.read(WRITE_BUFFER_SIZE):
+            hasher.update(block)
+            f.write(block)
+    return hasher.hexdigest()
+
+class UploadJobs:
+    """Asynchronous uploads: the body is staged on disk and a job row queued,
+    so the client gets its answer before Telegram is involved. A pool of
+    workers per process drains the queue, sending through the cluster and
+    retrying with backoff; jobs are persisted and picked up again after a
+    restart. The outcome is polled or POSTed to the job's callback URL."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.node = socket.gethostname()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.callbacks_failed = 0
+        self._workers = []
+        self._callbacks = set()
+        self._wake = asyncio.Event()
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, "jobs", job_id)
+
+    async def stage(self, source):
+        """Stage the seekable ``source`` for a new job. Returns the job id and
+        the content hash of the body."""
+        job_id = secrets.token_urlsafe(16)
+        try:
+            content_hash = await asyncio.to_thread(_stage, source, self._path(job_id))
+        except BaseException:
+            await self.discard(job_id)
+            raise
+        return job_id, content_hash
+
+    async def discard(self, job_id):
+        await asyncio.to_thread(_discard, self._path(job_id))
+
+    async def enqueue(self, job_id, job):
+        """Queue the staged ``job_id`` with the row fields in ``job``."""
+        try:
+            await create_upload_job(dict(job, job_id=job_id, node=self.node))
+        except BaseException:
+            await self.discard(job_id)
+            raise
+        self._wake.set()
+
+    def start(self):
+        if self._workers:
+            return
+        count = settings.UPLOAD_JOB_WORKERS or max(1, len(cluster.bots))
+        self._workers = [asyncio.create_task(self._work()) for _ in range(count)]
+        logger.info(f"Started {count} upload job workers")
+
+    async def stop(self):
+        # Jobs left running are taken over once their claim goes stale
+        for task in self._workers + list(self._callbacks):
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._callbacks, return_exceptions=True)
+        self._workers = []
+
+    async def _work(self):
+        while True:
+            self._wake.clear()
+            try:
+                job = await claim_upload_job(self.node, time.time() - CLAIM_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Claiming an upload job failed: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _renew(self, job_id):
+        while True:
+            await asyncio.sleep(CLAIM_RENEW_INTERVAL)
+            try: await renew_upload_job(job_id)
+            except Exception as e: logger.warning(f"Renewing upload job {job_id} failed: {e}")
+
+    async def _run(self, job):
+        job_id = job['job_id']
+        renew = asyncio.create_task(self._renew(job_id))
+        try:
+            await self._send(job)
+        except Exception as e:
+            logger.error(f"Upload job {job_id} ({job['file_name']}) attempt {job['attempts']} failed: {e}")
+            await self._failed(job, e)
+        else:
+            self.sent += 1
+            await asyncio.to_thread(_discard, self._path(job_id))
+            self._notify(job_id)
+        finally:
+            renew.cancel()
+
+    async def _send(self, job):
+        job_id = job['job_id']
+        if job['sent']:
+            # An earlier attempt got the file to Telegram but not its row written
+            sent = json.loads(job['sent'])
+        else:
+            channel_id = placement.pick(job['owner_key'])
+            handle = await asyncio.to_thread(open, self._path(job_id), "rb")
+            try:
+                file_id, message_id, parts = await cluster.send_file(
+                    channel_id, handle, job['file_size'], job['file_name'], job['mime_type']
+                )
+            finally:
+                handle.close()
+            sent = {"file_id": file_id, "message_id": message_id, "parts": parts, "channel_id": channel_id}
+            await self._write(record_upload_job_send, job_id, sent)
+        await finish_upload_job(job_id, {
+            "file_id": sent['file_id'],
+            "message_id": sent['message_id'],
+            "file_name": job['file_name'],
+            "file_size": job['file_size'],
+            "mime_type": job['mime_type'],
+            "expiration_date": job['expiration_date'],
+            "share_token": job['share_token'],
+            "password": job['password'],
+            "owner_key": job['owner_key'],
+            "content_hash": job['content_hash'],
+            "parts": sent['parts'],
+            "channel_id": sent['channel_id'],
+        })
+
+    @staticmethod
+    async def _write(write, *args):
+        # The file is on Telegram at this point; a lost write would send it twice
+        for attempt in range(RECORD_ATTEMPTS):
+            try:
+                return await write(*args)
+            except Exception as e:
+                if attempt == RECORD_ATTEMPTS - 1:
+                    raise
+                logger.warning(f"Recording a sent upload job failed, retrying: {e}")
+                await asyncio.sleep(2 ** attempt)
+
+    async def _failed(self, job, error):
+        job_id = job['job_id']
+        attempts = job['attempts']
+        try:
+            if isinstance(error, ClusterBusy):
+                # Nothing was sent; waiting out the queue does not use up an attempt
+                delay, attempts = error.retry_after, attempts - 1
+            elif isinstance(error, FileNotFoundError) or attempts >= settings.UPLOAD_JOB_MAX_ATTEMPTS:
+                # A lost staging file cannot be retried
+                self.failed += 1
+                await fail_upload_job(job_id, str(error))
+                await asyncio.to_thread(_discard, self._path(job_id))
+                await self._discard_sent(job_id)
+                self._notify(job_id)
+                return
+            else:
+                delay = RETRY_BASE_DELAY * 2 ** (attempts - 1)
+            self.retried += 1
+            await retry_upload_job(job_id, time.time() + delay, str(error), attempts)
+        except Exception as e:
+            # The claim lapses and another attempt picks the job up
+            logger.error(f"Recording the outcome of upload job {job_id} failed: {e}")
+
+    async def _discard_sent(self, job_id):
+        # A job that never got its row keeps nothing on Telegram either
+        job = await get_upload_job(job_id)
+        if not job or not job['sent']:
+            return
+        sent = json.loads(job['sent'])
+        message_ids = [part['message_id'] for part in sent['parts']] if sent['parts'] else [sent['message_id']]
+        await cluster.delete_stored_messages({sent['channel_id']: message_ids})
+
+    def _notify(self, job_id):
+        task = asyncio.create_task(self._callback(job_id))
+        self._callbacks.add(task)
+        task.add_done_callback(self._callbacks.discard)
+
+    async def _callback(self, job_id):
+        job = await get_upload_job(job_id)
+        if not job or not job['callback_url']:
+            return
+        payload = self.describe(job)
+        async with httpx.AsyncClient(timeout=CALLBACK_TIMEOUT, follow_redirects=False) as client:
+            for attempt in range(CALLBACK_ATTEMPTS):
+                try:
+                    # Checked again on every attempt and the checked address is the one
+                    # connected to, so a DNS change cannot redirect the POST inward
+                    target, address = await resolve_callback(job['callback_url'])
+                    response = await client.post(
+                        target.copy_with(host=str(address)), json=payload,
+                        headers={"Host": target.netloc.decode("ascii")},
+                        extensions={"sni_hostname": target.host},
+                    )
+                    if response.is_redirect:
+                        raise httpx.HTTPError(f"Redirected to {response.headers.get('location')}, not followed")
+                    response.raise_for_status()
+                    return
+                except UnsafeCallback as e:
+                    logger.warning(f"Callback for upload job {job_id} refused: {e}")
+                    break
+                except httpx.HTTPError as e:
+                    logger.warning(f"Callback for upload job {job_id} to {job['callback_url']} failed: {e}")
+                    await asyncio.sleep(2 ** attempt)
+        self.callbacks_failed += 1
+
+    @staticmethod
+    def describe(job):
+        status = {
+            "job_id": job['job_id'],
+            "status": job['status'],
+            "file_name": job['file_name'],
+            "file_size": job['file_size'],
+            "attempts": job['attempts'],
+            "error": job['error'],
+            "created_at": job['created_at'],
+            "updated_at": job['updated_at'],
+        }
+        if job['status'] == "done":
+            status["file_id"] = job['file_id']
+            status["direct_link"] = f"{settings.BASE_URL}/dl/{job['file_id']}/{job['file_name']}"
+            status["share_link"] = f"{settings.BASE_URL}/share/{job['share_token']}"
+        return status
+
+    async def expire_finished(self):
+        return await delete_finished_upload_jobs(time.time() - settings.UPLOAD_JOB_TTL)
+
+    async def stats(self):
+        return {
+            "workers": len(self._workers),
+            "jobs": await count_upload_jobs(),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "callbacks_failed": self.callbacks_failed,
+        }
+
+upload_jobs = UploadJobs(settings.UPLOAD_STAGING_DIR)
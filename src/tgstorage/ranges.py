@@ -0,0 +1,130 @@
+from email.utils import format_datetime, parsedate_to_datetime
+import datetime
+import hashlib
+import re
+
+# Requests for more ranges than this get the whole file instead
+MAX_RANGES = 16
+
+RANGE_SPEC = re.compile(r"(\d*)-(\d*)", re.ASCII)
+
+class RangeNotSatisfiable(Exception):
+    """None of the requested ranges overlaps the file (answered with 416)."""
+
+def parse_range(header, size):
+    """Parse a Range header (RFC 7233) for a file of ``size`` bytes into sorted,
+    non-overlapping inclusive ``(start, end)`` pairs, covering ``first-last``,
+    open-ended ``first-`` and suffix ``-length`` specs. Returns None when the
+    header is to be ignored and the whole file sent (another unit, bad syntax,
+    too many ranges); raises RangeNotSatisfiable when no range fits the file."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    ranges = []
+    seen = False
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        match = RANGE_SPEC.fullmatch(part)
+        if not match or match.groups() == ("", ""):
+            return None
+        seen = True
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            end = int(last) if last else size - 1
+            if start < size:
+                ranges.append((start, min(end, size - 1)))
+        elif int(last) > 0 and size > 0:
+            ranges.append((max(0, size - int(last)), size - 1))
+    if not seen:
+        return None
+    if not ranges:
+        raise RangeNotSatisfiable(f"bytes */{size}")
+    if len(ranges) > MAX_RANGES:
+        return None
+    # Overlapping and adjacent ranges are coalesced, which RFC 7233 allows
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def file_etag(file_data):
+    # Stored content never changes under a storage id, so this is a strong validator
+    source = file_data['content_hash'] or f"{file_data['storage_id']}:{file_data['file_size']}"
+    return f'"{hashlib.sha256(source.encode()).hexdigest()[:32]}"'
+
+def file_last_modified(file_data):
+    try:
+        uploaded = datetime.datetime.fromisoformat(str(file_data['upload_date']))
+    except (TypeError, ValueError):
+        return None
+    # SQLite CURRENT_TIMESTAMP is UTC
+    return uploaded.replace(tzinfo=datetime.timezone.utc, microsecond=0)
+
+def http_date(value):
+    return format_datetime(value, usegmt=True)
+
+def parse_http_date(value):
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+def _opaque(tag):
+    return tag[2:] if tag.startswith("W/") else tag
+
+def not_modified(headers, etag, last_modified):
+    """RFC 7232 evaluation for GET/HEAD: If-None-Match (weak comparison) takes
+    precedence, If-Modified-Since only applies without it."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        return _opaque(etag) in {_opaque(tag.strip()) for tag in if_none_match.split(",")}
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        since = parse_http_date(if_modified_since)
+        return since is not None and last_modified <= since
+    return False
+
+def if_range_matches(value, etag, last_modified):
+    """Whether a Range may be honored under If-Range: only an exact (strong)
+    ETag or Last-Modified match; anything else gets the whole file."""
+    value = value.strip()
+    if value.startswith(('"', "W/")):
+        return value == etag
+    since = parse_http_date(value)
+    return since is not None and last_modified is not None and since == last_modified
+
+def multipart_header(boundary, content_type, start, end, size):
+    return (
+        f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+        f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+    ).encode()
+
+def multipart_trailer(boundary):
+    return f"--{boundary}--\r\n".encode()
+
+def multipart_length(ranges, boundary, content_type, size):
+    length = len(multipart_trailer(boundary))
+    for start, end in ranges:
+        # Part header, body and the CRLF that ends the part
+        length += len(multipart_header(boundary, content_type, start, end, size)) + end - start + 1 + 2
+    return length
+
+async def iter_multipart(ranges, boundary, content_type, size, read_range):
+    """multipart/byteranges body; ``read_range(start, end)`` yields each part's bytes."""
+    for start, end in ranges:
+        yield multipart_header(boundary, content_type, start, end, size)
+        async for chunk in read_range(start, end):
+            yield chunk
+        yield b"\r\n"
+    yield multipart_trailer(boundary)
@@ -0,0 +1,30 @@
+import asyncio
+import argparse
+from .database import init_db, close_db, verify_stats
+
+async def check_stats(rebuild: bool = False):
+    await init_db()
+    try:
+        drift = await verify_stats(rebuild=rebuild)
+    finally:
+        await close_db()
+
+    if not drift:
+        print("✅ Stats counters match the files and upload_jobs tables.")
+        return
+    for scope, values in sorted(drift.items()):
+        print(f"⚠️ {scope}: stored={values['stored']} actual={values['actual']}")
+    if rebuild:
+        print(f"🔧 Rebuilt counters ({len(drift)} scopes had drifted).")
+    else:
+        print(f"❌ {len(drift)} scopes drifted. Run with --rebuild to fix them.")
+
+def cli_main():
+    parser = argparse.ArgumentParser(description="Verify or rebuild the /stats counters of TG Storage Cluster")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute all counters from the files and upload_jobs tables")
+
+    args = parser.parse_args()
+    asyncio.run(check_stats(args.rebuild))
+
+if __name__ == "__main__":
+    cli_main()
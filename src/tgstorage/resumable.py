@@ -0,0 +1,308 @@
+from .bot import cluster
+from .channels import placement, stored_channel
+from .config import settings
+from .database import (
+    create_upload_session, get_upload_session, set_upload_received, claim_upload_part,
+    complete_upload_part, release_upload_part, get_upload_session_parts, finish_upload_session,
+    delete_upload_session, get_stale_upload_sessions
+)
+from .hashing import piece_digest, combine
+import asyncio
+import logging
+import os
+import secrets
+import shutil
+import time
+
+logger = logging.getLogger(__name__)
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+# A part claimed for sending longer ago than this is presumed abandoned by a dead worker
+PART_CLAIM_TIMEOUT = 600
+
+class UploadConflict(Exception):
+    """The client's offset does not match what the server holds; ``offset``
+    is where the client has to resume from."""
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+class UploadPending(Exception):
+    """Parts of a complete upload are still being sent by another worker."""
+
+def _open_part(path, size):
+    handle = open(path, "ab")
+    # Drop bytes past the stored offset, left behind by a request that died mid-write
+    handle.truncate(size)
+    return handle
+
+def _staged_size(path):
+    try: return os.path.getsize(path)
+    except OSError: return 0
+
+def _read_part(path):
+    # The part is hashed from the same read that sends it
+    with open(path, "rb") as handle:
+        data = handle.read()
+    return data, piece_digest(data)
+
+def _discard(path):
+    try: os.remove(path)
+    except OSError: pass
+
+class ResumableUploads:
+    """Uploads that survive dropped connections and restarts. A session is
+    created with the final size; the body then arrives as any number of PUTs
+    at the received offset. Each ``part_size`` piece is sent to Telegram as
+    soon as it is complete, so only the current part is ever staged on disk."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._locks = {}
+        self._sending = {}
+
+    def _session_dir(self, upload_id):
+        return os.path.join(self.directory, upload_id)
+
+    def _part_path(self, upload_id, index):
+        return os.path.join(self.directory, upload_id, f"{index:05d}")
+
+    @staticmethod
+    def part_count(session):
+        return -(-session['file_size'] // session['part_size'])
+
+    async def create(self, owner_key, file_name, file_size, mime_type, expiration_date=None, password=None):
+        upload_id = secrets.token_urlsafe(16)
+        await asyncio.to_thread(os.makedirs, self._session_dir(upload_id), exist_ok=True)
+        # Every part of a session goes to the channel chosen here
+        await create_upload_session(
+            upload_id, owner_key, file_name, file_size, mime_type, expiration_date, password, settings.CHUNK_SIZE,
+            placement.pick(owner_key),
+        )
+        return await get_upload_session(upload_id)
+
+    async def write(self, upload_id, offset, stream):
+        """Append the async byte iterator ``stream`` at ``offset`` and return the
+        new received offset. Bytes that arrived before the stream broke off are
+        kept, so the client resumes from wherever its connection dropped."""
+        async with self._locks.setdefault(upload_id, asyncio.Lock()):
+            session = await get_upload_session(upload_id)
+            if session is None:
+                raise KeyError(upload_id)
+            received = session['received']
+            if offset != received:
+                raise UploadConflict(f"Upload is at offset {received}", received)
+            file_size, part_size = session['file_size'], session['part_size']
+            if received == file_size:
+                # A retried PUT after the last byte: the final part may already be
+                # sent and unstaged, so only an empty body is acceptable
+                async for chunk in stream:
+                    if chunk:
+                        raise ValueError(f"Body exceeds the declared size of {file_size} bytes")
+                return received
+
+            part_start = received - received % part_size
+            if received > part_start:
+                index = part_start // part_size
+                staged = await asyncio.to_thread(_staged_size, self._part_path(upload_id, index))
+                if staged < received - part_start and not await self._part_sent(upload_id, index):
+                    # Staged bytes were lost (e.g. a wiped disk): restart the current part
+                    await set_upload_received(upload_id, received, part_start)
+                    raise UploadConflict(f"Staged data lost, resume at offset {part_start}", part_start)
+
+            position = received
+            stored = received
+            buffer = bytearray()
+            handle = None
+            overflow = False
+
+            async def flush():
+                nonlocal position, stored, handle
+                data = bytes(buffer)
+                buffer.clear()
+                written = 0
+                while written < len(data):
+                    index = position // part_size
+                    part_end = min((index + 1) * part_size, file_size)
+                    if handle is None:
+                        handle = await asyncio.to_thread(_open_part, self._part_path(upload_id, index), position - index * part_size)
+                    take = min(len(data) - written, part_end - position)
+                    await asyncio.to_thread(handle.write, data[written:written + take])
+                    written += take
+                    position += take
+                    if position == part_end:
+                        await asyncio.to_thread(handle.close)
+                        handle = None
+                        # Persist the offset before sending, since a sent part leaves the staging dir
+                        if not await set_upload_received(upload_id, stored, position):
+                            raise UploadConflict("Upload was modified concurrently", position)
+                        stored = position
+                        self._schedule(session, index)
+
+            try:
+                async for chunk in stream:
+                    room = file_size - position - len(buffer)
+                    if len(chunk) > room:
+                        chunk = chunk[:room]
+                        overflow = True
+                    buffer += chunk
+                    if len(buffer) >= WRITE_BUFFER_SIZE:
+                        await flush()
+                    if overflow:
+                        break
+            finally:
+                try:
+                    if buffer:
+                        await flush()
+                finally:
+                    if handle is not None:
+                        await asyncio.to_thread(handle.close)
+                    if position != stored and await set_upload_received(upload_id, stored, position):
+                        stored = position
+            if overflow:
+                raise ValueError(f"Body exceeds the declared size of {file_size} bytes")
+            return stored
+
+    async def _part_sent(self, upload_id, index):
+        parts = await get_upload_session_parts(upload_id)
+        return any(part['part_index'] == index and part['message_id'] is not None for part in parts)
+
+    def _schedule(self, session, index):
+        key = (session['upload_id'], index)
+        if key in self._sending:
+            return
+        task = asyncio.create_task(self._send_part(session, index))
+        self._sending[key] = task
+
+        def _done(t):
+            self._sending.pop(key, None)
+            if not t.cancelled() and t.exception():
+                # The part stays staged; complete() sends it again
+                logger.error(f"Sending part {index} of upload {key[0]} failed: {t.exception()}")
+
+        task.add_done_callback(_done)
+
+    async def _send_part(self, session, index):
+        upload_id = session['upload_id']
+        if not await claim_upload_part(upload_id, index, time.time() - PART_CLAIM_TIMEOUT):
+            return False
+        path = self._part_path(upload_id, index)
+        channel_id = stored_channel(session)
+        try:
+            data, digest = await asyncio.to_thread(_read_part, path)
+            if self.part_count(session) == 1:
+                # A single-part upload is stored like a regular upload
+                if "video" in (session['mime_type'] or "").lower():
+                    message = await asyncio.wait_for(
+                        cluster.send_video(channel_id, data, session['file_name']), timeout=600
+                    )
+                else:
+                    message = await asyncio.wait_for(
+                        cluster.send_document(channel_id, data, session['file_name']), timeout=300
+                    )
+            else:
+                message = await asyncio.wait_for(
+                    cluster.send_document(channel_id, data, f"{session['file_name']}.part{index:04d}"),
+                    timeout=300
+                )
+        except BaseException:
+            await release_upload_part(upload_id, index)
+            raise
+        media = message.video or message.document
+        await complete_upload_part(upload_id, index, media.file_id, message.message_id, digest)
+        await asyncio.to_thread(_discard, path)
+        return True
+
+    async def status(self, session):
+        parts = await get_upload_session_parts(session['upload_id'])
+        return {
+            "upload_id": session['upload_id'],
+            "file_name": session['file_name'],
+            "file_size": session['file_size'],
+            "part_size": session['part_size'],
+            "offset": session['received'],
+            "parts_total": self.part_count(session),
+            "parts_sent": sum(1 for part in parts if part['message_id'] is not None),
+        }
+
+    async def complete(self, upload_id, share_token):
+        """Turn a fully received session into a file row, sending whatever
+        parts are still unsent. With dedup, content that is already stored is
+        linked to and the session's parts deleted. Returns the row written."""
+        async with self._locks.setdefault(upload_id, asyncio.Lock()):
+            session = await get_upload_session(upload_id)
+            if session is None:
+                raise KeyError(upload_id)
+            if session['received'] != session['file_size']:
+                raise UploadConflict("Upload is incomplete", session['received'])
+            sending = [task for (uid, _), task in self._sending.items() if uid == upload_id]
+            await asyncio.gather(*sending, return_exceptions=True)
+
+            sent = {part['part_index']: part for part in await get_upload_session_parts(upload_id) if part['message_id'] is not None}
+            for index in range(self.part_count(session)):
+                if index not in sent and not await self._send_part(session, index):
+                    raise UploadPending("Parts are still being sent to Telegram")
+            parts = await get_upload_session_parts(upload_id)
+
+            row = {
+                "file_name": session['file_name'],
+                "file_size": session['file_size'],
+                "mime_type": session['mime_type'],
+                "expiration_date": session['expiration_date'],
+                "share_token": share_token,
+                "password": session['password'],
+                "owner_key": session['owner_key'],
+                "message_id": parts[0]['message_id'],
+                "channel_id": stored_channel(session),
+                # Parts sent before their digests were recorded leave the file unhashed
+                "content_hash": combine(part['sha256'] for part in parts) if all(part['sha256'] for part in parts) else None,
+            }
+            if len(parts) == 1:
+                row["file_id"] = parts[0]['file_id']
+            else:
+                row["file_id"] = f"mp_{secrets.token_urlsafe(16)}"
+                row["parts"] = [
+                    {
+                        "part_index": part['part_index'],
+                        "file_id": part['file_id'],
+                        "message_id": part['message_id'],
+                        "offset": part['part_index'] * session['part_size'],
+                        "length": min(session['part_size'], session['file_size'] - part['part_index'] * session['part_size']),
+                    }
+                    for part in parts
+                ]
+            duplicate = None
+            if settings.DEDUP_UPLOADS and row["content_hash"]:
+                duplicate = dict(row, file_id=f"ref_{secrets.token_urlsafe(16)}")
+            if await finish_upload_session(upload_id, row, duplicate):
+                logger.info(f"{row['file_name']} is already stored, linked as {duplicate['file_id']}")
+                await cluster.delete_messages(row["channel_id"], [part['message_id'] for part in parts])
+                row = duplicate
+        self._locks.pop(upload_id, None)
+        await asyncio.to_thread(shutil.rmtree, self._session_dir(upload_id), True)
+        return row
+
+    async def abort(self, upload_id):
+        """Drop a session along with its staged bytes and any parts already sent."""
+        for (uid, _), task in list(self._sending.items()):
+            if uid == upload_id:
+                task.cancel()
+        async with self._locks.setdefault(upload_id, asyncio.Lock()):
+            session = await get_upload_session(upload_id)
+            parts = await get_upload_session_parts(upload_id)
+            await delete_upload_session(upload_id)
+        self._locks.pop(upload_id, None)
+        await asyncio.to_thread(shutil.rmtree, self._session_dir(upload_id), True)
+        message_ids = [part['message_id'] for part in parts if part['message_id'] is not None]
+        if message_ids and session:
+            await cluster.delete_messages(stored_channel(session), message_ids)
+
+    async def expire_stale(self):
+        stale = await get_stale_upload_sessions(time.time() - settings.UPLOAD_SESSION_TTL)
+        for session in stale:
+            logger.info(f"Aborting idle upload session {session['upload_id']} ({session['file_name']})")
+            await self.abort(session['upload_id'])
+        return len(stale)
+
+resumable_uploads = ResumableUploads(settings.UPLOAD_STAGING_DIR)
@@ -0,0 +1,86 @@
+from .bot import cluster
+from .config import settings
+from .database import get_expired_files, delete_files_db
+from .disk_cache import disk_cache
+from .jobs import upload_jobs
+from .resumable import resumable_uploads
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class ExpirySweeper:
+    """Deletes expired files in pages of SWEEP_BATCH_SIZE rows: each page's
+    rows go in one transaction, then the Telegram messages nothing references
+    any more are removed across the whole bot cluster. Idle resumable upload
+    sessions are aborted and old upload jobs forgotten in the same pass. Progress is kept for /stats."""
+
+    def __init__(self):
+        self.running = False
+        self.runs = 0
+        self.files_deleted = 0
+        self.messages_deleted = 0
+        self.message_failures = 0
+        self.current_run_files = 0
+        self.last_started = None
+        self.last_finished = None
+        self.last_duration = None
+        self.last_error = None
+
+    async def sweep(self):
+        if self.running:
+            return 0
+        self.running = True
+        self.current_run_files = 0
+        self.last_started = time.time()
+        started = time.monotonic()
+        try:
+            while True:
+                files = await get_expired_files(limit=settings.SWEEP_BATCH_SIZE)
+                if not files:
+                    break
+                file_ids = [f['file_id'] for f in files]
+                # Rows go first; only content no other row references is removed
+                storage_ids, messages = await delete_files_db(file_ids)
+                for storage_id in storage_ids:
+                    await disk_cache.invalidate(storage_id)
+                failed = await cluster.delete_stored_messages(messages, concurrency=settings.SWEEP_CONCURRENCY or None)
+                self.messages_deleted += sum(len(message_ids) for message_ids in messages.values()) - failed
+                self.message_failures += failed
+                self.files_deleted += len(file_ids)
+                self.current_run_files += len(file_ids)
+                logger.info(f"Expiry sweep: removed {self.current_run_files} files so far ({failed} message deletions failed)")
+            await resumable_uploads.expire_stale()
+            await upload_jobs.expire_finished()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Expiry sweep failed: {e}")
+        finally:
+            self.running = False
+            self.runs += 1
+            self.last_finished = time.time()
+            self.last_duration = round(time.monotonic() - started, 3)
+        return self.current_run_files
+
+    async def run_forever(self):
+        while True:
+            await self.sweep()
+            await asyncio.sleep(settings.SWEEP_INTERVAL)
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "runs": self.runs,
+            "files_deleted": self.files_deleted,
+            "messages_deleted": self.messages_deleted,
+            "message_failures": self.message_failures,
+            "current_run_files": self.current_run_files,
+            "last_started": self.last_started,
+            "last_finished": self.last_finished,
+            "last_duration_seconds": self.last_duration,
+            "last_error": self.last_error,
+        }
+
+sweeper = ExpirySweeper()
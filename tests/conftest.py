@@ -0,0 +1,76 @@
+import os
+import tempfile
+
+# Settings are read once at import, so the environment has to be in place
+# before anything from tgstorage is imported
+_scratch = tempfile.mkdtemp(prefix="tgstorage-tests-")
+os.environ.update(
+    DATABASE_URL=os.path.join(_scratch, "storage.db"),
+    UPLOAD_STAGING_DIR=os.path.join(_scratch, "staging"),
+    CHANNEL_ID="-1001",
+    ADMIN_API_KEY="test-admin-key",
+    WORKERS="1",
+)
+os.environ.pop("DISK_CACHE_DIR", None)
+
+import pytest
+from types import SimpleNamespace
+from tgstorage import database
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def db(tmp_path, monkeypatch):
+    """A fresh, migrated database for one test."""
+    pool = database.ConnectionPool(str(tmp_path / "storage.db"), 2)
+    monkeypatch.setattr(database, "pool", pool)
+    for cache in (database.file_cache, database.api_key_cache, database.user_status_cache):
+        cache.clear()
+    await database.init_db()
+    yield pool
+    await pool.close()
+
+async def _no_bots():
+    pass
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """The API on a fresh database, with the bots left stopped."""
+    from fastapi.testclient import TestClient
+    from tgstorage import api
+    monkeypatch.setattr(database, "pool", database.ConnectionPool(str(tmp_path / "storage.db"), 2))
+    monkeypatch.setattr(api, "start_bot", _no_bots)
+    for cache in (database.file_cache, database.api_key_cache, database.user_status_cache):
+        cache.clear()
+    with TestClient(api.api, headers={"X-API-Key": os.environ["ADMIN_API_KEY"]}) as client:
+        yield client
+
+class FakeChannel:
+    """Stands in for the bot cluster: keeps what was sent, by message id."""
+
+    def __init__(self):
+        self.messages = {}
+        self.deleted = []
+
+    async def send_document(self, chat_id, data, filename):
+        message_id = len(self.messages) + 1
+        self.messages[message_id] = data
+        return SimpleNamespace(message_id=message_id, document=SimpleNamespace(file_id=f"doc{message_id}"), video=None)
+
+    async def send_video(self, chat_id, data, filename):
+        return await self.send_document(chat_id, data, filename)
+
+    async def delete_messages(self, chat_id, message_ids, concurrency=None):
+        self.deleted.extend(message_ids)
+        return 0
+
+@pytest.fixture
+def channel(monkeypatch):
+    """The bot cluster's sends and deletes, faked."""
+    from tgstorage.bot import cluster
+    fake = FakeChannel()
+    for name in ("send_document", "send_video", "delete_messages"):
+        monkeypatch.setattr(cluster, name, getattr(fake, name))
+    return fake
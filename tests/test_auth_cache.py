@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from tgstorage import coordination, database
+
+pytestmark = pytest.mark.anyio
+
+async def revoke_elsewhere(key):
+    """Delete a key the way another worker would: behind this one's caches."""
+    async with database.pool.writer() as db:
+        await db.execute("DELETE FROM api_keys WHERE key = ?", (key,))
+
+async def test_key_checks_are_cached_both_ways(db):
+    assert not await database.verify_key_db("k1")
+    await database.create_api_key("k1", "alice")
+    # Creating a key drops its cached rejection
+    assert await database.verify_key_db("k1")
+    await revoke_elsewhere("k1")
+    assert await database.verify_key_db("k1")
+    assert database.api_key_cache.hits >= 1
+
+async def test_user_status_follows_local_writes(db):
+    assert await database.get_user_status(42) == ""
+    await database.upsert_user_from_telegram(42, "alice")
+    assert await database.get_user_status(42) == "pending"
+    await database.set_user_status(42, "approved")
+    assert await database.get_user_status("42") == "approved"
+
+async def test_auth_changes_bump_the_generation(db):
+    before = await database.get_cache_generation("auth")
+    await database.create_api_key("k1", "alice")
+    await database.upsert_user_from_telegram(42, "alice")
+    await database.set_user_status(42, "approved")
+    assert await database.get_cache_generation("auth") == before + 3
+
+async def test_workers_drop_their_caches_when_the_generation_moves(db, monkeypatch):
+    monkeypatch.setattr(coordination, "coordinator", coordination.SQLiteCoordinator())
+    sync = coordination.AuthCacheSync(0.01)
+    await database.create_api_key("k1", "alice")
+    assert await database.verify_key_db("k1")
+    sync.start()
+    try:
+        await asyncio.sleep(0.05)
+        assert sync.clears == 0
+        await revoke_elsewhere("k1")
+        await asyncio.sleep(0.05)
+    finally:
+        await sync.stop()
+    assert sync.clears == 1
+    assert not await database.verify_key_db("k1")
+
+def test_single_worker_needs_no_sync(monkeypatch):
+    monkeypatch.setattr(coordination, "coordinator", coordination.LocalCoordinator())
+    sync = coordination.AuthCacheSync(0.01)
+    sync.start()
+    assert sync._task is None
@@ -0,0 +1,53 @@
+import pytest
+from tgstorage import api
+from tgstorage.config import settings
+
+class FakeCluster:
+    def __init__(self):
+        self.sent = []
+
+    async def send_file(self, chat_id, source, file_size, filename, mime_type, body=None):
+        source.seek(0)
+        self.sent.append((filename, source.read()))
+        return f"fid_{len(self.sent)}", len(self.sent), None
+
+@pytest.fixture
+def sender(monkeypatch):
+    fake = FakeCluster()
+    monkeypatch.setattr(api.cluster, "send_file", fake.send_file)
+    return fake
+
+def upload_batch(client, *files):
+    response = client.post("/upload/batch", files=[("files", (name, data, "text/plain")) for name, data in files])
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_batch_uploads_every_file_in_order(client, sender):
+    result = upload_batch(client, ("a.txt", b"a"), ("b.txt", b"bb"))
+    assert result["status"] == "success" and result["uploaded"] == 2
+    assert [r["direct_link"].rsplit("/", 1)[1] for r in result["results"]] == ["a.txt", "b.txt"]
+    assert sorted(sender.sent) == [("a.txt", b"a"), ("b.txt", b"bb")]
+
+def test_identical_files_are_sent_once_with_dedup(client, sender, monkeypatch):
+    monkeypatch.setattr(settings, "DEDUP_UPLOADS", True)
+    result = upload_batch(client, ("a.txt", b"same"), ("b.txt", b"same"), ("c.txt", b"other"))
+    assert result["uploaded"] == 3
+    assert sorted(name for name, _ in sender.sent) == ["a.txt", "c.txt"]
+
+def test_identical_files_are_each_sent_without_dedup(client, sender, monkeypatch):
+    monkeypatch.setattr(settings, "DEDUP_UPLOADS", False)
+    result = upload_batch(client, ("a.txt", b"same"), ("b.txt", b"same"), ("c.txt", b"same"))
+    assert result["status"] == "success" and result["uploaded"] == 3
+    assert sorted(name for name, _ in sender.sent) == ["a.txt", "b.txt", "c.txt"]
+    assert len({r["file_id"] for r in result["results"]}) == 3
+
+def test_failed_send_is_reported_per_file(client, sender, monkeypatch):
+    async def flaky(chat_id, source, file_size, filename, mime_type, body=None):
+        if filename == "bad.txt":
+            raise RuntimeError("telegram said no")
+        return await sender.send_file(chat_id, source, file_size, filename, mime_type, body)
+
+    monkeypatch.setattr(api.cluster, "send_file", flaky)
+    result = upload_batch(client, ("good.txt", b"1"), ("bad.txt", b"2"))
+    assert result["status"] == "partial" and result["uploaded"] == 1
+    assert result["results"][1] == {"status": "error", "file_name": "bad.txt", "detail": "telegram said no"}
@@ -0,0 +1,47 @@
+import pytest
+from tgstorage import channels, database
+from tgstorage.bot import cluster
+from tgstorage.config import settings
+
+pytestmark = pytest.mark.anyio
+
+CHANNELS = [-1001, -1002, -1003]
+
+def test_round_robin_rotates_through_channels():
+    placement = channels.ChannelPlacement(CHANNELS, "round_robin")
+    assert [placement.pick() for _ in range(4)] == [-1001, -1002, -1003, -1001]
+    assert placement.stats()["uploads"] == {"-1001": 2, "-1002": 1, "-1003": 1}
+
+def test_owner_hash_keeps_an_owner_on_one_channel():
+    placement = channels.ChannelPlacement(CHANNELS, "owner_hash")
+    assert len({placement.pick("alice") for _ in range(5)}) == 1
+    assert len({placement.pick(f"owner{n}") for n in range(30)}) == 3
+    # Uploads without an owner fall back to rotating
+    assert [placement.pick() for _ in range(3)] == CHANNELS
+
+def test_least_busy_picks_the_shortest_backlog(monkeypatch):
+    backlogs = {-1001: (3, 0.0), -1002: (0, 2.0), -1003: (0, 0.5)}
+    monkeypatch.setattr(cluster.limiter, "backlog", lambda chat_id, now: backlogs[chat_id])
+    placement = channels.ChannelPlacement(CHANNELS, "least_busy")
+    assert placement.pick() == -1003
+    backlogs[-1003] = (0, 2.0)
+    # Ties rotate, starting after the last pick
+    assert [placement.pick() for _ in range(2)] == [-1002, -1003]
+
+def test_unknown_policy_falls_back_to_round_robin():
+    placement = channels.ChannelPlacement(CHANNELS, "random")
+    assert placement.policy == "round_robin"
+
+def test_channel_list_defaults_to_the_single_channel(monkeypatch):
+    monkeypatch.setattr(settings, "CHANNEL_IDS", " -1002, -1003,-1002")
+    assert settings.channel_id_list == [-1002, -1003]
+    monkeypatch.setattr(settings, "CHANNEL_IDS", "")
+    assert settings.channel_id_list == [settings.CHANNEL_ID]
+
+async def test_deletes_go_to_the_channel_holding_each_file(db):
+    await database.add_file("a", 10, "a.bin", 100, "x/y", channel_id=-1002)
+    await database.add_file("b", 11, "b.bin", 100, "x/y", channel_id=-1003)
+    await database.add_file("legacy", 12, "c.bin", 100, "x/y")
+    assert channels.stored_channel(await database.get_file_by_id("legacy")) == settings.CHANNEL_ID
+    _, messages = await database.delete_files_db(["a", "b", "legacy"])
+    assert messages == {-1002: [10], -1003: [11], settings.CHANNEL_ID: [12]}
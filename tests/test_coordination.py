@@ -0,0 +1,39 @@
+import time
+import pytest
+from tgstorage import coordination
+from tgstorage.config import settings
+
+pytestmark = pytest.mark.anyio
+
+async def test_lease_has_one_holder_until_it_lapses(db):
+    coordinator = coordination.SQLiteCoordinator()
+    assert await coordinator.acquire_lease("sweeper", "w1", 30)
+    assert not await coordinator.acquire_lease("sweeper", "w2", 30)
+    # Renewing is taking it again
+    assert await coordinator.acquire_lease("sweeper", "w1", -1)
+    assert await coordinator.acquire_lease("sweeper", "w2", 30)
+    await coordinator.release_lease("sweeper", "w1")
+    assert not await coordinator.acquire_lease("sweeper", "w1", 30)
+    await coordinator.release_lease("sweeper", "w2")
+    assert await coordinator.acquire_lease("sweeper", "w1", 30)
+
+async def test_retry_windows_only_grow(db):
+    coordinator = coordination.SQLiteCoordinator()
+    until = time.time() + 60
+    await coordinator.publish_retry_after("bot1", until)
+    await coordinator.publish_retry_after("bot1", until - 30)
+    await coordinator.publish_retry_after("bot2", time.time() - 1)
+    assert await coordinator.fetch_retry_after() == {"bot1": until}
+
+@pytest.mark.parametrize("backend, expected", [
+    ("local", coordination.LocalCoordinator),
+    ("SQLite", coordination.SQLiteCoordinator),
+])
+def test_create_coordinator(monkeypatch, backend, expected):
+    monkeypatch.setattr(settings, "COORDINATION_BACKEND", backend)
+    assert type(coordination.create_coordinator()) is expected
+
+def test_unknown_backend_is_rejected(monkeypatch):
+    monkeypatch.setattr(settings, "COORDINATION_BACKEND", "redis")
+    with pytest.raises(ValueError):
+        coordination.create_coordinator()
@@ -0,0 +1,158 @@
+import hashlib
+import io
+import os
+import pytest
+from tgstorage import database
+from tgstorage.bot import cluster
+from tgstorage.config import settings
+from tgstorage.hashing import ContentHasher, combine, piece_digest
+from tgstorage.jobs import UploadJobs, upload_jobs
+from tgstorage.resumable import ResumableUploads
+
+pytestmark = pytest.mark.anyio
+
+PARTS = [
+    {"part_index": 0, "file_id": "part0", "message_id": 21, "offset": 0, "length": 1000},
+    {"part_index": 1, "file_id": "part1", "message_id": 22, "offset": 1000, "length": 500},
+]
+
+async def test_duplicate_shares_storage(db):
+    await database.add_file("orig", 10, "a.bin", 100, "x/y", share_token="s1", content_hash="h1")
+    assert await database.add_duplicate_file("copy", "h1", "b.bin", "x/y", share_token="s2")
+    assert not await database.add_duplicate_file("other", "unknown", "c.bin", "x/y")
+    copy = await database.get_file_by_id("copy")
+    assert copy['storage_id'] == "orig" and copy['message_id'] == 10 and copy['file_size'] == 100
+
+async def test_stored_content_outlives_all_but_the_last_row(db):
+    await database.add_file("orig", 10, "a.bin", 100, "x/y", share_token="s1", content_hash="h1")
+    await database.add_duplicate_file("copy", "h1", "b.bin", "x/y", share_token="s2")
+
+    assert await database.delete_files_db(["orig"]) == ([], {})
+    assert await database.get_file_by_id("orig") is None
+    assert (await database.get_file_by_id("copy"))['storage_id'] == "orig"
+    # A new duplicate can still link to the surviving copy
+    assert await database.add_duplicate_file("third", "h1", "c.bin", "x/y")
+
+    orphaned, messages = await database.delete_files_db(["copy", "third"])
+    assert orphaned == ["orig"]
+    assert messages == {settings.CHANNEL_ID: [10]}
+    assert await database.verify_stats() == {}
+
+async def test_deleting_chunked_content_returns_every_part(db):
+    await database.add_file("mp_1", 21, "big.bin", 1500, "x/y", content_hash="h2", parts=PARTS, channel_id=-1002)
+    await database.add_duplicate_file("mp_copy", "h2", "big2.bin", "x/y")
+    assert len(await database.get_file_parts("mp_1")) == 2
+
+    assert await database.delete_files_db(["mp_1"]) == ([], {})
+    assert len(await database.get_file_parts("mp_1")) == 2
+
+    orphaned, messages = await database.delete_files_db(["mp_copy"])
+    assert orphaned == ["mp_1"]
+    assert sorted(messages[-1002]) == [21, 22]
+    assert await database.get_file_parts("mp_1") == ()
+
+async def test_delete_in_one_batch_with_its_duplicate(db):
+    await database.add_file("orig", 10, "a.bin", 100, "x/y", content_hash="h1")
+    await database.add_duplicate_file("copy", "h1", "b.bin", "x/y")
+    orphaned, messages = await database.delete_files_db(["orig", "copy", "missing"])
+    assert orphaned == ["orig"] and messages == {settings.CHANNEL_ID: [10]}
+
+@pytest.mark.parametrize("size", [0, 999, 1000, 2500, 3000])
+def test_content_hash_is_the_same_whatever_the_block_size(size):
+    data = os.urandom(size)
+    pieces = [piece_digest(data[offset:offset + 1000]) for offset in range(0, size, 1000)] or [piece_digest(b"")]
+    for block in (1, 7, 1000, 4096):
+        hasher = ContentHasher(1000)
+        for offset in range(0, size, block):
+            hasher.update(data[offset:offset + block])
+        assert hasher.hexdigest() == combine(pieces)
+    if size <= 1000:
+        # Up to one piece it is the plain SHA-256, as for small uploads
+        assert combine(pieces) == hashlib.sha256(data).hexdigest()
+
+async def test_parts_are_hashed_as_they_are_sent(channel):
+    data = os.urandom(2500)
+    parts = await cluster.send_parts(-1001, io.BytesIO(data), len(data), "big.bin", 1000)
+    assert [part["sha256"] for part in parts] == [piece_digest(data[i:i + 1000]) for i in (0, 1000, 2000)]
+    hasher = ContentHasher(1000)
+    hasher.update(data)
+    assert combine(part["sha256"] for part in parts) == hasher.hexdigest()
+
+async def test_staging_hashes_the_body(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "CHUNK_SIZE", 1000)
+    jobs = UploadJobs(str(tmp_path))
+    data = os.urandom(2500)
+    job_id, content_hash = await jobs.stage(io.BytesIO(data))
+    with open(jobs._path(job_id), "rb") as staged:
+        assert staged.read() == data
+    hasher = ContentHasher(1000)
+    hasher.update(data)
+    assert content_hash == hasher.hexdigest()
+    await jobs.discard(job_id)
+    assert not os.path.exists(jobs._path(job_id))
+
+def upload(client, data, **form):
+    response = client.post("/upload", files={"file": ("f.bin", data, "application/octet-stream")}, data=form)
+    assert response.status_code in (200, 202), response.text
+    return response.json()
+
+def test_large_duplicate_is_dropped_after_sending(client, channel, monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_SIZE", 1000)
+    data = os.urandom(2500)
+    first = upload(client, data)
+    assert first["file_id"].startswith("mp_") and not channel.deleted
+    second = upload(client, data)
+    assert second["file_id"].startswith("ref_")
+    # The second copy reached Telegram before its hash was known, and was removed again
+    assert sorted(channel.deleted) == [4, 5, 6]
+
+def test_async_duplicate_is_linked_before_queueing(client, channel, monkeypatch):
+    data = os.urandom(500)
+    upload(client, data)
+    linked = upload(client, data, **{"async": "true"})
+    assert linked["file_id"].startswith("ref_")
+    jobs_dir = os.path.join(upload_jobs.directory, "jobs")
+    assert not os.path.isdir(jobs_dir) or os.listdir(jobs_dir) == []
+    queued = upload(client, os.urandom(500), **{"async": "true"})
+    assert queued["status"] == "queued"
+
+async def test_resumable_uploads_are_hashed_and_deduplicated(db, channel, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_SIZE", 1000)
+    uploads = ResumableUploads(str(tmp_path / "staging"))
+    data = os.urandom(2500)
+
+    async def resumable_upload(share_token):
+        session = await uploads.create("owner", "r.bin", len(data), None)
+
+        async def body():
+            yield data
+
+        await uploads.write(session['upload_id'], 0, body())
+        return await uploads.complete(session['upload_id'], share_token)
+
+    first = await resumable_upload("s1")
+    hasher = ContentHasher(1000)
+    hasher.update(data)
+    assert first["content_hash"] == hasher.hexdigest()
+    assert (await database.get_file_by_id(first["file_id"]))['content_hash'] == hasher.hexdigest()
+
+    second = await resumable_upload("s2")
+    assert second["file_id"].startswith("ref_")
+    assert sorted(channel.deleted) == [4, 5, 6]
+    assert (await database.get_file_by_id(second["file_id"]))['storage_id'] == first["file_id"]
+    # And it serves as a dedup source for regular uploads
+    assert await database.add_duplicate_file("copy", hasher.hexdigest(), "c.bin", "x/y")
+
+def test_batch_links_large_duplicates_after_sending(client, channel, monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_SIZE", 1000)
+    big, small = os.urandom(2500), os.urandom(300)
+    response = client.post("/upload/batch", files=[
+        ("files", ("a.bin", big, "x/y")), ("files", ("b.bin", big, "x/y")),
+        ("files", ("c.bin", small, "x/y")), ("files", ("d.bin", small, "x/y")),
+    ])
+    result = response.json()
+    assert result["status"] == "success", result
+    ids = [r["file_id"] for r in result["results"]]
+    assert sum(file_id.startswith("ref_") for file_id in ids) == 2
+    # Both large copies were sent, one was dropped; the small one went out once
+    assert len(channel.messages) == 7 and len(channel.deleted) == 3
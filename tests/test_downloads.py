@@ -0,0 +1,143 @@
+import os
+import httpx
+import pytest
+from tgstorage import database, downloads
+from tgstorage.bot import cluster
+
+pytestmark = pytest.mark.anyio
+
+class FileServer:
+    """Telegram's file server: serves byte ranges of stored files by URL."""
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        self.resolved = []
+        # Statuses to answer a path with before serving it
+        self.failures = {}
+
+    def handler(self, request):
+        self.requests.append(request.url.path)
+        failures = self.failures.get(request.url.path.lstrip("/"))
+        if failures:
+            return httpx.Response(failures.pop(0), text="Error")
+        data = self.files.get(request.url.path.lstrip("/"))
+        if data is None:
+            return httpx.Response(404, text="Not Found")
+        start, end = request.headers["Range"][len("bytes="):].split("-")
+        return httpx.Response(206, content=data[int(start):int(end) + 1])
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FileServer()
+
+    def client():
+        return httpx.AsyncClient(transport=httpx.MockTransport(server.handler))
+
+    async def get_file_path(tg_file_id, bot=None):
+        server.resolved.append(tg_file_id)
+        return f"http://files/{tg_file_id}"
+
+    monkeypatch.setattr(cluster, "get_http_client", client)
+    monkeypatch.setattr(cluster, "get_segment_client", client)
+    monkeypatch.setattr(cluster, "get_file_path", get_file_path)
+    return server
+
+async def read(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+async def store_chunked(server, data, part_size):
+    parts = []
+    for index, offset in enumerate(range(0, len(data), part_size)):
+        server.files[f"part{index}"] = data[offset:offset + part_size]
+        parts.append({"part_index": index, "file_id": f"part{index}", "message_id": index + 1,
+                      "offset": offset, "length": len(server.files[f"part{index}"])})
+    await database.add_file("mp_1", 1, "big.bin", len(data), "x/y", parts=parts)
+    return await database.get_file_by_id("mp_1")
+
+async def test_ranges_map_onto_the_parts_they_overlap(db, server):
+    row = await store_chunked(server, os.urandom(2500), 1000)
+    assert await downloads.plan_segments(row, 0, 2499) == [("part0", 0, 999), ("part1", 0, 999), ("part2", 0, 499)]
+    assert await downloads.plan_segments(row, 950, 1049) == [("part0", 950, 999), ("part1", 0, 49)]
+    assert await downloads.plan_segments(row, 2000, 2000) == [("part2", 0, 0)]
+
+async def test_chunked_file_reads_back_whole_and_in_ranges(db, server):
+    data = os.urandom(2500)
+    row = await store_chunked(server, data, 1000)
+    assert await read(downloads.iter_range(row, 0, 2499, None)) == data
+    assert await read(downloads.iter_range(row, 990, 2010, None)) == data[990:2011]
+
+@pytest.fixture
+def parallel(monkeypatch):
+    monkeypatch.setattr(downloads.settings, "DOWNLOAD_PARALLELISM", 3)
+    monkeypatch.setattr(downloads.settings, "DOWNLOAD_SEGMENT_SIZE", 100)
+    monkeypatch.setattr(downloads.settings, "DOWNLOAD_READAHEAD", 4)
+    monkeypatch.setattr(downloads.settings, "DOWNLOAD_PARALLEL_MIN_SIZE", 0)
+
+async def test_parallel_segments_come_back_in_order(db, server, parallel):
+    data = os.urandom(2500)
+    row = await store_chunked(server, data, 1000)
+    assert await read(downloads.iter_range(row, 0, 2499, None)) == data
+    assert await read(downloads.iter_range(row, 950, 1049, None)) == data[950:1050]
+    assert len(server.requests) == 25 + 1 + 1
+
+async def test_split_segments_keeps_pieces_within_their_file():
+    assert downloads.split_segments([("a", 0, 249), ("b", 10, 19)], 100) == [
+        ("a", 0, 99), ("a", 100, 199), ("a", 200, 249), ("b", 10, 19)]
+
+@pytest.mark.parametrize("parallel_fetch", [False, True])
+async def test_stale_link_is_resolved_again(db, server, monkeypatch, parallel_fetch):
+    if parallel_fetch:
+        monkeypatch.setattr(downloads.settings, "DOWNLOAD_PARALLEL_MIN_SIZE", 0)
+    else:
+        monkeypatch.setattr(downloads.settings, "DOWNLOAD_PARALLELISM", 1)
+    data = os.urandom(2500)
+    row = await store_chunked(server, data, 1000)
+    server.failures["part1"] = [403]
+    assert await read(downloads.iter_range(row, 0, 2499, None)) == data
+    assert server.resolved.count("part1") == 2
+
+@pytest.mark.parametrize("parallel_fetch", [False, True])
+async def test_error_pages_are_never_served_as_content(db, server, monkeypatch, parallel_fetch):
+    if parallel_fetch:
+        monkeypatch.setattr(downloads.settings, "DOWNLOAD_PARALLEL_MIN_SIZE", 0)
+    else:
+        monkeypatch.setattr(downloads.settings, "DOWNLOAD_PARALLELISM", 1)
+    row = await store_chunked(server, os.urandom(2500), 1000)
+    server.failures["part1"] = [500]
+    with pytest.raises(httpx.HTTPStatusError):
+        await read(downloads.iter_range(row, 0, 2499, None))
+
+class FakeBot:
+    _custom_name = "bot_test"
+
+@pytest.fixture
+def app(db, server, monkeypatch):
+    """The API in this test's event loop, with one healthy bot."""
+    from tgstorage import api
+
+    async def get_healthy_bot():
+        return FakeBot()
+
+    monkeypatch.setattr(cluster, "get_healthy_bot", get_healthy_bot)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=api.api), base_url="http://test")
+
+async def test_chunked_file_downloads_through_the_api(app, server):
+    data = os.urandom(2500)
+    await store_chunked(server, data, 1000)
+    async with app:
+        whole = await app.get("/dl/mp_1/big.bin")
+        part = await app.get("/dl/mp_1/big.bin", headers={"Range": "bytes=999-1000"})
+    assert whole.status_code == 200 and whole.content == data
+    assert part.status_code == 206 and part.content == data[999:1001]
+
+async def test_chunked_file_without_parts_is_a_clear_error(app):
+    async with database.pool.writer() as db:
+        await db.execute(
+            "INSERT INTO files (file_id, message_id, file_name, file_size, mime_type, part_count, storage_id) "
+            "VALUES ('mp_orphan', 1, 'big.bin', 2500, 'x/y', 3, 'mp_orphan')"
+        )
+    async with app:
+        response = await app.get("/dl/mp_orphan/big.bin")
+    assert response.status_code == 500
+    assert response.json()["detail"] == "Stored content for this file is missing"
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import pytest
+from tgstorage import fanout
+
+pytestmark = pytest.mark.anyio
+
+DATA = os.urandom(1000)
+FILE = {"storage_id": "f1"}
+
+class Upstream:
+    """Telegram serving DATA in 100-byte chunks, counting fetches."""
+
+    def __init__(self):
+        self.fetches = []
+        self.closed = asyncio.Event()
+
+    async def iter_range(self, file_data, start, end, bot):
+        self.fetches.append((start, end))
+        try:
+            for offset in range(start, end + 1, 100):
+                await asyncio.sleep(0)
+                yield DATA[offset:min(end + 1, offset + 100)]
+        finally:
+            self.closed.set()
+
+@pytest.fixture
+def upstream(monkeypatch):
+    upstream = Upstream()
+    monkeypatch.setattr(fanout, "iter_range", upstream.iter_range)
+    return upstream
+
+async def read(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+async def test_concurrent_downloads_share_one_fetch(upstream):
+    shared = fanout.FanOut(400)
+    results = await asyncio.gather(*(read(shared.stream(FILE, 0, 999, None)) for _ in range(3)))
+    assert results == [DATA] * 3
+    assert upstream.fetches == [(0, 999)]
+    assert shared.stats()["joins"] == 2 and shared.stats()["active"] == 0
+
+async def test_a_reader_that_falls_behind_continues_from_a_new_fetch(upstream):
+    shared = fanout.FanOut(200)
+    slow = shared.stream(FILE, 0, 999, None)
+    first = await slow.__anext__()
+    # Joins at the slow reader's position, then runs far enough ahead to evict it
+    assert await read(shared.stream(FILE, 100, 999, None)) == DATA[100:]
+    assert first + await read(slow) == DATA
+    assert upstream.fetches == [(0, 999), (100, 999)]
+    assert shared.stats()["fallbacks"] == 1
+
+async def test_abandoned_fetch_closes_its_upstream(upstream):
+    shared = fanout.FanOut(400)
+    reader = shared.stream(FILE, 0, 999, None)
+    await reader.__anext__()
+    await reader.aclose()
+    await asyncio.wait_for(upstream.closed.wait(), 1)
+    assert shared.stats()["active"] == 0
+
+async def test_without_a_buffer_every_download_fetches(upstream):
+    shared = fanout.FanOut(0)
+    await asyncio.gather(read(shared.stream(FILE, 0, 999, None)), read(shared.stream(FILE, 0, 999, None)))
+    assert len(upstream.fetches) == 2
@@ -0,0 +1,57 @@
+import asyncio
+import datetime
+import pytest
+from tgstorage import database
+from tgstorage.cache import TTLCache
+
+pytestmark = pytest.mark.anyio
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(2, 60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(10, 60)
+    cache.set("a", 1, ttl=-1)
+    assert cache.get("a") is None and len(cache) == 0
+
+async def test_concurrent_misses_load_once():
+    cache = TTLCache(10, 60)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "row"
+
+    assert await asyncio.gather(*(cache.get_or_load("k", loader) for _ in range(5))) == ["row"] * 5
+    assert calls == 1 and cache.get("k") == "row"
+
+async def test_lookups_are_served_from_the_cache(db):
+    await database.add_file("a", 10, "a.bin", 100, "x/y", share_token="s1")
+    row = await database.get_file_by_id("a")
+    async with database.pool.writer() as conn:
+        await conn.execute("UPDATE files SET file_name = 'renamed' WHERE file_id = 'a'")
+    assert (await database.get_file_by_id("a"))['file_name'] == "a.bin"
+    # Both keys point at the same cached row
+    assert await database.get_file_by_share_token("s1") is row
+
+async def test_deleted_rows_leave_the_cache(db):
+    await database.add_file("orig", 10, "a.bin", 100, "x/y", share_token="s1", content_hash="h1")
+    assert (await database.get_file_by_share_token("s1"))['file_id'] == "orig"
+    await database.delete_files_db(["orig"])
+    assert await database.get_file_by_id("orig") is None
+    assert await database.get_file_by_share_token("s1") is None
+
+async def test_cached_rows_still_expire(db):
+    soon = (datetime.datetime.now() + datetime.timedelta(seconds=0.2)).isoformat()
+    await database.add_file("a", 10, "a.bin", 100, "x/y", expiration_date=soon)
+    assert await database.get_file_by_id("a") is not None
+    await asyncio.sleep(0.25)
+    assert await database.get_file_by_id("a") is None
@@ -0,0 +1,48 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from tgstorage.bot import BotCluster, BotHealth
+
+pytestmark = pytest.mark.anyio
+
+class FakeBot:
+    _custom_name = "bot_a"
+
+    def __init__(self):
+        self._health = BotHealth()
+        self.lookups = []
+
+    async def get_file(self, file_id):
+        self.lookups.append(file_id)
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(file_path=f"https://api.telegram.org/file/bot/{file_id}/{len(self.lookups)}")
+
+@pytest.fixture
+def cluster():
+    cluster = BotCluster()
+    cluster.bots = [FakeBot()]
+    return cluster
+
+async def test_paths_are_resolved_once_and_cached(cluster):
+    bot = cluster.bots[0]
+    paths = await asyncio.gather(*(cluster.get_file_path("f1") for _ in range(5)))
+    assert len(set(paths)) == 1 and bot.lookups == ["f1"]
+    assert await cluster.get_file_path("f1", bot) == paths[0]
+    assert bot.lookups == ["f1"]
+    assert bot._health.inflight == 0
+
+async def test_invalidated_paths_are_resolved_again(cluster):
+    bot = cluster.bots[0]
+    first = await cluster.get_file_path("f1")
+    cluster.file_paths.invalidate("f1")
+    assert await cluster.get_file_path("f1") != first
+    assert bot.lookups == ["f1", "f1"]
+
+async def test_paths_expire_before_telegram_links_do(cluster):
+    # Telegram keeps a download link valid for at least an hour
+    assert cluster.file_paths.ttl < 3600
+    bot = cluster.bots[0]
+    cluster.file_paths.ttl = -1
+    await cluster.get_file_path("f1")
+    await cluster.get_file_path("f1")
+    assert bot.lookups == ["f1", "f1"]
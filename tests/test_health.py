@@ -0,0 +1,77 @@
+import time
+import pytest
+from types import SimpleNamespace
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from tgstorage.bot import BotCluster, BotHealth
+from tgstorage.config import settings
+
+pytestmark = pytest.mark.anyio
+
+class FakeBot:
+    def __init__(self, name, error=None):
+        self._custom_name = name
+        self._health = BotHealth()
+        self.error = error
+
+    async def get_me(self):
+        if self.error:
+            raise self.error
+        return SimpleNamespace(username=self._custom_name)
+
+@pytest.fixture
+def cluster():
+    cluster = BotCluster()
+    cluster.bots = [FakeBot("bot_a"), FakeBot("bot_b"), FakeBot("bot_c")]
+    return cluster
+
+async def test_probe_marks_failing_bots_unhealthy(cluster):
+    ok, down, limited = cluster.bots
+    down.error = NetworkError("unreachable")
+    limited.error = RetryAfter(60)
+    await cluster.check_all()
+    assert ok._health.healthy and ok._health.latency is not None
+    assert not down._health.healthy
+    # Flood-limited is alive: only its retry window applies
+    assert limited._health.healthy and not limited._health.available(time.monotonic())
+
+    down.error = None
+    await cluster.check_all()
+    assert down._health.healthy
+
+async def test_healthy_bot_is_the_least_loaded_available_one(cluster):
+    a, b, c = cluster.bots
+    for bot, inflight in ((a, 2), (b, 0), (c, 1)):
+        bot._health.inflight = inflight
+    assert await cluster.get_healthy_bot() is b
+    b._health.retry_until = time.monotonic() + 60
+    assert await cluster.get_healthy_bot() is c
+    c._health.healthy = False
+    assert await cluster.get_healthy_bot() is a
+    a._health.healthy = False
+    assert await cluster.get_healthy_bot() is None
+
+async def test_wait_for_bot_sleeps_until_a_window_closes(cluster):
+    for bot in cluster.bots:
+        bot._health.retry_until = time.monotonic() + 60
+    cluster.bots[1]._health.retry_until = time.monotonic() + 0.1
+    assert await cluster.wait_for_bot(timeout=2) is cluster.bots[1]
+    assert await cluster.wait_for_bot(timeout=0) is cluster.bots[1]
+
+def test_errors_past_the_threshold_take_a_bot_out():
+    health = BotHealth()
+    for _ in range(settings.BOT_ERROR_THRESHOLD - 1):
+        health.record_error(NetworkError("flaky"))
+    assert health.healthy
+    # Bad requests are the caller's fault, not the bot's
+    health.record_error(BadRequest("message to delete not found"))
+    assert health.healthy
+    health.record_error(NetworkError("flaky"))
+    assert not health.healthy
+    health.record_success()
+    assert health.healthy and health.consecutive_errors == 0
+
+def test_latency_is_a_moving_average():
+    health = BotHealth()
+    health.record_latency(1.0)
+    health.record_latency(0.0)
+    assert 0.0 < health.latency < 1.0
@@ -0,0 +1,65 @@
+import time
+import pytest
+from tgstorage import database
+
+pytestmark = pytest.mark.anyio
+
+def job(job_id, node="n1"):
+    return {"job_id": job_id, "node": node, "file_name": f"{job_id}.bin", "file_size": 10, "share_token": f"s_{job_id}"}
+
+async def test_job_counters_follow_the_queue(db):
+    for job_id in ("j1", "j2", "j3"):
+        await database.create_upload_job(job(job_id))
+    assert await database.count_upload_jobs() == {"queued": 3}
+
+    claimed = await database.claim_upload_job("n1", time.time())
+    assert await database.count_upload_jobs() == {"queued": 2, "running": 1}
+    await database.fail_upload_job(claimed['job_id'], "boom")
+    claimed = await database.claim_upload_job("n1", time.time())
+    await database.finish_upload_job(claimed['job_id'], {
+        "file_id": "f1", "message_id": 1, "file_name": "j.bin", "file_size": 10, "mime_type": "x/y",
+    })
+    assert await database.count_upload_jobs() == {"queued": 1, "failed": 1, "done": 1}
+
+    assert await database.delete_finished_upload_jobs(time.time() + 1) == 2
+    assert await database.count_upload_jobs() == {"queued": 1}
+    assert await database.verify_stats() == {}
+
+async def test_job_counts_stay_out_of_file_stats(db):
+    await database.create_upload_job(job("j1"))
+    async with database.pool.reader() as conn:
+        async with conn.execute("SELECT COUNT(*) FROM stats_counters WHERE scope LIKE 'jobs:%'") as cursor:
+            assert (await cursor.fetchone())[0] == 0
+    assert (await database.get_stats(breakdown=True))["total_files"] == 0
+
+async def test_job_counter_drift_is_rebuilt(db):
+    await database.create_upload_job(job("j1"))
+    async with database.pool.writer() as conn:
+        await conn.execute("UPDATE job_counters SET count = 5 WHERE status = 'queued'")
+    assert await database.verify_stats() == {"jobs:queued": {"stored": 5, "actual": 1}}
+    await database.verify_stats(rebuild=True)
+    assert await database.count_upload_jobs() == {"queued": 1}
+
+async def test_job_counts_move_out_of_stats_counters(db):
+    # The layout before job_counters: 'jobs:<status>' scopes kept by stats_upload_jobs_* triggers
+    await database.create_upload_job(job("j1"))
+    async with database.pool.writer() as conn:
+        await conn.execute("DROP TABLE job_counters")
+        for event in ("insert", "delete", "update"):
+            await conn.execute(f"DROP TRIGGER job_counters_{event}")
+        await conn.execute("""CREATE TRIGGER stats_upload_jobs_insert AFTER INSERT ON upload_jobs BEGIN
+            INSERT INTO stats_counters (scope, files, bytes, views) VALUES ('jobs:' || NEW.status, 1, 0, 0)
+            ON CONFLICT(scope) DO UPDATE SET files = files + excluded.files;
+        END""")
+        await conn.execute("INSERT INTO stats_counters (scope, files, bytes, views) VALUES ('jobs:queued', 1, 0, 0)")
+
+    await database.init_db()
+    await database.create_upload_job(job("j2"))
+    assert await database.count_upload_jobs() == {"queued": 2}
+    async with database.pool.reader() as conn:
+        async with conn.execute(
+            "SELECT name FROM sqlite_master WHERE name LIKE 'stats_upload_jobs_%' "
+            "UNION ALL SELECT scope FROM stats_counters WHERE scope LIKE 'jobs:%'"
+        ) as cursor:
+            assert await cursor.fetchall() == []
+    assert await database.verify_stats() == {}
@@ -0,0 +1,67 @@
+import pytest
+from tgstorage import database
+
+pytestmark = pytest.mark.anyio
+
+async def add(name, owner="k1"):
+    await database.add_file(name, 1, name, 10, "text/plain", owner_key=owner)
+
+async def pages(limit, **filters):
+    cursor, seen = None, []
+    while True:
+        rows = await database.list_files(limit, cursor=cursor, **filters)
+        seen.extend(row['file_id'] for row in rows)
+        if len(rows) < limit:
+            return seen
+        cursor = database.encode_cursor(rows[-1])
+
+async def test_cursor_pages_cover_every_file_once(db):
+    # Same-second uploads share upload_date: the id breaks the tie
+    names = [f"file{i:02d}.txt" for i in range(25)]
+    for name in names:
+        await add(name)
+    assert await pages(10) == names[::-1]
+    assert await pages(5) == names[::-1]
+
+async def test_new_uploads_do_not_shift_later_pages(db):
+    for i in range(6):
+        await add(f"old{i}.txt")
+    first = await database.list_files(3)
+    await add("new.txt")
+    rest = await database.list_files(3, cursor=database.encode_cursor(first[-1]))
+    assert [row['file_id'] for row in first + rest] == [f"old{i}.txt" for i in range(5, -1, -1)]
+
+async def test_pages_are_scoped_to_the_owner(db):
+    for i in range(4):
+        await add(f"a{i}.txt", owner="k1")
+        await add(f"b{i}.txt", owner="k2")
+    assert await pages(3, auth_key="k2") == [f"b{i}.txt" for i in range(3, -1, -1)]
+
+async def test_invalid_cursor_is_rejected(db):
+    with pytest.raises(ValueError):
+        await database.list_files(10, cursor="not-a-cursor")
+
+async def test_search_by_name(db):
+    for name in ("holiday-photo.jpg", "report-2024.pdf", "photo-album.zip", "ab.txt"):
+        await add(name)
+    # Trigram index from three characters, LIKE below that
+    assert sorted(row['file_id'] for row in await database.list_files(10, search="photo")) == ["holiday-photo.jpg", "photo-album.zip"]
+    assert [row['file_id'] for row in await database.list_files(10, search="ab")] == ["ab.txt"]
+    await database.delete_files_db(["photo-album.zip"])
+    assert [row['file_id'] for row in await database.list_files(10, search="photo")] == ["holiday-photo.jpg"]
+
+def test_listing_endpoint_hands_out_the_next_cursor(client, monkeypatch):
+    from tgstorage import api
+
+    async def send_file(chat_id, source, file_size, filename, mime_type, body=None):
+        return f"tg_{filename}", 1, None
+
+    monkeypatch.setattr(api.cluster, "send_file", send_file)
+    for i in range(3):
+        client.post("/upload", files={"file": (f"f{i}.txt", f"body {i}".encode(), "text/plain")})
+    first = client.get("/files", params={"limit": 2})
+    assert [f["file_name"] for f in first.json()] == ["f2.txt", "f1.txt"]
+    second = client.get("/files", params={"limit": 2, "cursor": first.headers["X-Next-Cursor"]})
+    assert [f["file_name"] for f in second.json()] == ["f0.txt"]
+    assert "X-Next-Cursor" not in second.headers
+    assert client.get("/files", params={"cursor": "bogus"}).status_code == 400
@@ -0,0 +1,77 @@
+import pytest
+from tgstorage.ranges import (
+    MAX_RANGES, RangeNotSatisfiable, parse_range, not_modified, if_range_matches,
+    iter_multipart, multipart_length, parse_http_date
+)
+
+pytestmark = pytest.mark.anyio
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", [(0, 99)]),
+    ("bytes=100-", [(100, 999)]),
+    ("bytes=-100", [(900, 999)]),
+    ("bytes=-5000", [(0, 999)]),
+    ("bytes=990-5000", [(990, 999)]),
+    ("bytes=0-0,-1", [(0, 0), (999, 999)]),
+    ("bytes= 10-19 , 0-4", [(0, 4), (10, 19)]),
+    # Overlapping and adjacent ranges are coalesced
+    ("bytes=0-10,5-20,21-30", [(0, 30)]),
+    # Unsatisfiable parts are dropped as long as one fits
+    ("bytes=5000-6000,0-1", [(0, 1)]),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+@pytest.mark.parametrize("header", [
+    "items=0-10",
+    "bytes=abc",
+    "bytes=10-5",
+    "bytes=-",
+    "bytes=",
+    "bytes=" + ",".join(f"{i * 10}-{i * 10 + 1}" for i in range(MAX_RANGES + 1)),
+])
+def test_parse_range_ignored(header):
+    assert parse_range(header, 1000) is None
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=1000-", 1000),
+    ("bytes=-0", 1000),
+    ("bytes=0-", 0),
+])
+def test_parse_range_unsatisfiable(header, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, size)
+
+def test_not_modified():
+    etag = '"abc"'
+    last_modified = parse_http_date("Wed, 21 Oct 2015 07:28:00 GMT")
+    assert not_modified({"if-none-match": '"x", W/"abc"'}, etag, last_modified)
+    assert not_modified({"if-none-match": "*"}, etag, last_modified)
+    assert not not_modified({"if-none-match": '"x"'}, etag, last_modified)
+    # If-None-Match wins over If-Modified-Since
+    assert not not_modified(
+        {"if-none-match": '"x"', "if-modified-since": "Thu, 22 Oct 2015 07:28:00 GMT"}, etag, last_modified
+    )
+    assert not_modified({"if-modified-since": "Wed, 21 Oct 2015 07:28:00 GMT"}, etag, last_modified)
+    assert not not_modified({"if-modified-since": "Tue, 20 Oct 2015 07:28:00 GMT"}, etag, last_modified)
+    assert not not_modified({"if-modified-since": "not a date"}, etag, last_modified)
+
+def test_if_range_matches():
+    last_modified = parse_http_date("Wed, 21 Oct 2015 07:28:00 GMT")
+    assert if_range_matches('"abc"', '"abc"', last_modified)
+    # Weak validators never match If-Range
+    assert not if_range_matches('W/"abc"', '"abc"', last_modified)
+    assert if_range_matches("Wed, 21 Oct 2015 07:28:00 GMT", '"abc"', last_modified)
+    assert not if_range_matches("Thu, 22 Oct 2015 07:28:00 GMT", '"abc"', last_modified)
+
+async def test_multipart_length_matches_body():
+    data = bytes(range(256)) * 4
+    ranges = [(0, 9), (100, 199), (1000, 1023)]
+
+    async def read_range(start, end):
+        yield data[start:end + 1]
+
+    body = b"".join([chunk async for chunk in iter_multipart(ranges, "b0undary", "text/plain", len(data), read_range)])
+    assert len(body) == multipart_length(ranges, "b0undary", "text/plain", len(data))
+    assert b"Content-Range: bytes 100-199/1024\r\n\r\n" + data[100:200] + b"\r\n" in body
+    assert body.endswith(b"--b0undary--\r\n")
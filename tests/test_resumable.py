@@ -0,0 +1,96 @@
+import asyncio
+import os
+import pytest
+from tgstorage import database
+from tgstorage.config import settings
+from tgstorage.resumable import ResumableUploads, UploadConflict
+
+pytestmark = pytest.mark.anyio
+
+PART_SIZE = 1000
+
+@pytest.fixture
+def uploads(db, channel, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_SIZE", PART_SIZE)
+    uploads = ResumableUploads(str(tmp_path / "staging"))
+    uploads.channel = channel
+    return uploads
+
+async def body(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+async def sent(uploads):
+    await asyncio.gather(*uploads._sending.values())
+
+async def test_upload_in_pieces_and_complete(uploads):
+    data = os.urandom(2700)
+    session = await uploads.create("owner", "a.bin", len(data), "application/octet-stream")
+    upload_id = session['upload_id']
+    assert await uploads.write(upload_id, 0, body(data[:1500])) == 1500
+    assert await uploads.write(upload_id, 1500, body(data[1500:2000], data[2000:])) == 2700
+    await sent(uploads)
+    status = await uploads.status(await database.get_upload_session(upload_id))
+    assert status["offset"] == 2700 and status["parts_sent"] == status["parts_total"] == 3
+
+    row = await uploads.complete(upload_id, "share-token")
+    assert [part["length"] for part in row["parts"]] == [1000, 1000, 700]
+    assert b"".join(uploads.channel.messages[part["message_id"]] for part in row["parts"]) == data
+    stored = await database.get_file_by_id(row["file_id"])
+    assert stored['file_size'] == 2700 and stored['part_count'] == 3
+    assert await database.get_upload_session(upload_id) is None
+
+async def test_wrong_offset_is_a_conflict(uploads):
+    session = await uploads.create("owner", "a.bin", 2000, None)
+    await uploads.write(session['upload_id'], 0, body(b"x" * 300))
+    with pytest.raises(UploadConflict) as conflict:
+        await uploads.write(session['upload_id'], 100, body(b"y"))
+    assert conflict.value.offset == 300
+
+async def test_retried_put_after_last_byte_keeps_offset(uploads):
+    # The last part is sent and unstaged once complete; a client retrying its
+    # final PUT must not rewind the session to the start of that part
+    data = os.urandom(2700)
+    session = await uploads.create("owner", "a.bin", len(data), None)
+    upload_id = session['upload_id']
+    await uploads.write(upload_id, 0, body(data))
+    await sent(uploads)
+    assert await uploads.write(upload_id, 2700, body()) == 2700
+    assert await uploads.write(upload_id, 2700, body(b"")) == 2700
+    with pytest.raises(ValueError):
+        await uploads.write(upload_id, 2700, body(data[-10:]))
+    assert (await database.get_upload_session(upload_id))['received'] == 2700
+    row = await uploads.complete(upload_id, "share-token")
+    assert len(row["parts"]) == 3
+
+async def test_body_past_declared_size_is_rejected(uploads):
+    session = await uploads.create("owner", "a.bin", 1500, None)
+    with pytest.raises(ValueError):
+        await uploads.write(session['upload_id'], 0, body(b"x" * 1200, b"y" * 1200))
+    # What fit is kept
+    assert (await database.get_upload_session(session['upload_id']))['received'] == 1500
+
+async def test_lost_staging_restarts_current_part(uploads):
+    session = await uploads.create("owner", "a.bin", 2500, None)
+    upload_id = session['upload_id']
+    await uploads.write(upload_id, 0, body(b"x" * 1400))
+    await sent(uploads)
+    os.remove(uploads._part_path(upload_id, 1))
+    with pytest.raises(UploadConflict) as conflict:
+        await uploads.write(upload_id, 1400, body(b"y"))
+    assert conflict.value.offset == 1000
+    assert (await database.get_upload_session(upload_id))['received'] == 1000
+
+async def test_complete_before_last_byte_is_a_conflict(uploads):
+    session = await uploads.create("owner", "a.bin", 1500, None)
+    await uploads.write(session['upload_id'], 0, body(b"x" * 1499))
+    with pytest.raises(UploadConflict) as conflict:
+        await uploads.complete(session['upload_id'], "share-token")
+    assert conflict.value.offset == 1499
+
+async def test_single_part_upload_is_stored_as_a_regular_file(uploads):
+    session = await uploads.create("owner", "s.txt", 500, "text/plain")
+    await uploads.write(session['upload_id'], 0, body(b"z" * 500))
+    row = await uploads.complete(session['upload_id'], "share-token")
+    assert "parts" not in row and row["file_id"].startswith("doc")
+    assert (await database.get_file_by_id(row["file_id"]))['part_count'] == 0
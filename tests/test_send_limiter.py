@@ -0,0 +1,72 @@
+import time
+import pytest
+from types import SimpleNamespace
+from telegram.error import RetryAfter
+from tgstorage.bot import BotCluster, BotHealth, ClusterBusy, TokenBucket, RATE_FLOOR
+from tgstorage.config import settings
+
+pytestmark = pytest.mark.anyio
+
+class FakeBot:
+    def __init__(self, name, flood_limited=0):
+        self._custom_name = name
+        self._health = BotHealth()
+        self.flood_limited = flood_limited
+        self.sent = []
+
+    async def send_document(self, chat_id, document, filename):
+        if self.flood_limited:
+            self.flood_limited -= 1
+            raise RetryAfter(30)
+        self.sent.append(filename)
+        return SimpleNamespace(message_id=len(self.sent), document=SimpleNamespace(file_id=filename), video=None)
+
+@pytest.fixture
+def cluster():
+    cluster = BotCluster()
+    cluster.bots = [FakeBot("bot_a"), FakeBot("bot_b")]
+    return cluster
+
+def test_throttle_halves_the_rate_down_to_the_floor():
+    bucket = TokenBucket(10, 3)
+    bucket.throttle(time.monotonic())
+    assert bucket.rate == 5
+    for _ in range(10):
+        bucket.throttle(time.monotonic())
+    assert bucket.rate == 10 * RATE_FLOOR
+    bucket.recover()
+    assert bucket.rate > 10 * RATE_FLOOR
+
+def test_bucket_waits_out_a_retry_window():
+    bucket = TokenBucket(10, 3)
+    now = time.monotonic()
+    assert bucket.wait_time(now) == 0
+    bucket.throttle(now + 5)
+    assert bucket.wait_time(now) >= 5
+
+async def test_429_is_retried_on_another_bot(cluster):
+    limited, other = cluster.bots
+    limited.flood_limited = 1
+    cluster.current_idx = 0
+    message = await cluster.send_document(-1001, b"data", "a.txt")
+
+    assert message.document.file_id == "a.txt" and other.sent == ["a.txt"] and limited.sent == []
+    assert cluster.limiter.retried == 1
+    # The limited bot sits out its window, at a lower rate afterwards
+    assert limited._health.retry_until > time.monotonic() + 25
+    assert cluster.limiter.wait_time(limited, -1001, time.monotonic()) > 25
+    assert cluster.limiter._buckets["bot_a"].rate < settings.BOT_SEND_RATE
+
+async def test_429_on_every_attempt_is_cluster_busy(cluster, monkeypatch):
+    monkeypatch.setattr(settings, "SEND_MAX_ATTEMPTS", 2)
+    for bot in cluster.bots:
+        bot.flood_limited = 1
+    with pytest.raises(ClusterBusy) as busy:
+        await cluster.send_document(-1001, b"data", "a.txt")
+    assert busy.value.retry_after >= 1
+
+async def test_full_queue_is_rejected(cluster, monkeypatch):
+    monkeypatch.setattr(settings, "SEND_QUEUE_SIZE", 0)
+    with pytest.raises(ClusterBusy):
+        await cluster.send_document(-1001, b"data", "a.txt")
+    assert cluster.limiter.rejected == 1
@@ -0,0 +1,14 @@
+from fastapi.testclient import TestClient
+from tgstorage import api, database
+from tgstorage.config import settings
+
+async def _no_bots():
+    pass
+
+def test_schema_exists_before_first_request(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "pool", database.ConnectionPool(str(tmp_path / "storage.db"), 2))
+    monkeypatch.setattr(api, "start_bot", _no_bots)
+    with TestClient(api.api) as client:
+        response = client.get("/stats", headers={"X-API-Key": settings.ADMIN_API_KEY})
+    assert response.status_code == 200
+    assert response.json()["total_files"] == 0
@@ -0,0 +1,108 @@
+import datetime
+import pytest
+from tgstorage import database, rebuild_stats
+
+pytestmark = pytest.mark.anyio
+
+async def scanned():
+    async with database.pool.reader() as db:
+        async with db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(file_size), 0), COALESCE(SUM(view_count), 0) FROM files"
+        ) as cursor:
+            files, size, views = await cursor.fetchone()
+    return {"total_files": files, "total_size_bytes": size, "total_views": views}
+
+async def assert_counters_match():
+    assert await database.get_stats() == await scanned()
+    assert await database.verify_stats() == {}
+
+async def add(file_id, size, owner="k1", mime="text/plain", expiration_date=None):
+    await database.add_file(file_id, 1, f"{file_id}.txt", size, mime, expiration_date=expiration_date, owner_key=owner)
+
+async def test_counters_follow_inserts_and_deletes(db):
+    await assert_counters_match()
+    await add("a", 100)
+    await add("b", 250, owner="k2", mime="image/png")
+    await add("c", 50)
+    await assert_counters_match()
+    stats = await database.get_stats(owner_key="k1", breakdown=True)
+    assert stats["usage"] == {"files": 2, "size_bytes": 150, "views": 0}
+    assert stats["mime_types"]["image/png"]["files"] == 1
+
+    await database.delete_files_db(["a", "b"])
+    await assert_counters_match()
+    stats = await database.get_stats(owner_key="k2")
+    assert stats["total_files"] == 1 and stats["usage"]["files"] == 0
+
+async def test_counters_follow_expiry(db):
+    past = (datetime.datetime.now() - datetime.timedelta(hours=1)).isoformat()
+    future = (datetime.datetime.now() + datetime.timedelta(hours=1)).isoformat()
+    await add("old", 100, expiration_date=past)
+    await add("older", 200, expiration_date=past)
+    await add("fresh", 300, expiration_date=future)
+
+    expired = await database.get_expired_files()
+    assert sorted(row['file_id'] for row in expired) == ["old", "older"]
+    await database.delete_files_db([row['file_id'] for row in expired])
+    await assert_counters_match()
+    assert (await database.get_stats())["total_size_bytes"] == 300
+
+async def test_counters_follow_view_flushes(db):
+    await add("a", 100)
+    await add("b", 100, owner="k2")
+    counter = database.ViewCounter()
+    counter.record("a", 3)
+    counter.record("b")
+    await counter.flush()
+    await assert_counters_match()
+    assert (await database.get_stats(owner_key="k1"))["usage"]["views"] == 3
+
+async def test_rebuild_repairs_drift(db):
+    await add("a", 100)
+    await add("b", 200, owner="k2")
+    async with database.pool.writer() as conn:
+        await conn.execute("UPDATE stats_counters SET files = 7, bytes = 1 WHERE scope = 'global'")
+        await conn.execute("DELETE FROM stats_counters WHERE scope = 'owner:k2'")
+
+    drift = await database.verify_stats()
+    assert drift["global"] == {"stored": (7, 1, 0), "actual": (2, 300, 0)}
+    assert drift["owner:k2"] == {"stored": (0, 0, 0), "actual": (1, 200, 0)}
+
+    # Without --rebuild the command only reports
+    await rebuild_stats.check_stats()
+    assert await database.verify_stats() != {}
+    await rebuild_stats.check_stats(rebuild=True)
+    await assert_counters_match()
+
+async def views(file_id):
+    async with database.pool.reader() as db:
+        async with db.execute("SELECT view_count FROM files WHERE file_id = ?", (file_id,)) as cursor:
+            return (await cursor.fetchone())[0]
+
+async def test_views_flush_once_the_threshold_is_reached(db, monkeypatch):
+    monkeypatch.setattr(database.settings, "VIEW_FLUSH_THRESHOLD", 3)
+    await add("a", 100)
+    counter = database.ViewCounter()
+    counter.record("a")
+    counter.record("a")
+    assert counter._threshold_flush is None and await views("a") == 0
+    counter.record("a")
+    await counter._threshold_flush
+    assert await views("a") == 3 and counter.pending_total() == 0
+
+async def test_failed_flushes_keep_their_views(db, monkeypatch):
+    await add("a", 100)
+    counter = database.ViewCounter()
+    counter.record("a", 2)
+
+    def unavailable():
+        raise RuntimeError("database is locked")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(database.pool, "writer", unavailable)
+        await counter.flush()
+    assert counter.pending == {"a": 2} and await views("a") == 0
+    counter.record("a")
+    await counter.stop()
+    assert await views("a") == 3 and counter.pending_total() == 0
+    await assert_counters_match()
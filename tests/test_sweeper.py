@@ -0,0 +1,59 @@
+import datetime
+import pytest
+from telegram.error import RetryAfter
+from tgstorage import database
+from tgstorage.bot import BotCluster, BotHealth
+from tgstorage.config import settings
+from tgstorage.sweeper import ExpirySweeper
+
+pytestmark = pytest.mark.anyio
+
+PAST = (datetime.datetime.now() - datetime.timedelta(days=1)).isoformat()
+FUTURE = (datetime.datetime.now() + datetime.timedelta(days=1)).isoformat()
+
+async def test_sweep_deletes_expired_files_in_batches(db, channel, monkeypatch):
+    monkeypatch.setattr(settings, "SWEEP_BATCH_SIZE", 3)
+    for i in range(7):
+        await database.add_file(f"old{i}", 100 + i, f"old{i}.txt", 10, "text/plain", expiration_date=PAST)
+    await database.add_file("kept", 200, "kept.txt", 10, "text/plain", expiration_date=FUTURE)
+    # Expired, but its stored copy is still used by a live duplicate
+    await database.add_file("shared", 300, "s.txt", 10, "text/plain", expiration_date=PAST, content_hash="h")
+    await database.add_duplicate_file("live", "h", "s2.txt", "text/plain", expiration_date=FUTURE)
+
+    sweeper = ExpirySweeper()
+    assert await sweeper.sweep() == 8
+    assert sorted(channel.deleted) == [100, 101, 102, 103, 104, 105, 106]
+    assert await database.get_expired_files() == []
+    assert await database.get_file_by_id("kept") and await database.get_file_by_id("live")
+    stats = sweeper.stats()
+    assert stats["files_deleted"] == 8 and stats["messages_deleted"] == 7 and stats["last_error"] is None
+    assert await database.verify_stats() == {}
+
+async def test_sweep_with_nothing_expired(db, channel):
+    await database.add_file("kept", 200, "kept.txt", 10, "text/plain", expiration_date=FUTURE)
+    assert await ExpirySweeper().sweep() == 0
+    assert channel.deleted == []
+
+class DeletingBot:
+    def __init__(self, name, flood_limited=False):
+        self._custom_name = name
+        self._health = BotHealth()
+        self.flood_limited = flood_limited
+        self.calls = []
+
+    async def delete_messages(self, chat_id, message_ids):
+        if self.flood_limited:
+            raise RetryAfter(60)
+        self.calls.append(list(message_ids))
+
+    async def delete_message(self, chat_id, message_id):
+        await self.delete_messages(chat_id, [message_id])
+
+async def test_deletes_go_out_in_batches_of_100_around_429s():
+    cluster = BotCluster()
+    limited, working = DeletingBot("bot_a", flood_limited=True), DeletingBot("bot_b")
+    cluster.bots = [limited, working]
+    assert await cluster.delete_messages(-1001, list(range(250))) == 0
+    assert sorted(len(call) for call in working.calls) == [50, 100, 100]
+    assert sorted(i for call in working.calls for i in call) == list(range(250))
+    assert limited._health.retry_until > 0